@@ -0,0 +1,309 @@
+"""
+Answering-machine detection (AMD) on the first seconds after an outbound call is answered.
+
+create_sip_participant(wait_until_answered=True) returns as soon as the line
+picks up, whether a person or a voicemail box answered. With AMD_ENABLED=1 the
+agent listens to the callee before saying anything and classifies the answer
+from the shape of the audio, the way carrier AMD does: a person answers with a
+short "Estou?" and waits, a machine plays a long uninterrupted greeting.
+
+AnsweringMachineDetector works on 16 kHz mono PCM in 20 ms frames and decides:
+
+- machine: a greeting longer than `greeting_ms`, or more than `max_words` words
+- human:   speech followed by `after_greeting_silence_ms` of silence
+- unknown: no speech for `initial_silence_ms` (on outbound calls people often
+  pick up and wait for the caller to speak, so silence is not a machine), or
+  nothing conclusive within AMD_BUDGET_MS. Unknown is treated as a human, so
+  an undecided answer never costs a real conversation.
+
+On a machine the agent waits for the end of the greeting (the beep, or a long
+pause), plays the persona's pre-rendered "voicemail" message if it has one and
+hangs up, freeing the call slot and the realtime session.
+
+The thresholds are the usual carrier AMD defaults and have not been validated
+on recorded Portuguese answers yet. The detector is pure Python so it can be
+scored offline: with AMD_RECORD_DIR set the agent saves every answer it
+analysed as a WAV for labelling, and `python benchmark.py amd --fixtures
+amd_corpus` prints the confusion matrix over the labelled corpus (see
+amd_corpus/README.md). Its synthetic mode only checks the decision logic.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import time
+import wave
+from array import array
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Optional
+
+from metrics import Counter, Histogram
+
+if TYPE_CHECKING:
+    from livekit import rtc
+
+log = logging.getLogger("amd")
+
+# AMD delays the greeting for a person who answers: the agent waits for their
+# "Estou?" plus AMD_HUMAN_SILENCE_MS of silence (up to `initial_silence_ms` if
+# they stay silent, at most AMD_BUDGET_MS). Enable it when most numbers
+# dialled may reach voicemail.
+AMD_ENABLED = os.getenv("AMD_ENABLED", "0") == "1"
+AMD_BUDGET_MS = int(os.getenv("AMD_BUDGET_MS", "3000"))  # decide within this long after answer, else assume a human
+AMD_VOICEMAIL_WAIT_MS = int(os.getenv("AMD_VOICEMAIL_WAIT_MS", "20000"))  # longest machine greeting to wait out
+AMD_HUMAN_SILENCE_MS = int(os.getenv("AMD_HUMAN_SILENCE_MS", "600"))  # silence after a short answer that means a person
+AMD_RECORD_DIR = os.getenv("AMD_RECORD_DIR", "")  # save analysed answers here for labelling (see amd_corpus/README.md)
+AMD_SAMPLE_RATE = 16000
+FRAME_MS = 20
+
+AMD_RESULTS = Counter("agent_amd_results_total", "Answering-machine detection results and what the agent did", ["result", "action"])
+AMD_DECISION = Histogram(
+    "agent_amd_decision_seconds", "Answer until the AMD decision", ["result"],
+    buckets=(0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 4.0, 5.0),
+)
+
+@dataclass(frozen=True)
+class AMDSettings:
+    initial_silence_ms: int = 2500
+    greeting_ms: int = 1500
+    after_greeting_silence_ms: int = AMD_HUMAN_SILENCE_MS
+    min_word_ms: int = 100
+    between_words_silence_ms: int = 50
+    max_words: int = 3
+    silence_threshold: int = 256  # mean absolute sample value below which a frame is silence
+    budget_ms: int = AMD_BUDGET_MS
+
+@dataclass(frozen=True)
+class AMDResult:
+    result: str  # "human", "machine" or "unknown"
+    reason: str
+    decision_ms: float  # audio analysed before deciding
+
+    def as_dict(self) -> Dict[str, object]:
+        return asdict(self)
+
+def frame_level(samples: array) -> float:
+    """Mean absolute value of 16-bit samples"""
+    return sum(map(abs, samples)) / len(samples) if samples else 0.0
+
+def _samples(pcm: bytes) -> array:
+    samples = array("h")
+    samples.frombytes(pcm[:len(pcm) - len(pcm) % 2])
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples
+
+class _Framer:
+    """Cuts an arbitrary PCM byte stream into whole FRAME_MS frames"""
+
+    def __init__(self, sample_rate: int):
+        self.frame_bytes = sample_rate * FRAME_MS // 1000 * 2
+        self._pending = b""
+
+    def frames(self, pcm: bytes):
+        data = self._pending + pcm
+        usable = len(data) - len(data) % self.frame_bytes
+        self._pending = data[usable:]
+        for offset in range(0, usable, self.frame_bytes):
+            yield _samples(data[offset:offset + self.frame_bytes])
+
+class AnsweringMachineDetector:
+    """Frame-by-frame human/machine classifier; feed() returns the AMDResult once decided"""
+
+    def __init__(self, settings: AMDSettings = AMDSettings(), sample_rate: int = AMD_SAMPLE_RATE):
+        self.settings = settings
+        self.sample_rate = sample_rate
+        self._framer = _Framer(sample_rate)
+        self.elapsed_ms = 0
+        self._silence_ms = 0
+        self._speech_started_ms: Optional[int] = None
+        self._voiced_run_ms = 0
+        self._in_word = False
+        self._words = 0
+        self.result: Optional[AMDResult] = None
+
+    def _decide(self, result: str, reason: str) -> AMDResult:
+        self.result = AMDResult(result, reason, float(self.elapsed_ms))
+        return self.result
+
+    def feed(self, pcm: bytes) -> Optional[AMDResult]:
+        for samples in self._framer.frames(pcm):
+            if self.result is None:
+                self._frame(frame_level(samples) >= self.settings.silence_threshold)
+        return self.result
+
+    def _frame(self, voiced: bool):
+        s = self.settings
+        self.elapsed_ms += FRAME_MS
+        if voiced:
+            self._silence_ms = 0
+            if self._speech_started_ms is None:
+                self._speech_started_ms = self.elapsed_ms - FRAME_MS
+            self._voiced_run_ms += FRAME_MS
+            if not self._in_word and self._voiced_run_ms >= s.min_word_ms:
+                self._in_word = True
+                self._words += 1
+                if self._words > s.max_words:
+                    self._decide("machine", "max_words")
+                    return
+            if self.elapsed_ms - self._speech_started_ms >= s.greeting_ms:
+                self._decide("machine", "long_greeting")
+                return
+        else:
+            self._silence_ms += FRAME_MS
+            if self._silence_ms >= s.between_words_silence_ms:
+                self._in_word = False
+                self._voiced_run_ms = 0
+            if self._speech_started_ms is None and self._silence_ms >= s.initial_silence_ms:
+                self._decide("unknown", "initial_silence")
+                return
+            if self._words and self._silence_ms >= s.after_greeting_silence_ms:
+                self._decide("human", "after_greeting_silence")
+                return
+        if self.elapsed_ms >= s.budget_ms:
+            self._decide("unknown", "budget")
+
+    def finish(self) -> AMDResult:
+        """The decision so far, or "unknown" when the audio (or the time budget) ran out first"""
+        return self.result or self._decide("unknown", "budget")
+
+class GreetingEndDetector:
+    """
+    Tells when a voicemail greeting is over, so the message lands after the beep.
+
+    A beep is a loud steady tone: consecutive frames whose zero-crossing
+    frequency stays within 5% and between 400 and 2500 Hz. The greeting is over
+    when a beep stops or after `silence_ms` of silence following speech.
+    """
+
+    def __init__(self, sample_rate: int = AMD_SAMPLE_RATE, silence_threshold: int = 256,
+                 silence_ms: int = 1200, beep_ms: int = 160):
+        self.sample_rate = sample_rate
+        self.silence_threshold = silence_threshold
+        self.silence_ms = silence_ms
+        self.beep_ms = beep_ms
+        self._framer = _Framer(sample_rate)
+        self._silence = 0
+        self._heard = False
+        self._tone_ms = 0
+        self._tone_hz = 0.0
+        self.ended: Optional[str] = None  # "beep" or "silence"
+
+    def _frequency(self, samples: array) -> float:
+        crossings = sum(1 for a, b in zip(samples, samples[1:]) if (a < 0) != (b < 0))
+        return crossings / 2 / (len(samples) / self.sample_rate)
+
+    def feed(self, pcm: bytes) -> Optional[str]:
+        for samples in self._framer.frames(pcm):
+            if self.ended is None:
+                self._frame(samples)
+        return self.ended
+
+    def _frame(self, samples: array):
+        voiced = frame_level(samples) >= self.silence_threshold
+        hz = self._frequency(samples) if voiced else 0.0
+        steady = voiced and 400 <= hz <= 2500 and (not self._tone_ms or abs(hz - self._tone_hz) <= 0.05 * self._tone_hz)
+        if steady:
+            self._tone_hz = hz if not self._tone_ms else self._tone_hz
+            self._tone_ms += FRAME_MS
+        else:
+            if self._tone_ms >= self.beep_ms:
+                self.ended = "beep"
+                return
+            self._tone_ms = 0
+        if voiced:
+            self._heard = True
+            self._silence = 0
+        else:
+            self._silence += FRAME_MS
+            if self._heard and self._silence >= self.silence_ms:
+                self.ended = "silence"
+
+async def caller_audio(room: "rtc.Room", identity: str, sample_rate: int = AMD_SAMPLE_RATE) -> AsyncIterator[bytes]:
+    """16-bit mono PCM chunks of `identity`'s audio track, from the moment it is subscribed"""
+    from livekit import rtc
+
+    loop = asyncio.get_running_loop()
+    subscribed: asyncio.Future = loop.create_future()
+
+    def on_track_subscribed(track, publication, participant):
+        if participant.identity == identity and track.kind == rtc.TrackKind.KIND_AUDIO and not subscribed.done():
+            subscribed.set_result(track)
+
+    room.on("track_subscribed", on_track_subscribed)
+    try:
+        participant = room.remote_participants.get(identity)
+        for publication in (participant.track_publications.values() if participant else ()):
+            if publication.track is not None and publication.kind == rtc.TrackKind.KIND_AUDIO and not subscribed.done():
+                subscribed.set_result(publication.track)
+        track = await subscribed
+    finally:
+        room.off("track_subscribed", on_track_subscribed)
+
+    stream = rtc.AudioStream(track, sample_rate=sample_rate, num_channels=1)
+    try:
+        async for event in stream:
+            yield bytes(event.frame.data)
+    finally:
+        await stream.aclose()
+
+def save_answer(directory: str, pcm: bytes, result: AMDResult, sample_rate: int = AMD_SAMPLE_RATE) -> str:
+    """Write an analysed answer to DIR/unlabelled/<time>_<result>_<reason>.wav; returns the path"""
+    os.makedirs(os.path.join(directory, "unlabelled"), exist_ok=True)
+    path = os.path.join(
+        directory, "unlabelled", f"{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}_{result.result}_{result.reason}.wav"
+    )
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return path
+
+async def detect_answering_machine(
+    audio: AsyncIterator[bytes], settings: AMDSettings = AMDSettings(), sample_rate: int = AMD_SAMPLE_RATE,
+    record_dir: str = AMD_RECORD_DIR,
+) -> AMDResult:
+    """Classify the answer from `audio`, giving up (as "unknown") after settings.budget_ms of wall time"""
+    detector = AnsweringMachineDetector(settings, sample_rate)
+    recorded = bytearray()
+
+    async def listen():
+        async for pcm in audio:
+            if record_dir:
+                recorded.extend(pcm)
+            if detector.feed(pcm) is not None:
+                return
+
+    try:
+        await asyncio.wait_for(listen(), timeout=settings.budget_ms / 1000)
+    except asyncio.TimeoutError:
+        pass
+    result = detector.finish()
+    AMD_DECISION.observe(result.decision_ms / 1000, result=result.result)
+    if record_dir and recorded:
+        try:
+            await asyncio.to_thread(save_answer, record_dir, bytes(recorded), result, sample_rate)
+        except OSError as e:
+            log.warning(f"⚠️ Could not save AMD recording: {e}")
+    return result
+
+async def wait_for_greeting_end(
+    audio: AsyncIterator[bytes], max_wait_ms: int = AMD_VOICEMAIL_WAIT_MS, sample_rate: int = AMD_SAMPLE_RATE,
+) -> str:
+    """Wait out a machine's greeting; returns how it ended: beep, silence or timeout"""
+    detector = GreetingEndDetector(sample_rate)
+
+    async def listen():
+        async for pcm in audio:
+            if detector.feed(pcm) is not None:
+                return
+
+    try:
+        await asyncio.wait_for(listen(), timeout=max_wait_ms / 1000)
+    except asyncio.TimeoutError:
+        pass
+    return detector.ended or "timeout"
@@ -0,0 +1,1250 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the call-dispatch backend and the outbound agent hot paths.
+
+Each benchmark is a subcommand and runs fully offline:
+
+    python benchmark.py dispatch [--requests N] [--concurrency C] [--livekit-latency-ms MS]
+    python benchmark.py ratelimit [--ips N] [--rounds R]
+    python benchmark.py ratelimit-procs [--procs P] [--hits K] [--backend sqlite|postgres]
+    python benchmark.py campaign [--calls N] [--campaigns K] [--max-concurrent C] [--cps R]
+    python benchmark.py transcript [--turns N] [--repeat R]
+    python benchmark.py prompts [--jobs N] [--custom-agents K]
+    python benchmark.py startup [--module M ...] [--runs R] [--importtime]
+    python benchmark.py transfer [--transfers N] [--sip-latency-ms MS]
+    python benchmark.py warm-transfer [--transfers N] [--humans H] [--answer-rate P] [--ring-timeout S]
+    python benchmark.py amd [--fixtures DIR] [--calls N] [--write-fixtures DIR]
+    python benchmark.py soak [--jobs N] [--concurrency C] [--max-calls M] [--turns T]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from uuid import uuid4
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def _report(label: str, latencies_ms, elapsed: float, errors: int = 0):
+    print(
+        f"{label:<28} n={len(latencies_ms):<6} rps={len(latencies_ms) / elapsed:>9.1f}  "
+        f"p50={_percentile(latencies_ms, 50):>7.2f}ms  p95={_percentile(latencies_ms, 95):>7.2f}ms  "
+        f"p99={_percentile(latencies_ms, 99):>7.2f}ms  mean={statistics.fmean(latencies_ms) if latencies_ms else 0:>7.2f}ms"
+        + (f"  errors={errors}" if errors else "")
+    )
+
+class _LoopThread:
+    """Runs an asyncio loop in a daemon thread (used to host local servers)"""
+
+    def __init__(self, name: str):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name=name, daemon=True)
+        self.thread.start()
+
+    def run(self, coro, timeout: float | None = None):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+
+# ─────────────────────── Fake LiveKit server ───────────────────────
+# sip_call_to -> seconds until that human answers (None: never answers); read by the fake CreateSIPParticipant
+_FAKE_ANSWER_DELAYS = {}
+
+async def _start_fake_livekit(port: int, latency_ms: float):
+    """Minimal twirp server for the RoomService, AgentDispatchService and SIP calls the agent makes"""
+    from aiohttp import web
+    from livekit.protocol import agent_dispatch as proto_dispatch
+    from livekit.protocol import models as proto_models
+    from livekit.protocol import room as proto_room
+    from livekit.protocol import sip as proto_sip
+
+    delay = latency_ms / 1000
+
+    async def create_room(request: web.Request) -> web.Response:
+        req = proto_room.CreateRoomRequest.FromString(await request.read())
+        if delay:
+            await asyncio.sleep(delay)
+        room = proto_room.Room(sid=f"RM_{uuid4().hex[:12]}", name=req.name)
+        return web.Response(body=room.SerializeToString(), content_type="application/protobuf")
+
+    async def create_dispatch(request: web.Request) -> web.Response:
+        req = proto_dispatch.CreateAgentDispatchRequest.FromString(await request.read())
+        if delay:
+            await asyncio.sleep(delay)
+        dispatch = proto_dispatch.AgentDispatch(
+            id=f"AD_{uuid4().hex[:12]}", agent_name=req.agent_name, room=req.room, metadata=req.metadata
+        )
+        return web.Response(body=dispatch.SerializeToString(), content_type="application/protobuf")
+
+    async def list_participants(request: web.Request) -> web.Response:
+        proto_room.ListParticipantsRequest.FromString(await request.read())
+        if delay:
+            await asyncio.sleep(delay)
+        participants = proto_room.ListParticipantsResponse(participants=[
+            proto_models.ParticipantInfo(identity="agent-AJ_bench"),
+            proto_models.ParticipantInfo(identity="sip_351912345678"),
+        ])
+        return web.Response(body=participants.SerializeToString(), content_type="application/protobuf")
+
+    async def transfer_sip_participant(request: web.Request) -> web.Response:
+        proto_sip.TransferSIPParticipantRequest.FromString(await request.read())
+        if delay:
+            await asyncio.sleep(delay)
+        return web.Response(body=b"", content_type="application/protobuf")  # google.protobuf.Empty
+
+    async def create_sip_participant(request: web.Request) -> web.Response:
+        req = proto_sip.CreateSIPParticipantRequest.FromString(await request.read())
+        answer_after = _FAKE_ANSWER_DELAYS.get(req.sip_call_to, 0.0)
+        if answer_after is None:
+            await asyncio.sleep(3600)  # rings until the caller gives up
+        await asyncio.sleep(delay + answer_after)
+        info = proto_sip.SIPParticipantInfo(participant_identity=req.participant_identity, room_name=req.room_name)
+        return web.Response(body=info.SerializeToString(), content_type="application/protobuf")
+
+    async def remove_participant(request: web.Request) -> web.Response:
+        proto_room.RoomParticipantIdentity.FromString(await request.read())
+        if delay:
+            await asyncio.sleep(delay)
+        return web.Response(body=proto_room.RemoveParticipantResponse().SerializeToString(),
+                            content_type="application/protobuf")
+
+    async def update_participant(request: web.Request) -> web.Response:
+        req = proto_room.UpdateParticipantRequest.FromString(await request.read())
+        if delay:
+            await asyncio.sleep(delay)
+        participant = proto_models.ParticipantInfo(identity=req.identity, permission=req.permission)
+        return web.Response(body=participant.SerializeToString(), content_type="application/protobuf")
+
+    app = web.Application()
+    app.router.add_post("/twirp/livekit.RoomService/CreateRoom", create_room)
+    app.router.add_post("/twirp/livekit.AgentDispatchService/CreateDispatch", create_dispatch)
+    app.router.add_post("/twirp/livekit.RoomService/ListParticipants", list_participants)
+    app.router.add_post("/twirp/livekit.SIP/TransferSIPParticipant", transfer_sip_participant)
+    app.router.add_post("/twirp/livekit.SIP/CreateSIPParticipant", create_sip_participant)
+    app.router.add_post("/twirp/livekit.RoomService/RemoveParticipant", remove_participant)
+    app.router.add_post("/twirp/livekit.RoomService/UpdateParticipant", update_participant)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+def _configure_backend_env(livekit_port: int):
+    """Point website_backend at the fake LiveKit server; must run before it is imported"""
+    os.environ["LIVEKIT_URL"] = f"http://127.0.0.1:{livekit_port}"
+    os.environ.setdefault("LIVEKIT_API_KEY", "bench_key")
+    os.environ.setdefault("LIVEKIT_API_SECRET", "bench_secret_bench_secret_bench_secret")
+    os.environ["MAX_REQUESTS_PER_IP"] = "1000000000"
+    os.environ.pop("FLASK_ENV", None)
+
+async def _drive_http(url: str, total: int, concurrency: int):
+    """Fire `total` start_call requests with `concurrency` in flight; returns (latencies_ms, elapsed, errors)"""
+    import aiohttp
+
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+    body = {"phone_number": "+351912345678", "persona": "vendedor", "customer_name": "Bench"}
+
+    async def worker(session):
+        nonlocal errors
+        for i in counter:
+            headers = {"X-Forwarded-For": f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}"}
+            start = time.perf_counter()
+            async with session.post(url, json=body, headers=headers) as resp:
+                await resp.read()
+                if resp.status != 200:
+                    errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return latencies, elapsed, errors
+
+def bench_dispatch(args):
+    """Compare the Flask (thread-per-request) and async start_call paths against a fake LiveKit"""
+    livekit_port = _free_port()
+    _configure_backend_env(livekit_port)
+
+    livekit_loop = _LoopThread("fake-livekit")
+    livekit_runner = livekit_loop.run(_start_fake_livekit(livekit_port, args.livekit_latency_ms))
+
+    import logging
+    logging.disable(logging.WARNING)
+
+    from werkzeug.serving import make_server
+    import website_backend
+    import website_backend_async
+    from aiohttp import web
+
+    # Flask path
+    flask_port = _free_port()
+    flask_server = make_server("127.0.0.1", flask_port, website_backend.app, threaded=True)
+    threading.Thread(target=flask_server.serve_forever, daemon=True).start()
+
+    # Async path
+    async_port = _free_port()
+    async_loop = _LoopThread("async-backend")
+
+    async def start_async_backend():
+        runner = web.AppRunner(website_backend_async.create_app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", async_port).start()
+        return runner
+
+    async_runner = async_loop.run(start_async_backend())
+
+    print(
+        f"start_call: {args.requests} requests, concurrency={args.concurrency}, "
+        f"fake LiveKit latency={args.livekit_latency_ms}ms per RPC"
+    )
+    for label, port in (("flask (threaded)", flask_port), ("async (aiohttp)", async_port)):
+        url = f"http://127.0.0.1:{port}/api/start_call"
+        asyncio.run(_drive_http(url, min(args.concurrency, args.requests), args.concurrency))  # warm-up
+        latencies, elapsed, errors = asyncio.run(_drive_http(url, args.requests, args.concurrency))
+        _report(label, latencies, elapsed, errors)
+        if port == flask_port:
+            # Both paths share the module-level LiveKit clients; release the ones
+            # bound to the background loop before the async server creates its own
+            website_backend.run_async(website_backend.close_livekit_clients())
+
+    flask_server.shutdown()
+    async_loop.run(async_runner.cleanup())
+    async_loop.stop()
+    livekit_loop.run(livekit_runner.cleanup())
+    livekit_loop.stop()
+
+# ─────────────────────── Rate limiter ───────────────────────
+def _legacy_rate_limit(request_counts, ip_address, max_requests, window):
+    """The previous list-rebuilding check_rate_limit, kept for comparison"""
+    from datetime import datetime, timedelta
+
+    now = datetime.now()
+    cutoff = now - timedelta(seconds=window)
+    request_counts[ip_address] = [t for t in request_counts[ip_address] if t > cutoff]
+    if len(request_counts[ip_address]) >= max_requests:
+        return False
+    request_counts[ip_address].append(now)
+    return True
+
+def bench_ratelimit(args):
+    """ns per check and retained memory at N distinct IPs, legacy vs SlidingWindowRateLimiter"""
+    import tracemalloc
+    from collections import defaultdict
+    from rate_limit import SlidingWindowRateLimiter
+
+    max_requests, window = 3, 86400
+    ips = [f"{(i >> 24) & 255}.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}" for i in range(args.ips)]
+    total = args.ips * args.rounds
+    print(f"rate limit: {args.ips} distinct IPs x {args.rounds} rounds, {max_requests} req / {window}s")
+
+    def run(label, factory):
+        container, check = factory()
+        started = time.perf_counter()
+        for _ in range(args.rounds):
+            for ip in ips:
+                check(ip)
+        elapsed = time.perf_counter() - started
+
+        # Second, traced pass to measure retained memory without skewing the timing
+        tracemalloc.start()
+        container, check = factory()
+        for ip in ips:
+            check(ip)
+        retained, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{label:<28} {elapsed / total * 1e9:>8.0f} ns/check  keys={len(container):<8} retained={retained / 1e6:>7.1f} MB")
+
+    def legacy():
+        counts = defaultdict(list)
+        return counts, lambda ip: _legacy_rate_limit(counts, ip, max_requests, window)
+
+    def ring(max_keys):
+        def factory():
+            limiter = SlidingWindowRateLimiter(max_requests, window, max_keys=max_keys)
+            return limiter, limiter.hit
+        return factory
+
+    run("legacy (list rebuild)", legacy)
+    run("sliding window ring", ring(args.ips))
+    run("ring, LRU cap = N/10", ring(max(1, args.ips // 10)))
+
+def _rate_limit_worker(backend, path, keys, hits, start_event, results):
+    """Child process: hammer the shared store and report how many hits were accepted"""
+    os.environ["RATE_LIMIT_SQLITE_PATH"] = path
+    from rate_limit import create_rate_limit_store
+
+    store = create_rate_limit_store(3, 86400, backend=backend)
+    accepted = 0
+    start_event.wait()
+    started = time.perf_counter()
+    for i in range(hits):
+        if store.hit(keys[i % len(keys)]):
+            accepted += 1
+    results.put((accepted, time.perf_counter() - started))
+    store.close()
+
+def bench_ratelimit_procs(args):
+    """P processes share one store; the total accepted must equal keys x max_requests"""
+    import multiprocessing
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "rate_limits.db")
+        run_id = uuid4().hex[:8]
+        keys = [f"bench-{run_id}-{i}" for i in range(args.keys)]
+        ctx = multiprocessing.get_context("spawn")
+        start_event = ctx.Event()
+        results = ctx.Queue()
+        procs = [
+            ctx.Process(target=_rate_limit_worker, args=(args.backend, path, keys, args.hits, start_event, results))
+            for _ in range(args.procs)
+        ]
+        for proc in procs:
+            proc.start()
+        time.sleep(1.0)  # let every worker open its connection
+        start_event.set()
+        outcomes = [results.get(timeout=120) for _ in procs]
+        for proc in procs:
+            proc.join()
+
+    accepted = sum(a for a, _ in outcomes)
+    elapsed = max(t for _, t in outcomes)
+    expected = len(keys) * 3
+    total = args.procs * args.hits
+    print(
+        f"{args.backend}: {args.procs} processes x {args.hits} hits over {len(keys)} keys -> "
+        f"accepted={accepted} (expected {expected}), {total / elapsed:,.0f} hits/s"
+    )
+    if accepted != expected:
+        raise SystemExit(f"❌ quota violated: accepted {accepted}, expected {expected}")
+    print("✅ quota enforced across processes")
+
+# ─────────────────────── Campaign scheduler ───────────────────────
+def bench_campaign(args):
+    """Drive the scheduler against a simulated trunk: throughput, caps, pacing and fairness"""
+    import tempfile
+    from campaign_scheduler import CampaignQueue, CampaignScheduler, SimulatedTrunk
+
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = CampaignQueue(os.path.join(tmp, "campaigns.db"))
+        # Deliberately unequal campaigns: the first is as large as all others combined
+        others = args.campaigns - 1
+        sizes = [args.calls // 2] + [args.calls // (2 * others)] * others if others else [args.calls]
+        sizes[-1] += args.calls - sum(sizes)  # rounding remainder goes to the last campaign
+        for index, size in enumerate(sizes):
+            queue.enqueue(f"campaign-{index}", [
+                {"phone_number": f"+3519{index:02d}{n:06d}", "persona": "vendedor", "customer_name": "Bench"}
+                for n in range(size)
+            ])
+
+        trunk = SimulatedTrunk(ring_seconds=args.ring_seconds, talk_seconds=args.talk_seconds)
+        scheduler = CampaignScheduler(
+            queue,
+            dialer=trunk,
+            max_concurrent=args.max_concurrent,
+            calls_per_second=args.cps,
+            retry_base_seconds=args.retry_seconds,
+            poll_interval=0.05,
+        )
+        started = time.monotonic()
+        asyncio.run(scheduler.run(until_empty=True))
+        elapsed = time.monotonic() - started
+        stats = queue.stats()
+        queue.close()
+
+    gaps = [b - a for a, b in zip(trunk.dial_times, trunk.dial_times[1:])]
+    print(
+        f"campaign: {sum(sizes)} calls in {len(sizes)} campaigns, cap={args.max_concurrent}, "
+        f"pacing={args.cps} calls/s"
+    )
+    print(f"elapsed={elapsed:.1f}s  dials={len(trunk.dial_times)}  dial rate={len(trunk.dial_times) / elapsed:.2f}/s  final={stats}")
+    print(f"peak concurrent calls={trunk.peak_active} (cap {args.max_concurrent})  min dial gap={min(gaps) * 1000 if gaps else 0:.0f}ms")
+
+    # Fairness: share of each campaign's calls finished by the time half of all calls had finished
+    finished = sorted((t, c) for c, times in trunk.completed_by_campaign.items() for t in times)
+    if finished:
+        halfway = finished[len(finished) // 2][0]
+        shares = []
+        for index, size in enumerate(sizes):
+            done = sum(1 for t in trunk.completed_by_campaign.get(f"campaign-{index}", []) if t <= halfway)
+            shares.append(done / size)
+        jain = sum(shares) ** 2 / (len(shares) * sum(x * x for x in shares)) if any(shares) else 0
+        print("progress at halfway: " + "  ".join(f"c{i}={x:.0%}" for i, x in enumerate(shares)) + f"  Jain index={jain:.3f}")
+
+# ─────────────────────── Transcript formatting ───────────────────────
+def _synthetic_history(turns: int):
+    """session.history.to_dict()-shaped history alternating agent / user turns"""
+    import random
+
+    rng = random.Random(11)
+    words = "olá consulta marcar amanhã obrigado claro clínica horário posso ajudar sim não talvez".split()
+    items = []
+    for i in range(turns):
+        role = "assistant" if i % 2 == 0 else "user"
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(4, 30)))
+        content = [text] if i % 3 else [{"type": "text", "text": text}]
+        items.append({"id": f"item_{i}", "type": "message", "role": role, "content": content})
+    return {"items": items}
+
+def _legacy_transcript_and_analytics(history):
+    """The previous format-then-rescan path, kept for comparison"""
+    lines = ["=== CONVERSATION TRANSCRIPT ===", ""]
+    for item in history.get("items", []):
+        role = item.get("role", "unknown")
+        content = item.get("content", [])
+        if isinstance(content, str):
+            text = content
+        elif isinstance(content, list):
+            parts = []
+            for c in content:
+                if isinstance(c, dict):
+                    if c.get("type") == "text":
+                        parts.append(c.get("text", ""))
+                    elif "text" in c:
+                        parts.append(c["text"])
+                elif isinstance(c, str):
+                    parts.append(c)
+            text = " ".join(parts)
+        else:
+            text = str(content)
+        text = text.strip()
+        if text:
+            speaker = {"user": "👤 User", "assistant": "🤖 Assistant", "system": "⚙️ System"}.get(role, role)
+            lines.append(f"{speaker}: {text}")
+            lines.append("")
+    transcript = "\n".join(lines)
+    transcript_lines = [line for line in transcript.split("\n") if line.strip()]
+    agent = len([line for line in transcript_lines if line.startswith("Agente:")])
+    client = len([line for line in transcript_lines if line.startswith("Cliente:")])
+    error = "erro" in transcript.lower() or "falha" in transcript.lower()
+    return transcript, len(transcript_lines), agent, client, error
+
+def bench_transcript(args):
+    """Old format + rescans vs the single-pass TranscriptBuilder on synthetic histories"""
+    from transcripts import summarize_session_history
+
+    history = _synthetic_history(args.turns)
+    legacy_text = _legacy_transcript_and_analytics(history)[0]
+    summary = summarize_session_history(history)
+    assert summary.text == legacy_text, "single-pass transcript text differs from the legacy formatter"
+
+    print(f"transcript: {args.turns}-turn history, {args.repeat} repetitions")
+    for label, fn in (
+        ("legacy (format + rescans)", _legacy_transcript_and_analytics),
+        ("single pass", summarize_session_history),
+    ):
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            fn(history)
+            timings.append((time.perf_counter() - started) * 1000)
+        print(f"{label:<28} median={statistics.median(timings):>7.3f}ms  p95={_percentile(timings, 95):>7.3f}ms")
+    print(
+        f"counters: {summary.total_messages} messages ({summary.agent_messages} agent, "
+        f"{summary.client_messages} client), outcome={summary.call_outcome}"
+    )
+
+def _prompt_job_metadata(jobs: int, custom_agents: int):
+    """Job metadata mix: the three built-in personas plus K distinct custom agents"""
+    personas = ("clinica", "vendedor", "restaurante", "custom")
+    jobs_metadata = []
+    for i in range(jobs):
+        metadata = {"persona": personas[i % len(personas)], "customer_name": f"Cliente {i}", "website_request_id": str(uuid4())}
+        if metadata["persona"] == "custom":
+            agent = (i // len(personas)) % max(custom_agents, 1)
+            metadata["custom_agent_data"] = {
+                "agent_identity": f"Joana {agent}", "call_target": "a um cliente",
+                "reason": f"Confirmar a encomenda número {agent}", "accent": "norte",
+            }
+        jobs_metadata.append(metadata)
+    return jobs_metadata
+
+def _per_call_prompt_and_greeting(metadata):
+    """Baseline: compile the persona's templates for every job instead of once at worker start"""
+    from prompts.templates import (
+        CLINIC_BUSINESS_NAME, CLINIC_BUSINESS_SHORT_NAME, CUSTOM_PROMPT, PromptTemplate,
+        compile_clinic_persona, compile_common_persona, compile_sales_persona, normalize_custom_agent_data,
+    )
+
+    persona = metadata.get("persona", "default")
+    if persona == "custom":
+        identity, target, reason, accent = normalize_custom_agent_data(metadata["custom_agent_data"])
+        prompt = PromptTemplate(CUSTOM_PROMPT).render(
+            {"agent_identity": identity, "call_target": target, "reason": reason, "accent_desc": accent}
+        )
+        return prompt, "Olá!"
+    if persona == "clinica":
+        compiled = compile_clinic_persona(CLINIC_BUSINESS_NAME, CLINIC_BUSINESS_SHORT_NAME)
+    elif persona == "vendedor":
+        compiled = compile_sales_persona()
+    else:
+        compiled = compile_common_persona(persona)
+    return (
+        compiled.prompt.render(compiled.prompt_slots(metadata)),
+        compiled.greeting.render(compiled.greeting_slots(metadata)),
+    )
+
+async def _time_prompt_jobs(jobs, build):
+    timings = []
+    for metadata in jobs:
+        started = time.perf_counter()
+        result = build(metadata)
+        if asyncio.iscoroutine(result):
+            await result
+        timings.append((time.perf_counter() - started) * 1_000_000)
+    return timings
+
+def bench_prompts(args):
+    """Per-job prompt + greeting build time: compiling per call vs precompiled templates"""
+    started = time.perf_counter()
+    from config import PERSONA_REGISTRY
+    from prompts.templates import custom_prompt_cache_info
+    compile_ms = (time.perf_counter() - started) * 1000
+
+    def compiled(metadata):
+        return PERSONA_REGISTRY.system_prompt(metadata), PERSONA_REGISTRY.greeting(metadata)
+
+    jobs = _prompt_job_metadata(args.jobs, args.custom_agents)
+    for metadata in jobs[:8]:
+        assert _per_call_prompt_and_greeting(metadata) == compiled(metadata), \
+            f"registry prompt differs from the persona templates for persona {metadata['persona']}"
+
+    print(f"prompts: {args.jobs} jobs, {args.custom_agents} distinct custom agents, registry import+compile {compile_ms:.1f}ms")
+    for label, build in (("compile per call", _per_call_prompt_and_greeting), ("precompiled templates", compiled)):
+        timings = asyncio.run(_time_prompt_jobs(jobs, build))
+        print(f"{label:<28} median={statistics.median(timings):>8.1f}us  p95={_percentile(timings, 95):>8.1f}us")
+    info = custom_prompt_cache_info()
+    print(f"custom prompt cache: {info.hits} hits, {info.misses} misses, {info.currsize}/{info.maxsize} entries")
+
+# ─────────────────────── Startup ───────────────────────
+# Cold-start budgets (cumulative import time of the entry point, interpreter start excluded)
+STARTUP_BUDGETS_MS = {
+    "website_backend": 400.0,
+    "website_backend_async": 500.0,
+    "outbound_agent": 2000.0,
+}
+
+def _parse_importtime(stderr: str):
+    """-X importtime output -> [(depth, module, self_us, cumulative_us)]"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        if not self_us.strip().isdigit():
+            continue  # header line
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((depth, name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+def _import_once(module: str):
+    """(wall ms incl. interpreter start, importtime rows, error) for a fresh `import module`"""
+    env = dict(os.environ, TRACING_EXPORTER="none", LOG_FORMAT="text", METRICS_DIR="")
+    env.setdefault("LIVEKIT_URL", "http://127.0.0.1:7880")
+    env.setdefault("LIVEKIT_API_KEY", "bench_key")
+    env.setdefault("LIVEKIT_API_SECRET", "bench_secret_bench_secret_bench_secret")
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True,
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    rows = _parse_importtime(result.stderr)
+    error = None
+    if result.returncode != 0:
+        lines = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        error = lines[-1] if lines else f"exit code {result.returncode}"
+    return wall_ms, rows, error
+
+def bench_startup(args):
+    """Cold import time of each entry point against its budget; --importtime lists the heaviest packages"""
+    baseline = statistics.median(_import_once("sys")[0] for _ in range(args.runs))
+    print(f"startup: {args.runs} fresh interpreters per module, bare interpreter {baseline:.1f}ms")
+    over_budget, failed = [], []
+    for module in args.module:
+        runs = [_import_once(module) for _ in range(args.runs)]
+        error = runs[-1][2]
+        if error:
+            print(f"{module:<28} import failed: {error}")
+            failed.append(module)
+            continue
+        import_ms = [next(c for d, name, _, c in rows if d == 0 and name == module) / 1000 for _, rows, _ in runs]
+        median_ms = statistics.median(import_ms)
+        budget = STARTUP_BUDGETS_MS.get(module)
+        verdict = "" if budget is None else f"  budget={budget:.0f}ms {'OK' if median_ms <= budget else 'OVER'}"
+        print(
+            f"{module:<28} import median={median_ms:>7.1f}ms  min={min(import_ms):>7.1f}ms  "
+            f"wall median={statistics.median(w for w, _, _ in runs):>7.1f}ms{verdict}"
+        )
+        if budget is not None and median_ms > budget:
+            over_budget.append(module)
+        if args.importtime:
+            by_package = {}
+            for _, name, self_us, _ in runs[-1][1]:
+                package = name.split(".")[0]
+                by_package[package] = by_package.get(package, 0) + self_us
+            for package, self_us in sorted(by_package.items(), key=lambda item: -item[1])[:args.top]:
+                print(f"    {package:<32} {self_us / 1000:>8.1f}ms")
+    if over_budget or failed:
+        sys.exit(f"startup budget exceeded: {', '.join(over_budget) or '-'}; import failed: {', '.join(failed) or '-'}")
+
+# ─────────────────────── transfer_human ───────────────────────
+async def _legacy_transfer(job_metadata: str, room_name: str, transfer_phone_number: str):
+    """transfer_human before ToolContext: re-parse metadata, scan participants if needed, new client per call"""
+    from livekit import api
+    from livekit.protocol.sip import TransferSIPParticipantRequest
+
+    phone_number = None
+    if job_metadata:
+        try:
+            phone_number = json.loads(job_metadata).get("phone_number")
+        except json.JSONDecodeError:
+            pass
+    async with api.LiveKitAPI() as livekit_api:
+        if not phone_number:
+            participants = await livekit_api.room.list_participants(api.ListParticipantsRequest(room=room_name))
+            for p_info in participants.participants:
+                if p_info.identity.startswith("sip_"):
+                    phone_number = p_info.identity.replace("sip_", "")
+                    break
+        await livekit_api.sip.transfer_sip_participant(TransferSIPParticipantRequest(
+            participant_identity=f"sip_{phone_number.replace('tel:', '').replace('+', '')}",
+            room_name=room_name,
+            transfer_to=f"tel:{transfer_phone_number}",
+            play_dialtone=False,
+        ))
+
+def bench_transfer(args):
+    """transfer_human initiation latency against a fake SIP service: per-call client vs per-job ToolContext"""
+    livekit_port = _free_port()
+    _configure_backend_env(livekit_port)
+    livekit_loop = _LoopThread("fake-livekit")
+    livekit_runner = livekit_loop.run(_start_fake_livekit(livekit_port, args.sip_latency_ms))
+
+    import logging
+    logging.disable(logging.WARNING)
+    from livekit import api
+    from tools.common_tools import ToolContext, start_transfer
+
+    room_name = "call_vendedor_bench"
+    transfer_phone_number = "+351210000000"
+    with_phone = json.dumps({"phone_number": "+351912345678", "persona": "vendedor"})
+
+    async def timed(transfer):
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(args.transfers):
+            begin = time.perf_counter()
+            await transfer()
+            latencies.append((time.perf_counter() - begin) * 1000)
+        return latencies, time.perf_counter() - started
+
+    async def run():
+        results = {}
+        results["legacy (metadata)"] = await timed(lambda: _legacy_transfer(with_phone, room_name, transfer_phone_number))
+        results["legacy (participant scan)"] = await timed(lambda: _legacy_transfer("", room_name, transfer_phone_number))
+        livekit_api = api.LiveKitAPI()
+        tool_ctx = ToolContext.for_call(room_name, "+351912345678", livekit_api, transfer_phone_number)
+        await start_transfer(tool_ctx)  # the job's client is already connected when the model calls the tool
+        results["tool context"] = await timed(lambda: start_transfer(tool_ctx))
+        await livekit_api.aclose()
+        return results
+
+    print(f"transfer_human: {args.transfers} transfers per path, fake SIP latency={args.sip_latency_ms}ms per RPC")
+    for label, (latencies, elapsed) in asyncio.run(run()).items():
+        _report(label, latencies, elapsed)
+
+    livekit_loop.run(livekit_runner.cleanup())
+    livekit_loop.stop()
+
+# ─────────────────────── Warm transfer ───────────────────────
+class _BriefingSession:
+    """AgentSession stand-in for WarmTransfer: the briefing takes `brief_s` of speech"""
+
+    def __init__(self, brief_s: float):
+        self.brief_s = brief_s
+
+    def on(self, event, callback=None):
+        pass
+
+    def interrupt(self):
+        pass
+
+    async def generate_reply(self, instructions: str = ""):
+        await asyncio.sleep(self.brief_s)
+
+def bench_warm_transfer(args):
+    """Caller wait until a human is on the line: ringing the humans one after another vs all at once"""
+    import random
+
+    livekit_port = _free_port()
+    _configure_backend_env(livekit_port)
+    livekit_loop = _LoopThread("fake-livekit")
+    livekit_runner = livekit_loop.run(_start_fake_livekit(livekit_port, args.sip_latency_ms))
+
+    import logging
+    logging.disable(logging.WARNING)
+    from livekit import api
+    from tools.warm_transfer import WarmTransfer
+
+    rng = random.Random(args.seed)
+    scale = args.time_scale
+    numbers = [f"tel:+35121000{i:04d}" for i in range(args.humans)]
+    # Per transfer: each human answers after 3-20s of ringing with probability answer_rate (scaled down)
+    scenarios = [
+        {number: rng.uniform(3, 20) * scale if rng.random() < args.answer_rate else None for number in numbers}
+        for _ in range(args.transfers)
+    ]
+
+    async def run():
+        livekit_api = api.LiveKitAPI()
+        session = _BriefingSession(6 * scale)
+
+        def transfer(room_name, humans, ring_timeout):
+            return WarmTransfer(
+                livekit_api=livekit_api, room_name=room_name, caller_identity="sip_351912345678",
+                numbers=humans, sip_trunk_id="ST_bench", session=session, ring_timeout=ring_timeout,
+            )
+
+        async def watched_transfer(aware):
+            import call_watchdog
+
+            call_watchdog.CHECK_INTERVAL = scale / 4
+            ended = []
+
+            async def hang_up(reason):
+                ended.append(reason)
+
+            warm = transfer("call_bench_watchdog", numbers, args.ring_timeout * scale)
+            task = None
+            watchdog = call_watchdog.CallWatchdog(
+                session, hang_up, {}, silence_timeout=2 * scale, silence_prompts=0, max_duration=0,
+                suspended=(lambda: task is not None and not task.done()) if aware else (lambda: False),
+            )
+            watchdog.start()
+            task = asyncio.create_task(warm.run("benchmark"))  # rings 3s and briefs 6s, silence timeout 2s
+            await task
+            await watchdog.stop()
+            return f"outcome={warm.record['outcome']} hung up={ended or 'no'}"
+
+        async def serial(room_name):
+            for number in numbers:
+                if await transfer(room_name, [number], args.ring_timeout * scale).dial_first():
+                    return True
+            return False
+
+        async def parallel(room_name):
+            return await transfer(room_name, numbers, args.ring_timeout * scale).dial_first()
+
+        results = {}
+        for label, strategy in (("serial ring", serial), ("parallel ring", parallel)):
+            outcomes = []
+            started = time.perf_counter()
+            for index, scenario in enumerate(scenarios):  # one at a time: scenarios share _FAKE_ANSWER_DELAYS
+                _FAKE_ANSWER_DELAYS.update(scenario)
+                begin = time.perf_counter()
+                answered = bool(await strategy(f"call_bench_{index}"))
+                outcomes.append((answered, (time.perf_counter() - begin) * 1000 / scale))
+            elapsed = time.perf_counter() - started
+            results[label] = (
+                [ms for answered, ms in outcomes if answered], elapsed, sum(1 for answered, _ in outcomes if not answered)
+            )
+        # One full transfer: the first human answers, gets briefed and the caller comes off hold
+        _FAKE_ANSWER_DELAYS.update({number: 3 * scale for number in numbers})
+        warm = transfer("call_bench_full", numbers, args.ring_timeout * scale)
+        await warm.run("benchmark")
+        print(f"full warm transfer: {warm.record}")
+        # The call watchdog must not hang up on a caller who is on hold during a transfer
+        for aware in (True, False):
+            print(f"watchdog during transfer (transfer-aware={aware}): {await watched_transfer(aware)}")
+        await livekit_api.aclose()
+        return results
+
+    print(
+        f"warm transfer: {args.transfers} transfers, {args.humans} humans answering {args.answer_rate:.0%} of calls "
+        f"after 3-20s, ring timeout {args.ring_timeout:.0f}s (times in unscaled ms, time scale {scale})"
+    )
+    for label, (latencies, elapsed, unanswered) in asyncio.run(run()).items():
+        _report(label, latencies, elapsed, errors=unanswered)
+    print("errors = transfers no human answered")
+
+    livekit_loop.run(livekit_runner.cleanup())
+    livekit_loop.stop()
+
+# ─────────────────────── Answering-machine detection ───────────────────────
+def _synthetic_speech(rng, seconds: float, sample_rate: int, amplitude: float = 4000):
+    """Voiced-sounding samples: a wandering pitch with harmonics and noise, shaped into a syllable envelope"""
+    import math
+
+    count = int(seconds * sample_rate)
+    pitch = rng.uniform(110, 230)
+    phase = 0.0
+    out = []
+    for i in range(count):
+        pitch += rng.uniform(-0.4, 0.4)
+        phase += 2 * math.pi * pitch / sample_rate
+        envelope = math.sin(math.pi * i / count) ** 0.5
+        value = math.sin(phase) + 0.5 * math.sin(2 * phase) + 0.3 * math.sin(3 * phase) + rng.uniform(-0.3, 0.3)
+        out.append(int(amplitude * envelope * value / 2.1))
+    return out
+
+def _synthetic_answer(rng, kind: str, sample_rate: int):
+    """16-bit samples for one synthetic answer: a person, a person who waits silently, or a voicemail box"""
+    import math
+
+    def silence(seconds):
+        return [rng.randint(-40, 40) for _ in range(int(seconds * sample_rate))]
+
+    def words(count, min_s, max_s, gap_s):
+        samples = []
+        for _ in range(count):
+            samples += _synthetic_speech(rng, rng.uniform(min_s, max_s), sample_rate)
+            samples += silence(rng.uniform(*gap_s))
+        return samples
+
+    if kind == "human":  # "Estou?" / "Sim, diga?" then waits for the caller
+        return silence(rng.uniform(0.2, 1.2)) + words(rng.randint(1, 2), 0.2, 0.45, (0.1, 0.25)) + silence(2.5)
+    if kind == "silent_human":  # picks up and waits for the caller to speak first
+        return silence(rng.uniform(3.0, 4.0)) + words(1, 0.2, 0.45, (0.1, 0.25)) + silence(2.0)
+    # machine: "Olá, ligou para ... deixe a sua mensagem após o sinal" then the beep
+    greeting = silence(rng.uniform(0.3, 1.0)) + words(rng.randint(8, 20), 0.2, 0.5, (0.05, 0.2))
+    hz = rng.uniform(800, 1200)
+    beep = [int(6000 * math.sin(2 * math.pi * hz * i / sample_rate)) for i in range(int(0.4 * sample_rate))]
+    return greeting + silence(0.3) + beep + silence(2.0)
+
+def _load_amd_fixtures(directory: str):
+    """(label, name, pcm, sample_rate) for DIR/human/*.wav and DIR/machine/*.wav (16-bit mono WAV)"""
+    import glob
+    import wave
+
+    fixtures = []
+    for label in ("human", "machine"):
+        for path in sorted(glob.glob(os.path.join(directory, label, "*.wav"))):
+            with wave.open(path, "rb") as wav:
+                if wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+                    sys.exit(f"{path}: AMD fixtures must be 16-bit mono WAV")
+                fixtures.append((label, os.path.basename(path), wav.readframes(wav.getnframes()), wav.getframerate()))
+    return fixtures
+
+def bench_amd(args):
+    """Answering-machine detection accuracy and decision time over recorded (or synthetic) answers"""
+    import random
+    import wave
+    from array import array
+
+    from amd import FRAME_MS, AMDSettings, AnsweringMachineDetector, GreetingEndDetector
+
+    settings = AMDSettings(budget_ms=args.budget_ms)
+    if args.fixtures:
+        fixtures = _load_amd_fixtures(args.fixtures)
+        if not fixtures:
+            sys.exit(f"no fixtures under {args.fixtures}/human or {args.fixtures}/machine")
+    else:
+        rng = random.Random(args.seed)
+        fixtures = []
+        for index in range(args.calls):
+            kind = ("human", "machine", "silent_human")[index % 3]
+            samples = array("h", _synthetic_answer(rng, kind, 16000))
+            fixtures.append(("machine" if kind == "machine" else "human", f"{kind}_{index:03d}.wav", samples.tobytes(), 16000))
+        if args.write_fixtures:
+            for label, name, pcm, rate in fixtures:
+                os.makedirs(os.path.join(args.write_fixtures, label), exist_ok=True)
+                with wave.open(os.path.join(args.write_fixtures, label, name), "wb") as wav:
+                    wav.setnchannels(1)
+                    wav.setsampwidth(2)
+                    wav.setframerate(rate)
+                    wav.writeframes(pcm)
+            print(f"wrote {len(fixtures)} synthetic fixtures to {args.write_fixtures}")
+
+    confusion = {}
+    decisions = {"human": [], "machine": []}
+    cpu_per_frame_us = []
+    greeting_ends = {}
+    failures = []
+    for label, name, pcm, rate in fixtures:
+        detector = AnsweringMachineDetector(settings, rate)
+        chunk = rate * FRAME_MS // 1000 * 2
+        offset = 0
+        started = time.perf_counter()
+        while offset < len(pcm) and detector.feed(pcm[offset:offset + chunk]) is None:
+            offset += chunk
+        result = detector.finish()
+        cpu_per_frame_us.append((time.perf_counter() - started) * 1e6 / max(1, result.decision_ms / FRAME_MS))
+        offset += chunk
+        predicted = "machine" if result.result == "machine" else "human"  # unknown proceeds as a human
+        confusion[(label, result.result)] = confusion.get((label, result.result), 0) + 1
+        decisions[label].append(result.decision_ms)
+        if predicted != label:
+            failures.append(f"{label}/{name}: {result.result} ({result.reason}) at {result.decision_ms:.0f}ms")
+        if label == "machine" and predicted == "machine":
+            end = GreetingEndDetector(rate)
+            while offset < len(pcm) and end.feed(pcm[offset:offset + chunk]) is None:
+                offset += chunk
+            greeting_ends[end.ended or "timeout"] = greeting_ends.get(end.ended or "timeout", 0) + 1
+
+    total = len(fixtures)
+    correct = total - len(failures)
+    print(f"amd: {total} answers ({'fixtures ' + args.fixtures if args.fixtures else 'synthetic'}), budget {settings.budget_ms}ms")
+    if not args.fixtures:
+        print("  synthetic answers only check the decision logic; they do not measure real-world accuracy")
+    for label in ("human", "machine"):
+        row = "  ".join(f"{result}={confusion.get((label, result), 0)}" for result in ("human", "machine", "unknown"))
+        print(f"  {label:<8} → {row}")
+    for label, values in decisions.items():
+        if values:
+            print(f"  decision ({label}): p50={_percentile(values, 50):.0f}ms  p95={_percentile(values, 95):.0f}ms  max={max(values):.0f}ms")
+    machines = sum(confusion.get(("machine", result), 0) for result in ("human", "machine", "unknown"))
+    called_machine = sum(confusion.get((label, "machine"), 0) for label in ("human", "machine"))
+    if machines and called_machine:
+        # precision: humans hung up on are the expensive mistake; recall: voicemails the agent talked to
+        print(f"  machine precision={confusion.get(('machine', 'machine'), 0) / called_machine:.1%}  "
+              f"recall={confusion.get(('machine', 'machine'), 0) / machines:.1%}")
+    print(f"  {'accuracy' if args.fixtures else 'agreement with synthetic labels'}={correct / total:.1%}  cpu/frame p95={_percentile(cpu_per_frame_us, 95):.1f}µs  greeting end: {greeting_ends}")
+    for failure in failures[:args.show_failures]:
+        print(f"  ✗ {failure}")
+    worst = max((max(values) for values in decisions.values() if values), default=0)
+    if correct / total < args.min_accuracy or worst > settings.budget_ms:
+        sys.exit(f"amd below target: accuracy {correct / total:.1%} (min {args.min_accuracy:.0%}), slowest decision {worst:.0f}ms")
+
+# ─────────────────────── Worker soak ───────────────────────
+class _SoakSession:
+    """AgentSession stand-in: records turns and fires the events entrypoint listens to"""
+
+    def __init__(self, llm=None, **kwargs):
+        from types import SimpleNamespace
+
+        self._handlers = {}
+        self._items = []
+        self.audio_enabled = True
+        self.input = SimpleNamespace(set_audio_enabled=self._set_audio_enabled)
+
+    def _set_audio_enabled(self, enabled: bool):
+        self.audio_enabled = enabled
+
+    def on(self, event, callback=None):
+        def register(handler):
+            self._handlers.setdefault(event, []).append(handler)
+            return handler
+        return register(callback) if callback is not None else register
+
+    def _emit(self, event, **fields):
+        from types import SimpleNamespace
+
+        for handler in self._handlers.get(event, ()):
+            handler(SimpleNamespace(**fields))
+
+    def _add(self, role: str, text: str):
+        from types import SimpleNamespace
+
+        self._items.append({"type": "message", "role": role, "content": [text]})
+        self._emit("conversation_item_added", item=SimpleNamespace(role=role, text_content=text))
+
+    async def start(self, agent, room=None):
+        room.session = self  # lets the soak driver talk on this call
+        await asyncio.sleep(0)
+
+    def _check_listening(self):
+        if not self.audio_enabled:
+            raise RuntimeError("greeting spoken with the caller's audio still disabled")
+
+    async def say(self, text, audio=None, add_to_chat_ctx=True):
+        self._check_listening()
+        self._emit("agent_state_changed", new_state="speaking")
+        self._add("assistant", text)
+
+    async def generate_reply(self, instructions=None):
+        self._check_listening()
+        self._emit("agent_state_changed", new_state="speaking")
+        self._add("assistant", instructions or "")
+
+    async def aclose(self):
+        pass
+
+    def _realtime_metrics(self, input_audio: int, output_audio: int):
+        from types import SimpleNamespace
+
+        self._emit("metrics_collected", metrics=SimpleNamespace(
+            type="realtime_model_metrics",
+            input_tokens=input_audio + 400, output_tokens=output_audio + 20,
+            input_token_details=SimpleNamespace(
+                audio_tokens=input_audio, text_tokens=400, cached_tokens_details=SimpleNamespace(audio_tokens=0, text_tokens=256)
+            ),
+            output_token_details=SimpleNamespace(audio_tokens=output_audio, text_tokens=20),
+        ))
+
+    def converse(self, turns: int):
+        for turn in range(turns):
+            self._add("user", f"Pergunta {turn} do cliente sobre horários e preços?")
+            self._add("assistant", f"Resposta {turn}: temos disponibilidade amanhã às 10h e às 15h.")
+            self._realtime_metrics(input_audio=60 * (turn + 1), output_audio=80)
+
+    @property
+    def history(self):
+        from types import SimpleNamespace
+
+        return SimpleNamespace(to_dict=lambda: {"items": self._items})
+
+class _SoakJobContext:
+    """JobContext stand-in with a mocked LiveKit API: dialing answers after `ring_seconds`"""
+
+    def __init__(self, index: int, proc, ring_seconds: float):
+        from types import SimpleNamespace
+
+        self.job = SimpleNamespace(id=f"AJ_soak_{index}", metadata=json.dumps({
+            "phone_number": f"+351910{index:06d}",
+            "persona": ("clinica", "vendedor", "restaurante")[index % 3],
+            "customer_name": "Soak Test",
+            "website_request_id": str(uuid4()),
+        }))
+        self.room = SimpleNamespace(name=f"call_soak_{index}")
+        self.proc = proc
+        self.api = SimpleNamespace(
+            sip=SimpleNamespace(create_sip_participant=self._dial),
+            room=SimpleNamespace(update_room_metadata=self._update_room_metadata),
+        )
+        self._ring_seconds = ring_seconds
+        self._shutdown_callbacks = []
+
+    async def _dial(self, request):
+        await asyncio.sleep(self._ring_seconds)
+        session = getattr(self.room, "session", None)
+        if session is not None and session.audio_enabled:
+            raise RuntimeError("ringback reached the model: caller audio enabled before answer")
+
+    async def _update_room_metadata(self, request):
+        pass
+
+    async def connect(self):
+        pass
+
+    def add_shutdown_callback(self, callback):
+        self._shutdown_callbacks.append(callback)
+
+    async def shutdown(self, reason: str = ""):
+        """Run the shutdown callbacks the way JobContext does when the call ends"""
+        for callback in self._shutdown_callbacks:
+            result = callback()
+            if asyncio.iscoroutine(result):
+                await result
+
+def bench_soak(args):
+    """Drive N simulated jobs through outbound_agent.entrypoint (mocked LiveKit and realtime model)"""
+    import gc
+    import tempfile
+    import tracemalloc
+    from types import SimpleNamespace
+
+    import psutil
+
+    tmp = tempfile.mkdtemp(prefix="agent-soak-")
+    for name, value in (
+        ("TRANSCRIPT_OUTBOX_PATH", os.path.join(tmp, "outbox.db")),
+        ("TRANSCRIPT_JOURNAL_DIR", os.path.join(tmp, "journals")),
+        ("METRICS_DIR", os.path.join(tmp, "metrics")),
+        ("TRACING_EXPORTER", "jsonl"),
+        ("TRACING_JSONL_PATH", os.path.join(tmp, "traces.jsonl")),
+        ("GREETING_AUDIO_CACHE", "0"),
+        ("LOG_LEVEL", "WARNING"),
+    ):
+        os.environ[name] = value
+
+    import outbound_agent
+    from worker_load import WorkerLoad
+
+    outbound_agent.AgentSession = _SoakSession
+    outbound_agent.Agent = lambda **kwargs: SimpleNamespace(**kwargs)
+    outbound_agent.WorkerState.realtime_model = lambda self, persona, voice: SimpleNamespace(
+        model=persona.model, voice=voice
+    )
+
+    load = WorkerLoad(max_calls=args.max_calls, cpu_percent=lambda: 0.0, memory_percent=lambda: 0.0)
+    proc = SimpleNamespace(userdata={})
+    outbound_agent.prewarm(proc)
+    process = psutil.Process()
+    running = set()
+    stats = {"done": 0, "rejected": 0, "failed": 0, "peak_load": 0.0}
+    latencies_ms = []
+
+    async def job(index: int):
+        ctx = _SoakJobContext(index, proc, args.ring_ms / 1000)
+        # LiveKit only routes to the worker while its load is under the threshold;
+        # jobs that still race past a full worker are rejected and re-dispatched
+        while True:
+            if load.load() < load.threshold:
+                if load.admit(ctx.job.id) is None:
+                    break
+                stats["rejected"] += 1
+            await asyncio.sleep(args.ring_ms / 1000)
+        running.add(ctx.job.id)
+        load.update_running(running)
+        stats["peak_load"] = max(stats["peak_load"], load.load())
+        started = time.perf_counter()
+        try:
+            await outbound_agent.entrypoint(ctx)
+            latencies_ms.append((time.perf_counter() - started) * 1000)
+            ctx.room.session.converse(args.turns)
+            await asyncio.sleep(args.talk_ms / 1000)
+            await ctx.shutdown()
+            stats["done"] += 1
+        except Exception:
+            stats["failed"] += 1
+        finally:
+            running.discard(ctx.job.id)
+            load.update_running(running)
+
+    async def drive(start: int, count: int):
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def bounded(index: int):
+            async with semaphore:
+                await job(index)
+
+        await asyncio.gather(*(bounded(index) for index in range(start, start + count)))
+
+    def measure():
+        gc.collect()
+        return process.memory_info().rss, tracemalloc.get_traced_memory()[0]
+
+    tracemalloc.start()
+    warmup = min(args.warmup, args.jobs)
+    asyncio.run(drive(0, warmup))
+    rss_start, heap_start = measure()
+    stats.update(done=0, rejected=0, failed=0)
+    latencies_ms.clear()
+    started = time.perf_counter()
+    asyncio.run(drive(warmup, args.jobs - warmup))
+    elapsed = time.perf_counter() - started
+    rss_end, heap_end = measure()
+    tracemalloc.stop()
+
+    measured = max(1, args.jobs - warmup)
+    print(
+        f"soak: {args.jobs} jobs ({warmup} warm-up, not counted), concurrency={args.concurrency}, "
+        f"max calls={args.max_calls or 'unlimited'}, {args.turns} turns/call"
+    )
+    print(
+        f"done={stats['done']}  rejected={stats['rejected']}  failed={stats['failed']}  "
+        f"peak reported load={stats['peak_load']:.2f} (threshold {load.threshold})  elapsed={elapsed:.1f}s"
+    )
+    if latencies_ms:
+        _report("entrypoint (answer→greeting)", latencies_ms, elapsed)
+    print(
+        f"memory growth per call: rss={(rss_end - rss_start) / measured / 1024:+.1f}KiB  "
+        f"python heap={(heap_end - heap_start) / measured / 1024:+.2f}KiB  "
+        f"(rss {rss_start / 2**20:.1f}→{rss_end / 2**20:.1f}MiB)"
+    )
+    print(f"artifacts (outbox, journals, traces): {tmp}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+
+    p = sub.add_parser("dispatch", help="start_call throughput: Flask vs async backend")
+    p.add_argument("--requests", type=int, default=2000)
+    p.add_argument("--concurrency", type=int, default=64)
+    p.add_argument("--livekit-latency-ms", type=float, default=20.0)
+    p.set_defaults(func=bench_dispatch)
+
+    p = sub.add_parser("ratelimit", help="rate limiter cost and memory at many distinct IPs")
+    p.add_argument("--ips", type=int, default=100_000)
+    p.add_argument("--rounds", type=int, default=5)
+    p.set_defaults(func=bench_ratelimit)
+
+    p = sub.add_parser("ratelimit-procs", help="several processes sharing one rate-limit store")
+    p.add_argument("--procs", type=int, default=8)
+    p.add_argument("--hits", type=int, default=2000)
+    p.add_argument("--keys", type=int, default=50)
+    p.add_argument("--backend", choices=("sqlite", "postgres"), default="sqlite")
+    p.set_defaults(func=bench_ratelimit_procs)
+
+    p = sub.add_parser("campaign", help="campaign scheduler against a simulated SIP trunk")
+    p.add_argument("--calls", type=int, default=400)
+    p.add_argument("--campaigns", type=int, default=4)
+    p.add_argument("--max-concurrent", type=int, default=20)
+    p.add_argument("--cps", type=float, default=50.0)
+    p.add_argument("--ring-seconds", type=float, default=0.1)
+    p.add_argument("--talk-seconds", type=float, default=0.3)
+    p.add_argument("--retry-seconds", type=float, default=0.5)
+    p.set_defaults(func=bench_campaign)
+
+    p = sub.add_parser("transcript", help="single-pass transcript formatting on synthetic histories")
+    p.add_argument("--turns", type=int, default=1000)
+    p.add_argument("--repeat", type=int, default=200)
+    p.set_defaults(func=bench_transcript)
+
+    p = sub.add_parser("prompts", help="per-job prompt build time: compiling per call vs precompiled templates")
+    p.add_argument("--jobs", type=int, default=20_000)
+    p.add_argument("--custom-agents", type=int, default=50)
+    p.set_defaults(func=bench_prompts)
+
+    p = sub.add_parser("startup", help="cold-start import time of the entry points against their budgets")
+    p.add_argument("--module", action="append", help="module to import (repeatable; default: every entry point)")
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--importtime", action="store_true", help="break the import time down by top-level package")
+    p.add_argument("--top", type=int, default=15)
+    p.set_defaults(func=bench_startup)
+
+    p = sub.add_parser("transfer", help="transfer_human initiation latency against a fake SIP service")
+    p.add_argument("--transfers", type=int, default=200)
+    p.add_argument("--sip-latency-ms", type=float, default=5.0)
+    p.set_defaults(func=bench_transfer)
+
+    p = sub.add_parser("warm-transfer", help="time until a human answers: serial vs parallel ringing")
+    p.add_argument("--transfers", type=int, default=50)
+    p.add_argument("--humans", type=int, default=3)
+    p.add_argument("--answer-rate", type=float, default=0.6, help="chance each human picks up")
+    p.add_argument("--ring-timeout", type=float, default=30.0, help="seconds before giving up on a human")
+    p.add_argument("--time-scale", type=float, default=0.01, help="simulated seconds -> wall seconds")
+    p.add_argument("--sip-latency-ms", type=float, default=0.0)
+    p.add_argument("--seed", type=int, default=7)
+    p.set_defaults(func=bench_warm_transfer)
+
+    p = sub.add_parser("amd", help="answering-machine detection accuracy and latency on audio fixtures")
+    p.add_argument("--fixtures", help="labelled corpus with human/*.wav and machine/*.wav, e.g. amd_corpus "
+                                      "(default: synthetic answers)")
+    p.add_argument("--calls", type=int, default=90, help="synthetic answers to generate")
+    p.add_argument("--write-fixtures", help="also save the synthetic answers as WAV fixtures here")
+    p.add_argument("--budget-ms", type=int, default=3000)
+    p.add_argument("--min-accuracy", type=float, default=0.9)
+    p.add_argument("--show-failures", type=int, default=10)
+    p.add_argument("--seed", type=int, default=7)
+    p.set_defaults(func=bench_amd)
+
+    p = sub.add_parser("soak", help="N simulated jobs through the agent entrypoint: admission and memory per call")
+    p.add_argument("--jobs", type=int, default=500)
+    p.add_argument("--warmup", type=int, default=50)
+    p.add_argument("--concurrency", type=int, default=20)
+    p.add_argument("--max-calls", type=int, default=20, help="WorkerLoad call cap (0 = unlimited)")
+    p.add_argument("--turns", type=int, default=10)
+    p.add_argument("--ring-ms", type=float, default=5.0)
+    p.add_argument("--talk-ms", type=float, default=20.0)
+    p.set_defaults(func=bench_soak)
+
+    args = parser.parse_args()
+    if args.benchmark == "startup" and not args.module:
+        args.module = list(STARTUP_BUDGETS_MS)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Realtime token and trunk-minute accounting per call.
+
+The AgentSession emits a "metrics_collected" event with RealtimeModelMetrics
+after every model response, carrying that response's input/output tokens split
+into audio, text and cached tokens. CallUsage adds them up for the call, exports
+them per persona and model as they arrive, and when the call ends prices the
+totals (plus the trunk minutes since answer) for the webhook payload.
+
+Prices are USD per 1M tokens, matched on the longest model-name prefix. They
+can be overridden with REALTIME_PRICING, a JSON object of the same shape, e.g.
+
+    REALTIME_PRICING='{"gpt-4o-mini-realtime-preview": {"audio_input": 10, "audio_output": 20}}'
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Optional
+
+from metrics import Counter, Histogram
+
+log = logging.getLogger("call_usage")
+
+TRUNK_COST_PER_MINUTE = float(os.getenv("TRUNK_COST_PER_MINUTE", "0"))  # USD per connected minute
+
+REALTIME_PRICES: Dict[str, Dict[str, float]] = {
+    "gpt-4o-mini-realtime-preview": {
+        "text_input": 0.60, "text_cached": 0.30, "text_output": 2.40,
+        "audio_input": 10.00, "audio_cached": 0.30, "audio_output": 20.00,
+    },
+    "gpt-4o-realtime-preview": {
+        "text_input": 5.00, "text_cached": 2.50, "text_output": 20.00,
+        "audio_input": 40.00, "audio_cached": 2.50, "audio_output": 80.00,
+    },
+    "gpt-realtime": {
+        "text_input": 4.00, "text_cached": 0.40, "text_output": 16.00,
+        "audio_input": 32.00, "audio_cached": 0.40, "audio_output": 64.00,
+    },
+}
+
+def _load_price_overrides():
+    overrides = os.getenv("REALTIME_PRICING", "")
+    if not overrides:
+        return
+    try:
+        for model, prices in json.loads(overrides).items():
+            REALTIME_PRICES[model] = {**REALTIME_PRICES.get(model, {}), **{k: float(v) for k, v in prices.items()}}
+    except (ValueError, AttributeError) as e:
+        log.error(f"❌ Invalid REALTIME_PRICING, using built-in prices: {e}")
+
+_load_price_overrides()
+
+REALTIME_TOKENS = Counter(
+    "agent_realtime_tokens_total", "Realtime model tokens by persona, model, direction and modality",
+    ["persona", "model", "kind"],
+)
+CALL_COST = Counter("agent_call_cost_usd_total", "Estimated call cost in USD by persona and component", ["persona", "component"])
+CALL_COST_PER_CALL = Histogram(
+    "agent_call_cost_usd", "Estimated cost of one call in USD", ["persona"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+def prices_for(model: str) -> Optional[Dict[str, float]]:
+    """Price table for `model` (longest matching prefix), None for unknown models"""
+    matches = [name for name in REALTIME_PRICES if model.startswith(name)]
+    return REALTIME_PRICES[max(matches, key=len)] if matches else None
+
+@dataclass
+class TokenTotals:
+    responses: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    input_audio_tokens: int = 0
+    input_text_tokens: int = 0
+    cached_audio_tokens: int = 0
+    cached_text_tokens: int = 0
+    output_audio_tokens: int = 0
+    output_text_tokens: int = 0
+
+def _detail(details: Any, name: str) -> int:
+    return int(getattr(details, name, 0) or 0) if details is not None else 0
+
+class CallUsage:
+    """Token totals of one call's realtime session; add() is the session's metrics_collected handler"""
+
+    def __init__(self, persona: str, model: str, clock: Callable[[], float] = time.time):
+        self.persona = persona
+        self.model = model
+        self.totals = TokenTotals()
+        self._clock = clock
+        self.answered_at: Optional[float] = None  # wall time the callee picked up (trunk minutes start)
+
+    def add(self, ev: Any):
+        """Accumulate one metrics_collected event; metrics other than the realtime model's are ignored"""
+        m = getattr(ev, "metrics", ev)
+        if getattr(m, "type", None) != "realtime_model_metrics":
+            return
+        t = self.totals
+        input_details = getattr(m, "input_token_details", None)
+        output_details = getattr(m, "output_token_details", None)
+        cached_details = getattr(input_details, "cached_tokens_details", None)
+        delta = {
+            "input_audio": _detail(input_details, "audio_tokens"),
+            "input_text": _detail(input_details, "text_tokens"),
+            "cached_audio": _detail(cached_details, "audio_tokens"),
+            "cached_text": _detail(cached_details, "text_tokens"),
+            "output_audio": _detail(output_details, "audio_tokens"),
+            "output_text": _detail(output_details, "text_tokens"),
+        }
+        t.responses += 1
+        t.input_tokens += int(getattr(m, "input_tokens", 0) or 0)
+        t.output_tokens += int(getattr(m, "output_tokens", 0) or 0)
+        t.input_audio_tokens += delta["input_audio"]
+        t.input_text_tokens += delta["input_text"]
+        t.cached_audio_tokens += delta["cached_audio"]
+        t.cached_text_tokens += delta["cached_text"]
+        t.output_audio_tokens += delta["output_audio"]
+        t.output_text_tokens += delta["output_text"]
+        for kind, tokens in delta.items():
+            if tokens:
+                REALTIME_TOKENS.inc(tokens, persona=self.persona, model=self.model, kind=kind)
+
+    def token_cost(self) -> Optional[float]:
+        """USD for the tokens so far (cached input billed at the cached rate), None for unpriced models"""
+        prices = prices_for(self.model)
+        if prices is None:
+            return None
+        t = self.totals
+        billed = {
+            "audio_input": t.input_audio_tokens - t.cached_audio_tokens,
+            "audio_cached": t.cached_audio_tokens,
+            "audio_output": t.output_audio_tokens,
+            "text_input": t.input_text_tokens - t.cached_text_tokens,
+            "text_cached": t.cached_text_tokens,
+            "text_output": t.output_text_tokens,
+        }
+        return sum(tokens * prices.get(kind, 0.0) for kind, tokens in billed.items()) / 1_000_000
+
+    def finish(self) -> Dict[str, Any]:
+        """Price the call, export its cost and return the summary sent with the transcript"""
+        connected = max(0.0, self._clock() - self.answered_at) if self.answered_at else 0.0
+        trunk_minutes = connected / 60
+        token_cost = self.token_cost()
+        trunk_cost = trunk_minutes * TRUNK_COST_PER_MINUTE
+        total = (token_cost or 0.0) + trunk_cost
+        CALL_COST.inc(token_cost or 0.0, persona=self.persona, component="realtime")
+        CALL_COST.inc(trunk_cost, persona=self.persona, component="trunk")
+        CALL_COST_PER_CALL.observe(total, persona=self.persona)
+        log.info(
+            f"💶 Call usage: {self.totals.input_tokens} in / {self.totals.output_tokens} out tokens "
+            f"over {self.totals.responses} responses, {trunk_minutes:.1f} trunk min, ~${total:.4f}"
+        )
+        return {
+            "model": self.model,
+            "tokens": asdict(self.totals),
+            "trunk_minutes": round(trunk_minutes, 2),
+            "cost_usd": {
+                "realtime": round(token_cost, 6) if token_cost is not None else None,
+                "trunk": round(trunk_cost, 6),
+                "total": round(total, 6),
+            },
+        }
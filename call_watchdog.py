@@ -0,0 +1,151 @@
+"""
+Per-call watchdog: ends calls that went silent or ran past their maximum length.
+
+A caller who walks away (or a line that stays open after a cold transfer)
+otherwise keeps a realtime session and a SIP leg until LiveKit times the room
+out. CallWatchdog follows the session's user/agent state events and:
+
+- after CALL_SILENCE_TIMEOUT seconds with nobody speaking, asks whether the
+  caller is still there, up to CALL_SILENCE_PROMPTS times (reset whenever the
+  caller speaks); the next silence ends the call
+- at the persona's max_call_seconds (CALL_MAX_DURATION by default) ends the
+  call whatever is happening
+
+Both checks are suspended while `suspended()` is true, e.g. during a warm
+transfer, when the caller waits on hold or the agent is briefing a human.
+Ending a call means a short goodbye from the model (at most GOODBYE_TIMEOUT
+seconds) and then the hang-up callback. The reason is stored as
+call_metadata["end_reason"] and sent with the transcript.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from metrics import Counter
+
+log = logging.getLogger("call_watchdog")
+
+CALL_SILENCE_TIMEOUT = float(os.getenv("CALL_SILENCE_TIMEOUT", "20"))  # 0 disables the silence check
+CALL_SILENCE_PROMPTS = int(os.getenv("CALL_SILENCE_PROMPTS", "1"))  # "Ainda está aí?" before hanging up
+CALL_MAX_DURATION = float(os.getenv("CALL_MAX_DURATION", "900"))  # seconds; personas may override, 0 = no limit
+GOODBYE_TIMEOUT = 10.0
+CHECK_INTERVAL = 1.0
+
+CALLS_ENDED = Counter("agent_calls_ended_by_watchdog_total", "Calls the watchdog ended, by reason", ["reason"])
+
+PROMPT_INSTRUCTIONS = (
+    "O cliente está em silêncio há algum tempo. Pergunta-lhe apenas, de forma breve e simpática, "
+    "se ainda está em linha. Usa EXCLUSIVAMENTE Português de Portugal."
+)
+GOODBYE_INSTRUCTIONS = {
+    "silence_timeout": (
+        "O cliente não responde. Diz numa frase curta que vais terminar a chamada por não ter resposta, "
+        "agradece e despede-te. Usa EXCLUSIVAMENTE Português de Portugal."
+    ),
+    "max_duration": (
+        "A chamada atingiu o tempo máximo. Diz numa frase curta que tens de terminar a chamada, "
+        "agradece ao cliente e despede-te. Usa EXCLUSIVAMENTE Português de Portugal."
+    ),
+}
+
+class CallWatchdog:
+    """Silence and max-duration limits for one call; start() once the call is answered"""
+
+    def __init__(
+        self,
+        session: Any,  # AgentSession
+        hang_up: Callable[[str], Awaitable[None]],
+        record: Dict[str, Any],
+        silence_timeout: float = CALL_SILENCE_TIMEOUT,
+        silence_prompts: int = CALL_SILENCE_PROMPTS,
+        max_duration: float = CALL_MAX_DURATION,
+        suspended: Callable[[], bool] = lambda: False,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.session = session
+        self.hang_up = hang_up
+        self.record = record
+        self.silence_timeout = silence_timeout
+        self.silence_prompts = silence_prompts
+        self.max_duration = max_duration
+        self.suspended = suspended
+        self._clock = clock
+        self._started = clock()
+        self._last_activity = self._started
+        self._user_speaking = False
+        self._agent_busy = False
+        self._prompts_left = silence_prompts
+        self._task: Optional[asyncio.Task] = None
+        session.on("user_state_changed", self._on_user_state)
+        session.on("agent_state_changed", self._on_agent_state)
+
+    def _on_user_state(self, ev):
+        self._user_speaking = ev.new_state == "speaking"
+        if self._user_speaking:
+            self._prompts_left = self.silence_prompts  # the caller is back
+        self._last_activity = self._clock()
+
+    def _on_agent_state(self, ev):
+        self._agent_busy = ev.new_state in ("thinking", "speaking")
+        self._last_activity = self._clock()
+
+    def idle_seconds(self) -> float:
+        """Time since anyone last spoke (0 while someone is speaking or the model is replying)"""
+        if self._user_speaking or self._agent_busy:
+            return 0.0
+        return self._clock() - self._last_activity
+
+    def check(self) -> Optional[str]:
+        """What to do now: "max_duration", "silence_timeout", "silence_prompt" or None"""
+        if self.suspended():
+            self._last_activity = self._clock()  # the silence count restarts when the transfer is over
+            return None
+        if self.max_duration > 0 and self._clock() - self._started >= self.max_duration:
+            return "max_duration"
+        if self.silence_timeout > 0 and self.idle_seconds() >= self.silence_timeout:
+            return "silence_prompt" if self._prompts_left > 0 else "silence_timeout"
+        return None
+
+    async def _say(self, instructions: str):
+        try:
+            await asyncio.wait_for(self._reply(instructions), timeout=GOODBYE_TIMEOUT)
+        except Exception as e:
+            log.warning(f"⏲️ Watchdog reply did not finish: {type(e).__name__}")
+
+    async def _reply(self, instructions: str):
+        await self.session.generate_reply(instructions=instructions)
+
+    async def end(self, reason: str):
+        """Goodbye, then hang up"""
+        self.record["end_reason"] = reason
+        CALLS_ENDED.inc(reason=reason)
+        log.info(f"⏲️ Ending call: {reason} after {self._clock() - self._started:.0f}s")
+        await self._say(GOODBYE_INSTRUCTIONS[reason])
+        await self.hang_up(reason)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(CHECK_INTERVAL)
+            action = self.check()
+            if action == "silence_prompt":
+                self._prompts_left -= 1
+                log.info(f"⏲️ {self.idle_seconds():.0f}s of silence, checking the caller is still there")
+                self._last_activity = self._clock()
+                await self._say(PROMPT_INSTRUCTIONS)
+            elif action is not None:
+                await self.end(action)
+                return
+
+    def start(self):
+        self._started = self._last_activity = self._clock()
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Shutdown callback: the call ended some other way"""
+        if self._task is not None and not self._task.done() and self._task is not asyncio.current_task():
+            self._task.cancel()
@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+"""
+Campaign scheduler for outbound calls.
+
+Holds a persisted (SQLite) queue of call requests and dispatches them through
+website_backend.handle_livekit_call with:
+
+- a global cap on concurrent live calls
+- per-trunk calls-per-second pacing (token bucket)
+- Europe/Lisbon calling-hour windows
+- retries with exponential backoff for busy / no-answer outcomes
+
+Usage:
+    python campaign_scheduler.py enqueue CAMPAIGN calls.json
+    python campaign_scheduler.py run
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import datetime, time as dtime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+from structured_logging import configure_logging
+
+log = logging.getLogger("campaign_scheduler")
+
+PORTUGAL_TZ = ZoneInfo("Europe/Lisbon")
+
+CAMPAIGN_DB_PATH = os.getenv("CAMPAIGN_DB_PATH", "campaigns.db")
+CAMPAIGN_MAX_CONCURRENT_CALLS = int(os.getenv("CAMPAIGN_MAX_CONCURRENT_CALLS", "10"))
+TRUNK_CALLS_PER_SECOND = float(os.getenv("TRUNK_CALLS_PER_SECOND", "1.0"))
+CAMPAIGN_CALLING_HOURS = os.getenv("CAMPAIGN_CALLING_HOURS", "09:00-21:00")
+CAMPAIGN_CALLING_DAYS = os.getenv("CAMPAIGN_CALLING_DAYS", "0,1,2,3,4,5")  # Monday=0 .. Saturday=5
+CAMPAIGN_MAX_ATTEMPTS = int(os.getenv("CAMPAIGN_MAX_ATTEMPTS", "3"))
+CAMPAIGN_RETRY_BASE_SECONDS = float(os.getenv("CAMPAIGN_RETRY_BASE_SECONDS", "900"))
+CAMPAIGN_MAX_CALL_SECONDS = float(os.getenv("CAMPAIGN_MAX_CALL_SECONDS", "1800"))
+
+# Outcomes reported by dialers (the agent writes these into the room metadata)
+RETRYABLE_OUTCOMES = {"busy", "no_answer", "machine"}  # machine: answering machine, no message left
+
+@dataclass
+class CampaignCall:
+    id: int
+    campaign: str
+    phone_number: str
+    persona: str
+    customer_name: str
+    custom_agent_data: Optional[Dict[str, Any]]
+    attempts: int
+
+# ─────────────────────── Persisted queue ───────────────────────
+class CampaignQueue:
+    """SQLite-backed queue of campaign calls; safe to reopen after a crash"""
+
+    def __init__(self, path: str = CAMPAIGN_DB_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS campaign_calls ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " campaign TEXT NOT NULL,"
+            " phone_number TEXT NOT NULL,"
+            " persona TEXT NOT NULL,"
+            " customer_name TEXT NOT NULL,"
+            " custom_agent_data TEXT,"
+            " status TEXT NOT NULL DEFAULT 'queued',"  # queued | active | done | failed
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt_at REAL NOT NULL DEFAULT 0,"
+            " last_outcome TEXT,"
+            " room_name TEXT,"
+            " job_id TEXT,"
+            " updated_at REAL NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_campaign_calls_due ON campaign_calls (status, next_attempt_at)"
+        )
+
+    def enqueue(self, campaign: str, items: List[Dict[str, Any]]) -> int:
+        """Add already-validated call requests to a campaign; returns the number queued"""
+        now = time.time()
+        rows = [
+            (
+                campaign,
+                item["phone_number"],
+                item["persona"],
+                item.get("customer_name") or "Website User",
+                json.dumps(item["custom_agent_data"]) if item.get("custom_agent_data") else None,
+                now,
+            )
+            for item in items
+        ]
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO campaign_calls (campaign, phone_number, persona, customer_name, custom_agent_data, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        return len(rows)
+
+    def recover(self) -> int:
+        """Requeue calls left 'active' by a scheduler that died mid-call"""
+        cursor = self._conn.execute(
+            "UPDATE campaign_calls SET status = 'queued', updated_at = ? WHERE status = 'active'", (time.time(),)
+        )
+        return cursor.rowcount
+
+    def claim_due(self, limit: int, now: Optional[float] = None) -> List[CampaignCall]:
+        """
+        Claim up to `limit` due calls, taking them round-robin across campaigns
+        so one large campaign cannot starve the others.
+        """
+        if limit <= 0:
+            return []
+        now = time.time() if now is None else now
+        rows = self._conn.execute(
+            "SELECT id, campaign, phone_number, persona, customer_name, custom_agent_data, attempts FROM ("
+            "  SELECT *, ROW_NUMBER() OVER (PARTITION BY campaign ORDER BY next_attempt_at, id) AS rank"
+            "  FROM campaign_calls WHERE status = 'queued' AND next_attempt_at <= ?"
+            ") WHERE rank <= ? ORDER BY rank, next_attempt_at, id LIMIT ?",
+            (now, limit, limit),
+        ).fetchall()
+        if not rows:
+            return []
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "UPDATE campaign_calls SET status = 'active', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                [(now, row[0]) for row in rows],
+            )
+        return [
+            CampaignCall(
+                id=row[0],
+                campaign=row[1],
+                phone_number=row[2],
+                persona=row[3],
+                customer_name=row[4],
+                custom_agent_data=json.loads(row[5]) if row[5] else None,
+                attempts=row[6] + 1,
+            )
+            for row in rows
+        ]
+
+    def release(self, call_ids: List[int]):
+        """Return claimed calls that were never dialed to the queue, undoing their attempt"""
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "UPDATE campaign_calls SET status = 'queued', attempts = attempts - 1, updated_at = ? WHERE id = ?",
+                [(time.time(), call_id) for call_id in call_ids],
+            )
+
+    def record_dispatch(self, call_id: int, room_name: str, job_id: str):
+        self._conn.execute(
+            "UPDATE campaign_calls SET room_name = ?, job_id = ?, updated_at = ? WHERE id = ?",
+            (room_name, job_id, time.time(), call_id),
+        )
+
+    def finish(self, call_id: int, outcome: str, status: str = "done"):
+        self._conn.execute(
+            "UPDATE campaign_calls SET status = ?, last_outcome = ?, updated_at = ? WHERE id = ?",
+            (status, outcome, time.time(), call_id),
+        )
+
+    def retry_at(self, call_id: int, outcome: str, when: float):
+        self._conn.execute(
+            "UPDATE campaign_calls SET status = 'queued', last_outcome = ?, next_attempt_at = ?, updated_at = ? WHERE id = ?",
+            (outcome, when, time.time(), call_id),
+        )
+
+    def pending(self) -> int:
+        """Calls still queued or in progress"""
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM campaign_calls WHERE status IN ('queued', 'active')"
+        ).fetchone()[0]
+
+    def next_due_at(self) -> Optional[float]:
+        row = self._conn.execute(
+            "SELECT MIN(next_attempt_at) FROM campaign_calls WHERE status = 'queued'"
+        ).fetchone()
+        return row[0]
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._conn.execute("SELECT status, COUNT(*) FROM campaign_calls GROUP BY status").fetchall())
+
+    def close(self):
+        self._conn.close()
+
+# ─────────────────────── Pacing & calling hours ───────────────────────
+class TokenBucket:
+    """Calls-per-second pacing for one SIP trunk"""
+
+    def __init__(self, rate: float, burst: float = 1.0, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._clock = clock
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = self._clock()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+class CallingHours:
+    """Daily calling window in Europe/Lisbon time, e.g. 09:00-21:00 Monday to Saturday"""
+
+    def __init__(self, start: dtime, end: dtime, weekdays: set, tz: ZoneInfo = PORTUGAL_TZ):
+        self.start = start
+        self.end = end
+        self.weekdays = weekdays
+        self.tz = tz
+
+    @classmethod
+    def from_env(cls, hours: str = CAMPAIGN_CALLING_HOURS, days: str = CAMPAIGN_CALLING_DAYS) -> "CallingHours":
+        start, end = (dtime.fromisoformat(part.strip()) for part in hours.split("-"))
+        weekdays = {int(day) for day in days.split(",") if day.strip()}
+        return cls(start, end, weekdays)
+
+    def is_open(self, at: Optional[datetime] = None) -> bool:
+        local = (at or datetime.now(self.tz)).astimezone(self.tz)
+        return local.weekday() in self.weekdays and self.start <= local.time() < self.end
+
+    def next_open(self, at: Optional[datetime] = None) -> datetime:
+        """Start of the next calling window (or `at` itself if the window is open)"""
+        local = (at or datetime.now(self.tz)).astimezone(self.tz)
+        if self.is_open(local):
+            return local
+        for offset in range(8):
+            day = (local + timedelta(days=offset)).date()
+            if day.weekday() not in self.weekdays:
+                continue
+            candidate = datetime.combine(day, self.start, tzinfo=self.tz)
+            if candidate > local:
+                return candidate
+        raise ValueError("Calling hours have no open window")
+
+# ─────────────────────── Dialers ───────────────────────
+Dialer = Callable[[CampaignCall, "CampaignQueue"], Awaitable[str]]
+
+async def livekit_dialer(call: CampaignCall, queue: CampaignQueue) -> str:
+    """
+    Dispatch one call through website_backend.handle_livekit_call and hold the slot
+    until its room closes. The agent records the SIP outcome in the room metadata.
+    """
+    from livekit.protocol import room as proto_room
+    from website_backend import get_livekit_clients, handle_livekit_call
+
+    result = await handle_livekit_call(call.persona, call.phone_number, call.customer_name, call.custom_agent_data)
+    room_name = result["room_name"]
+    queue.record_dispatch(call.id, room_name, result["job_id"])
+
+    room_service, _ = await get_livekit_clients()
+    outcome = "completed"
+    deadline = time.monotonic() + CAMPAIGN_MAX_CALL_SECONDS
+    while time.monotonic() < deadline:
+        await asyncio.sleep(2.0)
+        rooms = await room_service.list_rooms(proto_room.ListRoomsRequest(names=[room_name]))
+        if not rooms.rooms:
+            return outcome
+        metadata = rooms.rooms[0].metadata
+        if metadata:
+            try:
+                outcome = json.loads(metadata).get("call_outcome", outcome)
+            except json.JSONDecodeError:
+                pass
+            if outcome in RETRYABLE_OUTCOMES or outcome == "failed":
+                return outcome
+    log.warning(f"Call {call.id} exceeded {CAMPAIGN_MAX_CALL_SECONDS}s, releasing its slot")
+    return "timeout"
+
+class SimulatedTrunk:
+    """
+    Offline stand-in for LiveKit + SIP: rings, then answers, reports busy or no-answer
+    with the configured probabilities. Records the peak concurrency and dial times.
+    """
+
+    def __init__(
+        self,
+        answer_rate: float = 0.7,
+        busy_rate: float = 0.15,
+        ring_seconds: float = 0.2,
+        talk_seconds: float = 1.0,
+        seed: int = 7,
+    ):
+        import random
+
+        self.answer_rate = answer_rate
+        self.busy_rate = busy_rate
+        self.ring_seconds = ring_seconds
+        self.talk_seconds = talk_seconds
+        self._random = random.Random(seed)
+        self.active = 0
+        self.peak_active = 0
+        self.dial_times: List[float] = []
+        self.completed_by_campaign: Dict[str, List[float]] = {}
+
+    async def __call__(self, call: CampaignCall, queue: CampaignQueue) -> str:
+        self.dial_times.append(time.monotonic())
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+        try:
+            roll = self._random.random()
+            await asyncio.sleep(self.ring_seconds * self._random.uniform(0.5, 1.5))
+            if roll < self.answer_rate:
+                await asyncio.sleep(self.talk_seconds * self._random.uniform(0.5, 1.5))
+                self.completed_by_campaign.setdefault(call.campaign, []).append(time.monotonic())
+                return "completed"
+            return "busy" if roll < self.answer_rate + self.busy_rate else "no_answer"
+        finally:
+            self.active -= 1
+
+# ─────────────────────── Scheduler ───────────────────────
+class CampaignScheduler:
+    """Drains a CampaignQueue within concurrency, pacing and calling-hour limits"""
+
+    def __init__(
+        self,
+        queue: CampaignQueue,
+        dialer: Dialer = livekit_dialer,
+        max_concurrent: int = CAMPAIGN_MAX_CONCURRENT_CALLS,
+        calls_per_second: float = TRUNK_CALLS_PER_SECOND,
+        calling_hours: Optional[CallingHours] = None,
+        max_attempts: int = CAMPAIGN_MAX_ATTEMPTS,
+        retry_base_seconds: float = CAMPAIGN_RETRY_BASE_SECONDS,
+        poll_interval: float = 1.0,
+    ):
+        self.queue = queue
+        self.dialer = dialer
+        self.max_concurrent = max_concurrent
+        self.pacer = TokenBucket(calls_per_second)
+        self.calling_hours = calling_hours
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.poll_interval = poll_interval
+        self._active: set = set()
+        self._stopping = False
+
+    def stop(self):
+        self._stopping = True
+
+    async def run(self, until_empty: bool = False):
+        """Dispatch until stopped (or until the queue drains when `until_empty` is set)"""
+        recovered = self.queue.recover()
+        if recovered:
+            log.info(f"♻️ Requeued {recovered} calls left active by a previous run")
+
+        while not self._stopping:
+            if self.calling_hours and not self.calling_hours.is_open():
+                reopen = self.calling_hours.next_open()
+                log.info(f"🌙 Outside calling hours, pausing until {reopen.isoformat()}")
+                await self._sleep_until(reopen.timestamp())
+                continue
+
+            free = self.max_concurrent - len(self._active)
+            calls = self.queue.claim_due(free) if free > 0 else []
+            for index, call in enumerate(calls):
+                await self.pacer.acquire()
+                if self.calling_hours and not self.calling_hours.is_open():
+                    # Hours closed while waiting for the trunk pacer: these wait for the next window
+                    self.queue.release([c.id for c in calls[index:]])
+                    log.info(f"🌙 Calling hours closed, requeued {len(calls) - index} undialed calls")
+                    break
+                task = asyncio.create_task(self._place(call))
+                self._active.add(task)
+                task.add_done_callback(self._active.discard)
+
+            if until_empty and not self._active and self.queue.pending() == 0:
+                break
+            if not calls:
+                await self._wait_for_capacity()
+
+        if self._active:
+            await asyncio.gather(*self._active, return_exceptions=True)
+
+    async def _wait_for_capacity(self):
+        """Sleep until a call finishes or the next retry becomes due"""
+        timeout = self.poll_interval
+        next_due = self.queue.next_due_at()
+        if next_due is not None and len(self._active) < self.max_concurrent:
+            timeout = min(timeout, max(0.0, next_due - time.time()))
+        if self._active:
+            await asyncio.wait(self._active, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        else:
+            await asyncio.sleep(timeout)
+
+    async def _sleep_until(self, timestamp: float):
+        while not self._stopping and time.time() < timestamp:
+            await asyncio.sleep(min(60.0, timestamp - time.time()))
+
+    async def _place(self, call: CampaignCall):
+        try:
+            outcome = await self.dialer(call, self.queue)
+        except Exception as e:
+            log.error(f"Campaign call {call.id} failed to dispatch: {type(e).__name__}: {e}")
+            outcome = "failed"
+
+        if outcome in RETRYABLE_OUTCOMES and call.attempts < self.max_attempts:
+            delay = self.retry_base_seconds * (2 ** (call.attempts - 1))
+            self.queue.retry_at(call.id, outcome, time.time() + delay)
+            log.info(f"🔁 Call {call.id} ({call.campaign}): {outcome}, retry {call.attempts + 1} in {delay:.0f}s")
+        else:
+            self.queue.finish(call.id, outcome, status="failed" if outcome == "failed" else "done")
+            log.info(f"✅ Call {call.id} ({call.campaign}) finished: {outcome}")
+
+# ─────────────────────── CLI ───────────────────────
+def _enqueue_command(args):
+    from website_backend import parse_batch_request
+
+    with open(args.file, encoding="utf-8") as f:
+        calls, errors = parse_batch_request(json.load(f))
+    for error in errors:
+        log.warning(f"Skipping item {error['index']}: {error['error']}")
+    queue = CampaignQueue(args.db)
+    count = queue.enqueue(args.campaign, [
+        {
+            "phone_number": phone_number,
+            "persona": persona,
+            "customer_name": customer_name,
+            "custom_agent_data": custom_agent_data,
+        }
+        for _, phone_number, persona, customer_name, custom_agent_data in calls
+    ])
+    log.info(f"📥 Queued {count} calls for campaign '{args.campaign}' ({len(errors)} rejected)")
+    queue.close()
+
+def _run_command(args):
+    queue = CampaignQueue(args.db)
+    scheduler = CampaignScheduler(queue, calling_hours=CallingHours.from_env())
+    log.info(
+        f"🚀 Campaign scheduler: max {scheduler.max_concurrent} concurrent calls, "
+        f"{TRUNK_CALLS_PER_SECOND} calls/s, hours {CAMPAIGN_CALLING_HOURS} (Europe/Lisbon)"
+    )
+    try:
+        asyncio.run(scheduler.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        queue.close()
+
+if __name__ == "__main__":
+    configure_logging("campaign-scheduler")
+    parser = argparse.ArgumentParser(description="Outbound campaign scheduler")
+    parser.add_argument("--db", default=CAMPAIGN_DB_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("enqueue", help="queue calls from a JSON list (same items as /api/start_calls)")
+    p.add_argument("campaign")
+    p.add_argument("file")
+    p.set_defaults(func=_enqueue_command)
+    p = sub.add_parser("run", help="dispatch queued calls")
+    p.set_defaults(func=_run_command)
+    args = parser.parse_args()
+    args.func(args)
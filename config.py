@@ -1,68 +1,327 @@
+"""
+Persona registry: one entry per persona with everything a call needs.
+
+Each PersonaConfig holds the realtime model, voice, temperature, tool names and
+the precompiled prompt/greeting templates (prompts.templates). The registry is
+built once per process; the agent looks personas up with plain dict hits.
+
+Built-in personas can be overridden, and new ones added, from a JSON file
+(PERSONA_REGISTRY_FILE). A watcher thread re-reads it when its mtime changes
+and swaps in the new table, so running workers pick up edits without a
+restart; a file that fails to load is logged and the previous table is kept.
+
+    {
+      "defaults": {"model": "gpt-4o-mini-realtime-preview-2024-12-17", "temperature": 0.8},
+      "personas": {
+        "restaurante": {"voice": "shimmer", "temperature": 0.7,
+                        "voicemail": "Olá, fala do Restaurante Central. Voltamos a ligar mais tarde."},
+        "imobiliaria": {
+          "aliases": ["real_estate"],
+          "voice": "coral",
+          "tools": ["transfer_human"],
+          "prompt": "És um agente imobiliário... O cliente chama-se {customer_name}. {base_instructions}",
+          "greeting": "Olá{greeting_name}! Fala da Imobiliária Central."
+        },
+        "dentista": {"template": "clinica"}
+      }
+    }
+
+File prompts may use {customer_name}, {greeting_name}, {current_time},
+{current_day}, {instructions}, {base_instructions} and, when the entry sets
+"business_name", {business_name}; literal braces are written as {{ }}.
+"template" reuses a built-in persona's prompt and greeting ("clinica" also
+takes "business_name"). "voicemail" is the message left when amd detects an
+answering machine (without one the agent just hangs up); "max_call_seconds"
+caps the call length (call_watchdog).
+
+Tenant personas ("<tenant_id>:<persona_key>") use the same entry format, stored
+per tenant in a database and read through persona_store.TenantPersonaCache.
+"""
+
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Callable, List, Dict, Any,Awaitable
+import asyncio
+import importlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from call_watchdog import CALL_MAX_DURATION
+from persona_store import MISS, TENANT_SEPARATOR, PersonaStore, TenantPersonaCache, create_persona_store, split_tenant_key
+from prompts.templates import (
+    BUSINESS_TEMPLATES,
+    CompiledPersona,
+    build_custom_agent_prompt,
+    builtin_personas,
+    compile_common_persona,
+    compile_text_persona,
+)
+
+log = logging.getLogger("persona_config")
+
+PERSONA_REGISTRY_FILE = os.getenv("PERSONA_REGISTRY_FILE", "")
+PERSONA_RELOAD_INTERVAL = float(os.getenv("PERSONA_RELOAD_INTERVAL", "5"))  # seconds between mtime checks
+MAX_DYNAMIC_PERSONAS = 64  # unknown persona keys compiled on first use with the common template
 
-# Updated imports using common_prompts instead of deleted restaurant_prompts
-from prompts.common_prompts import build_common_system_prompt as build_restaurant_prompt
-from prompts.common_prompts import build_common_greeting as build_restaurant_greeting
-from prompts.clinic_prompts import build_clinic_prompt, build_clinic_greeting
-from prompts.sales_prompts import build_sales_prompt, build_sales_greeting
-# For Phase 1, all personas will use only common tools
-from tools.common_tools import common_tools_list 
+DEFAULT_REALTIME_MODEL = "gpt-4o-mini-realtime-preview-2024-12-17"
+DEFAULT_VOICE = "coral"
+DEFAULT_TEMPERATURE = 0.9
+DEFAULT_TOOLS: Tuple[str, ...] = ()
 
-# Define types for clarity
-PromptBuilder = Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[str]] # Takes initial_data, metadata, returns prompt
-GreetingBuilder = Callable[[Dict[str, Any]], Awaitable[str]] # Takes metadata, returns greeting string
-ToolList = List[Callable[..., Awaitable[Dict[str, Any]]]]
+# Tool name -> (module, attribute); modules are imported when a call first needs the tool
+TOOL_MODULES: Dict[str, Tuple[str, str]] = {
+    "transfer_human": ("tools.common_tools", "transfer_human"),
+}
 
-@dataclass
+@dataclass(frozen=True)
 class PersonaConfig:
-    system_prompt_builder: PromptBuilder
-    greeting_builder: GreetingBuilder
-    voice: str
-    tools: ToolList
-    temperature: float
-    # prewarm_data_fn removed for Phase 1 simplicity
-    initial_data: Dict[str, Any] | None = None # Will be {} for Phase 1
-
-# Actual persona configurations - Simplified for Phase 1
-PERSONAE: Dict[str, PersonaConfig] = {
-    "restaurante": PersonaConfig(
-        system_prompt_builder=build_restaurant_prompt,
-        greeting_builder=build_restaurant_greeting,
-        voice="shimmer", 
-        tools=common_tools_list, # Simplified to common tools
-        temperature=0.7, 
-        initial_data={}
-    ),
-    "clinica": PersonaConfig(
-        system_prompt_builder=build_clinic_prompt,
-        greeting_builder=build_clinic_greeting,
-        voice="alloy", 
-        tools=common_tools_list, # Simplified to common tools
-        temperature=0.6,
-        initial_data={}
-    ),
-    "vendedor": PersonaConfig(
-        system_prompt_builder=build_sales_prompt,
-        greeting_builder=build_sales_greeting,
-        voice="nova", 
-        tools=common_tools_list, # Simplified to common tools
-        temperature=0.8,
-        initial_data={}
-    ),
+    key: str
+    prompts: CompiledPersona
+    model: str = DEFAULT_REALTIME_MODEL
+    voice: str = DEFAULT_VOICE
+    temperature: float = DEFAULT_TEMPERATURE
+    tools: Tuple[str, ...] = DEFAULT_TOOLS
+    voice_by_gender: bool = False  # pick the voice from the custom agent's name
+    voicemail: Optional[str] = None  # message left on answering machines, None to hang up
+    max_call_seconds: float = CALL_MAX_DURATION  # call_watchdog ends longer calls, 0 = no limit
+
+def resolve_tools(names: Tuple[str, ...]) -> List[Callable[..., Any]]:
+    """Tool callables for the names in a PersonaConfig"""
+    tools = []
+    for name in names:
+        module, attribute = TOOL_MODULES[name]
+        tools.append(getattr(importlib.import_module(module), attribute))
+    return tools
+
+# Voice/temperature/tools of the original persona table; other built-ins use the defaults.
+# The agent leaves transfer_human out while no TRANSFER_PHONE_NUMBER(S) is configured.
+BUILTIN_PERSONA_SETTINGS: Dict[str, Dict[str, Any]] = {
+    "restaurante": {"voice": "shimmer", "temperature": 0.7, "tools": ("transfer_human",)},
+    "clinica": {"voice": "alloy", "temperature": 0.6, "tools": ("transfer_human",)},
+    "dentist": {"voice": "alloy", "temperature": 0.6, "tools": ("transfer_human",)},
+    "vendedor": {"voice": "nova", "temperature": 0.8, "tools": ("transfer_human",)},
+    "sales": {"voice": "nova", "temperature": 0.8, "tools": ("transfer_human",)},
+    "custom": {"voice_by_gender": True},
 }
 
-async def get_persona_config(persona_key: str, metadata: Dict[str, Any] | None = None) -> PersonaConfig | None:
+def builtin_persona_configs() -> Dict[str, PersonaConfig]:
+    return {
+        key: PersonaConfig(key=key, prompts=compiled, **BUILTIN_PERSONA_SETTINGS.get(key, {}))
+        for key, compiled in builtin_personas().items()
+    }
+
+_FIELDS = ("model", "voice", "temperature", "tools", "voice_by_gender", "voicemail", "max_call_seconds")
+
+def _entry_fields(entry: Dict[str, Any], where: str) -> Dict[str, Any]:
+    fields = {name: entry[name] for name in _FIELDS if name in entry}
+    for name in ("temperature", "max_call_seconds"):
+        if name in fields:
+            fields[name] = float(fields[name])
+    if "tools" in fields:
+        fields["tools"] = tuple(fields["tools"])
+        unknown = set(fields["tools"]) - set(TOOL_MODULES)
+        if unknown:
+            raise ValueError(f"{where}: unknown tool(s) {', '.join(sorted(unknown))}")
+    return fields
+
+def persona_from_entry(
+    key: str, entry: Dict[str, Any], base: Dict[str, PersonaConfig], current: Optional[PersonaConfig] = None,
+    defaults: Optional[Dict[str, Any]] = None,
+) -> PersonaConfig:
+    """Build one persona from a registry file / tenant store entry; raises ValueError on bad entries"""
+    fields = _entry_fields(entry, key)
+    business_name = entry.get("business_name")
+    if "template" in entry:
+        template = entry["template"]
+        if template not in base:
+            raise ValueError(f"{key}: unknown template persona {template!r}")
+        if business_name and template not in BUSINESS_TEMPLATES:
+            raise ValueError(f"{key}: template {template!r} does not take a business_name")
+        prompts = BUSINESS_TEMPLATES[template](business_name) if business_name else base[template].prompts
+    elif "prompt" in entry or "greeting" in entry:
+        if "prompt" not in entry or "greeting" not in entry:
+            raise ValueError(f"{key}: 'prompt' and 'greeting' must be given together")
+        prompts = compile_text_persona(entry["prompt"], entry["greeting"], business_name)
+    elif current is not None:
+        prompts = current.prompts
+    else:
+        prompts = compile_common_persona(key.rpartition(TENANT_SEPARATOR)[2])
+    current = current or PersonaConfig(key=key, prompts=prompts, **(defaults or {}))
+    return replace(current, key=key, prompts=prompts, **fields)
+
+def load_persona_file(path: str, base: Dict[str, PersonaConfig]) -> Tuple[Dict[str, PersonaConfig], Dict[str, Any]]:
     """
-    Retrieves the configuration for a given persona.
-    For Phase 1, initial_data is always an empty dict, pre-warming is skipped.
+    Apply a persona registry file on top of `base`; raises ValueError/OSError on bad files.
+
+    Returns the persona table and the file's defaults (applied to tenant personas too).
     """
-    config = PERSONAE.get(persona_key)
-    if not config:
-        return None
-    # Ensure initial_data is set, even if empty, as prompt builders expect it.
-    if config.initial_data is None:
-        config.initial_data = {}
-    return config 
\ No newline at end of file
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    defaults = _entry_fields(data.get("defaults", {}), "defaults")
+    configs = {key: replace(config, **defaults) for key, config in base.items()}
+    for key, entry in data.get("personas", {}).items():
+        config = persona_from_entry(key, entry, base, configs.get(key), defaults)
+        for alias in (key, *entry.get("aliases", ())):
+            configs[alias] = replace(config, key=alias)
+    return configs, defaults
+
+class PersonaRegistry:
+    """Persona key -> PersonaConfig, optionally backed by a hot-reloaded JSON file"""
+
+    def __init__(
+        self,
+        path: str = PERSONA_REGISTRY_FILE,
+        max_dynamic_personas: int = MAX_DYNAMIC_PERSONAS,
+        tenant_store: Optional[PersonaStore] = None,
+    ):
+        self.path = path
+        self.max_dynamic_personas = max_dynamic_personas
+        self._builtin = builtin_persona_configs()
+        self._personas: Dict[str, PersonaConfig] = self._builtin
+        self._defaults: Dict[str, Any] = {}
+        self._tenant_store = tenant_store
+        self._tenants: Optional[TenantPersonaCache[PersonaConfig]] = None
+        self._tenants_resolved = False
+        self._dynamic: "OrderedDict[str, PersonaConfig]" = OrderedDict()
+        self._mtime: Optional[float] = None
+        self._watcher_pid: Optional[int] = None
+        self.reload()
+
+    def reload(self) -> bool:
+        """Re-read the registry file if it changed; returns True when a new table was swapped in"""
+        if not self.path:
+            return False
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            if self._mtime is not None:
+                log.warning(f"⚠️ Persona registry {self.path} disappeared, keeping the loaded personas")
+            return False
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            personas, defaults = load_persona_file(self.path, self._builtin)
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            log.error(f"❌ Persona registry {self.path} not loaded, keeping the previous one: {type(e).__name__}: {e}")
+            return False
+        self._personas = personas
+        self._defaults = defaults
+        self._dynamic = OrderedDict()
+        if self._tenants is not None:
+            self._tenants.invalidate()  # tenant personas inherit the file's defaults
+        log.info(f"🔄 Loaded {len(personas)} personas from {self.path}")
+        return True
+
+    def start_watching(self, interval: float = PERSONA_RELOAD_INTERVAL):
+        """
+        Poll the registry file and apply tenant persona invalidations from daemon
+        threads (once per process; forked children start their own)
+        """
+        tenants = self.tenants
+        if tenants is not None:
+            tenants.start_listening()
+        if not self.path or self._watcher_pid == os.getpid():
+            return
+        self._watcher_pid = os.getpid()
+
+        def watch():
+            while True:
+                time.sleep(interval)
+                self.reload()
+
+        threading.Thread(target=watch, name="persona-registry-watcher", daemon=True).start()
+
+    @property
+    def tenants(self) -> Optional[TenantPersonaCache[PersonaConfig]]:
+        """Cache over the tenant persona store (created on first use, after .env.local is loaded)"""
+        if not self._tenants_resolved:
+            self._tenants_resolved = True
+            self._tenant_store = self._tenant_store or create_persona_store()
+            if self._tenant_store is not None:
+                self._tenants = TenantPersonaCache(self._tenant_store, self._build_tenant_persona)
+        return self._tenants
+
+    def _build_tenant_persona(self, tenant_id: str, persona_key: str, definition: Dict[str, Any]) -> PersonaConfig:
+        key = f"{tenant_id}{TENANT_SEPARATOR}{persona_key}"
+        return persona_from_entry(key, definition, self._builtin, defaults=self._defaults)
+
+    def keys(self) -> List[str]:
+        return list(self._personas)
+
+    def _tenant_persona(self, persona_key: str) -> Optional[PersonaConfig]:
+        tenant_key = split_tenant_key(persona_key)
+        if tenant_key is None:
+            return None
+        tenants = self.tenants
+        return tenants.get(*tenant_key) if tenants is not None else None
+
+    def exists(self, persona_key: str) -> bool:
+        """Whether `persona_key` is a registry persona or a stored tenant persona"""
+        return persona_key in self._personas or self._tenant_persona(persona_key) is not None
+
+    def is_builtin(self, persona_key: str) -> bool:
+        """Whether `persona_key` is a code-defined persona (not one added by the registry file or a tenant)"""
+        return persona_key in self._builtin
+
+    def needs_store_lookup(self, persona_key: str) -> bool:
+        """Whether exists()/get() would have to query the tenant store (a tenant key that is not cached)"""
+        tenant_key = split_tenant_key(persona_key)
+        if persona_key in self._personas or tenant_key is None or self.tenants is None:
+            return False
+        return self.tenants.peek(*tenant_key) is MISS
+
+    async def aexists(self, persona_key: str) -> bool:
+        """exists() for async callers: a tenant store round-trip runs off the event loop"""
+        if self.needs_store_lookup(persona_key):
+            return await asyncio.to_thread(self.exists, persona_key)
+        return self.exists(persona_key)
+
+    async def aget(self, persona_key: str) -> PersonaConfig:
+        """get() for async callers: a tenant store round-trip runs off the event loop"""
+        tenant_key = split_tenant_key(persona_key)
+        if persona_key in self._personas or tenant_key is None or self.tenants is None:
+            return self.get(persona_key)
+        cached = self.tenants.peek(*tenant_key)
+        if cached is not MISS and cached is not None:
+            return cached
+        return await asyncio.to_thread(self.get, persona_key)
+
+    def get(self, persona_key: str) -> PersonaConfig:
+        persona = self._personas.get(persona_key) or self._tenant_persona(persona_key)
+        if persona is not None:
+            return persona
+        # Unknown keys get the common template with the "default" persona's settings
+        persona = self._dynamic.get(persona_key)
+        if persona is None:
+            persona = replace(
+                self._personas["default"], key=persona_key,
+                prompts=compile_common_persona(persona_key.rpartition(TENANT_SEPARATOR)[2]),
+            )
+            self._dynamic[persona_key] = persona
+            if len(self._dynamic) > self.max_dynamic_personas:
+                self._dynamic.popitem(last=False)
+        else:
+            self._dynamic.move_to_end(persona_key)
+        return persona
+
+    def system_prompt(self, metadata: Dict[str, Any]) -> str:
+        persona_key = metadata.get("persona", "assistente virtual")
+        if persona_key == "custom":
+            custom_agent_data = metadata.get("custom_agent_data")
+            if custom_agent_data:
+                return build_custom_agent_prompt(custom_agent_data)
+            log.warning("Custom persona requested but no custom_agent_data provided, falling back to default")
+        prompts = self.get(persona_key).prompts
+        return prompts.prompt.render(prompts.prompt_slots(metadata))
+
+    def greeting(self, metadata: Dict[str, Any]) -> str:
+        prompts = self.get(metadata.get("persona", "assistente virtual")).prompts
+        return prompts.greeting.render(prompts.greeting_slots(metadata))
+
+PERSONA_REGISTRY = PersonaRegistry()
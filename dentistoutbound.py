@@ -12,10 +12,8 @@ from livekit.agents import Agent, AgentSession, JobContext, cli, WorkerOptions,
 from livekit.plugins import openai
 from openai.types.beta.realtime.session import TurnDetection
 
-# Import prompt builders
-from prompts.common_prompts import build_common_system_prompt, build_common_greeting
-from prompts.clinic_prompts import build_clinic_prompt, build_clinic_greeting
-from prompts.sales_prompts import build_sales_prompt, build_sales_greeting
+# Import prompt templates
+from prompts.templates import CompiledPersona, compile_clinic_persona, compile_common_persona, compile_sales_persona
 
 # ─────────────────────── Configuração inicial ───────────────────────
 load_dotenv(".env.local")
@@ -40,39 +38,39 @@ if not LIVEKIT_API_KEY or not LIVEKIT_API_SECRET:
     log.warning("LIVEKIT_API_KEY ou LIVEKIT_API_SECRET não definidos no arquivo .env.local")
 
 # ─────────────────────── System Prompt Builders ───────────────────────
+_CLINIC_PERSONA = compile_clinic_persona("Clínica Dentária Sorriso", "Clínica Sorriso")
+_SALES_PERSONA = compile_sales_persona()
+_COMMON_PERSONAS: Dict[str, CompiledPersona] = {}
+
+def _compiled_persona(metadata: Dict[str, Any]) -> CompiledPersona:
+    persona = metadata.get("persona", "assistente virtual")
+    if persona == "clinica" or persona == "dentist":
+        # For dental clinic use case
+        return _CLINIC_PERSONA
+    if persona == "vendedor" or persona == "sales":
+        # For sales representative use case
+        return _SALES_PERSONA
+    # Default to common prompt for any other persona
+    compiled = _COMMON_PERSONAS.get(persona)
+    if compiled is None:
+        compiled = _COMMON_PERSONAS[persona] = compile_common_persona(persona)
+    return compiled
+
 async def get_system_prompt(metadata: Dict[str, Any]) -> str:
     """
     Select and build the appropriate system prompt based on persona in metadata
     """
-    persona = metadata.get("persona", "default")
-    log.info(f"Building system prompt for persona: {persona}")
-    
-    # Initial data that might be needed for certain personas (could be expanded)
-    initial_data = {}
-    
-    if persona == "clinica" or persona == "dentist":
-        # For dental clinic use case
-        return await build_clinic_prompt(initial_data, metadata)
-    elif persona == "vendedor" or persona == "sales":
-        # For sales representative use case
-        return await build_sales_prompt(initial_data, metadata)
-    else:
-        # Default to common prompt for any other persona
-        return await build_common_system_prompt(initial_data, metadata)
+    log.info(f"Building system prompt for persona: {metadata.get('persona', 'default')}")
+    compiled = _compiled_persona(metadata)
+    return compiled.prompt.render(compiled.prompt_slots(metadata))
 
 async def get_initial_greeting(metadata: Dict[str, Any]) -> str:
     """
     Select and build the appropriate greeting based on persona in metadata
     """
-    persona = metadata.get("persona", "default")
-    log.info(f"Building greeting for persona: {persona}")
-    
-    if persona == "clinica" or persona == "dentist":
-        return await build_clinic_greeting(metadata)
-    elif persona == "vendedor" or persona == "sales":
-        return await build_sales_greeting(metadata)
-    else:
-        return await build_common_greeting(metadata)
+    log.info(f"Building greeting for persona: {metadata.get('persona', 'default')}")
+    compiled = _compiled_persona(metadata)
+    return compiled.greeting.render(compiled.greeting_slots(metadata))
 
 # ─────────────────────── Entrypoint LiveKit ───────────────────────
 async def entrypoint(ctx: JobContext):
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+On-disk cache of pre-synthesized greeting audio.
+
+The opening line of a call is almost always the same text for a given persona
+and voice, so instead of asking the realtime model to speak it on every call the
+agent plays cached PCM audio straight into the room and lets the model take over
+from the callee's reply. Only name-independent text is cached (the greeting
+rendered without a customer name, and voicemail messages): a greeting that
+mentions the caller's name is spoken by the model, since one cache entry per
+name would almost never be hit again. Entries are keyed on persona, voice and
+text. The cache is capped in bytes and evicts least-recently-played files
+first, using file mtimes so every job process on the host shares one cache.
+
+A missed nameless greeting is rendered once per process in the background with
+the OpenAI speech API; all of them can be rendered ahead of time with:
+
+    python greeting_audio.py warm
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, Set, Tuple
+
+log = logging.getLogger("greeting_audio")
+
+GREETING_AUDIO_CACHE = os.getenv("GREETING_AUDIO_CACHE", "1") == "1"
+GREETING_AUDIO_DIR = os.getenv("GREETING_AUDIO_DIR", "greeting_audio")
+GREETING_AUDIO_MAX_MB = float(os.getenv("GREETING_AUDIO_MAX_MB", "64"))
+GREETING_TTS_MODEL = os.getenv("GREETING_TTS_MODEL", "gpt-4o-mini-tts")
+GREETING_TTS_INSTRUCTIONS = (
+    "Fala em Português de Portugal (nunca do Brasil), com sotaque de Lisboa, "
+    "num tom cordial e natural de uma chamada telefónica."
+)
+
+# OpenAI speech API "pcm" output: 24 kHz, mono, signed 16-bit little-endian
+SAMPLE_RATE = 24000
+NUM_CHANNELS = 1
+FRAME_MS = 20
+
+class GreetingAudioCache:
+    """Byte-capped directory of raw PCM greetings, LRU by file mtime"""
+
+    def __init__(self, directory: str = GREETING_AUDIO_DIR, max_bytes: int = int(GREETING_AUDIO_MAX_MB * 1024 * 1024)):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._client = None
+        self._rendering: Dict[str, asyncio.Task] = {}
+        self._render_attempted: Set[str] = set()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(persona: str, voice: str, text: str) -> str:
+        digest = hashlib.sha256(f"{GREETING_TTS_MODEL}\0{persona}\0{voice}\0{text}".encode()).hexdigest()
+        return digest[:32]
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pcm")
+
+    def get(self, persona: str, voice: str, text: str) -> Optional[bytes]:
+        """Cached PCM for this greeting, or None; a hit marks the entry as recently used"""
+        path = self._path(self.key(persona, voice, text))
+        try:
+            with open(path, "rb") as f:
+                pcm = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return pcm or None
+
+    def put(self, persona: str, voice: str, text: str, pcm: bytes):
+        path = self._path(self.key(persona, voice, text))
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(pcm)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self) -> int:
+        """Delete least-recently-used entries until the cache fits max_bytes; returns files removed"""
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(".pcm"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+    async def synthesize(self, voice: str, text: str) -> bytes:
+        if self._client is None:
+            from openai import AsyncOpenAI
+
+            self._client = AsyncOpenAI()
+        response = await self._client.audio.speech.create(
+            model=GREETING_TTS_MODEL,
+            voice=voice,
+            input=text,
+            instructions=GREETING_TTS_INSTRUCTIONS,
+            response_format="pcm",
+        )
+        return response.content
+
+    async def render(self, persona: str, voice: str, text: str) -> Optional[bytes]:
+        """Synthesize and store a greeting (one render per key at a time); returns the PCM or None on error"""
+        key = self.key(persona, voice, text)
+        task = self._rendering.get(key)
+        if task is None:
+            task = self._rendering[key] = asyncio.create_task(self.synthesize(voice, text))
+        try:
+            pcm = await task
+        except Exception as e:
+            log.warning(f"⚠️ Greeting audio render failed ({persona}/{voice}): {type(e).__name__}: {e}")
+            return None
+        finally:
+            self._rendering.pop(key, None)
+        self.put(persona, voice, text, pcm)
+        self._render_attempted.discard(key)  # rendered: a later eviction may render it again
+        log.info(f"🔊 Cached greeting audio for {persona}/{voice} ({len(pcm) // 1024} KiB)")
+        return pcm
+
+    def should_render(self, persona: str, voice: str, text: str) -> bool:
+        """True the first time a missed greeting is seen in this process (failed renders are not retried per call)"""
+        key = self.key(persona, voice, text)
+        if key in self._render_attempted:
+            return False
+        self._render_attempted.add(key)
+        return True
+
+def nameless_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """The call's metadata as if the caller had left no name (what the cached greeting is rendered from)"""
+    return {**metadata, "customer_name": "Website User"}
+
+def pcm_frames(pcm: bytes, frame_ms: int = FRAME_MS) -> AsyncIterator:
+    """Yield the PCM as rtc.AudioFrame chunks for session.say(audio=...)"""
+    from livekit import rtc
+
+    samples_per_frame = SAMPLE_RATE * frame_ms // 1000
+    frame_bytes = samples_per_frame * 2 * NUM_CHANNELS
+    pcm = pcm[:len(pcm) - len(pcm) % (2 * NUM_CHANNELS)]  # whole samples only
+
+    async def frames():
+        for offset in range(0, len(pcm), frame_bytes):
+            chunk = pcm[offset:offset + frame_bytes]
+            yield rtc.AudioFrame(
+                data=chunk,
+                sample_rate=SAMPLE_RATE,
+                num_channels=NUM_CHANNELS,
+                samples_per_channel=len(chunk) // (2 * NUM_CHANNELS),
+            )
+
+    return frames()
+
+def nameless_greetings() -> Iterable[Tuple[str, str, str]]:
+    """(persona, voice, text) for every built-in persona's greeting when the caller left no name, and its voicemail"""
+    from config import PERSONA_REGISTRY
+
+    for persona in ("restaurante", "clinica_dentaria", "vendedor", "clinica", "dentist", "sales", "custom"):
+        config = PERSONA_REGISTRY.get(persona)
+        # The custom persona's voice follows the agent's gender
+        voices = ("coral", "echo") if config.voice_by_gender else (config.voice,)
+        text = PERSONA_REGISTRY.greeting(nameless_metadata({"persona": persona}))
+        for voice in voices:
+            yield persona, voice, text
+            if config.voicemail:
+                yield persona, voice, config.voicemail
+
+async def _warm(cache: GreetingAudioCache, force: bool):
+    rendered = 0
+    for persona, voice, text in nameless_greetings():
+        if not force and cache.get(persona, voice, text) is not None:
+            continue
+        if await cache.render(persona, voice, text) is not None:
+            rendered += 1
+    log.info(f"🔊 Rendered {rendered} greeting(s) into {cache.directory}")
+
+if __name__ == "__main__":
+    import argparse
+
+    from structured_logging import configure_logging
+
+    configure_logging("greeting-audio")
+    parser = argparse.ArgumentParser(description="Manage the greeting audio cache")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("warm", help="render the nameless greeting of every built-in persona")
+    p.add_argument("--dir", default=GREETING_AUDIO_DIR)
+    p.add_argument("--force", action="store_true", help="re-render greetings that are already cached")
+    p = sub.add_parser("evict", help="trim the cache to GREETING_AUDIO_MAX_MB")
+    p.add_argument("--dir", default=GREETING_AUDIO_DIR)
+    args = parser.parse_args()
+
+    cache = GreetingAudioCache(args.dir)
+    if args.command == "warm":
+        asyncio.run(_warm(cache, args.force))
+    else:
+        log.info(f"🧹 Removed {cache.evict()} greeting(s)")
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Prometheus-style metrics with per-thread accumulators.
+
+Recording a sample only touches a dict owned by the calling thread (no locks on
+the request path); a scrape sums the per-thread shards. Shards of threads that
+have exited (e.g. Flask's thread-per-request server) are folded into a base
+total and dropped whenever a new thread's shard is created (and at scrape time),
+so the shard list stays as long as the number of live threads even if nothing
+ever scrapes. Counters, gauges and
+histograms are exposed in the Prometheus text format.
+
+Multi-process services (gunicorn workers, LiveKit job processes) additionally
+write a snapshot of their metrics to METRICS_DIR every METRICS_FLUSH_INTERVAL
+seconds. The backend's /metrics and the agent sidecar merge those snapshots:
+counters and histograms are summed across every process that ever wrote one,
+gauges only across processes that are still alive.
+
+    python metrics.py serve [--dir DIR] [--port 9102]   # sidecar for the agent worker
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+log = logging.getLogger("metrics")
+
+METRICS_DIR = os.getenv("METRICS_DIR", "")  # empty: single-process, no snapshot files
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+METRICS_SIDECAR_PORT = int(os.getenv("METRICS_SIDECAR_PORT", "9102"))
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_ARCHIVE_FILE = "archive.json"
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, "_Metric"] = {}
+        self._shards: List[Tuple[threading.Thread, Dict[Tuple[str, Tuple[str, ...]], Any]]] = []
+        self._base: Dict[Tuple[str, Tuple[str, ...]], Any] = {}  # totals of exited threads
+        self._shards_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _shard(self) -> Dict[Tuple[str, Tuple[str, ...]], Any]:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._fold_dead_shards()
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+
+    def _fold_dead_shards(self):
+        """Fold shards of exited threads (they will not record again) into the base total; needs _shards_lock"""
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                for key, value in shard.items():
+                    _accumulate(self._base, key, value)
+        self._shards = live
+
+    def register(self, metric: "_Metric") -> "_Metric":
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-serialisable totals of this process, summed over all thread shards"""
+        with self._shards_lock:
+            self._fold_dead_shards()
+            shards = [dict(self._base)] + [shard for _, shard in self._shards]
+        totals: Dict[str, Dict[Tuple[str, ...], Any]] = {}
+        for shard in shards:
+            for (name, labels), value in shard.copy().items():
+                # Label values are stringified here, off the recording path
+                _accumulate(totals.setdefault(name, {}), tuple([str(l) for l in labels]), value)
+        return {
+            name: dict(metric.describe(), samples=[[list(labels), value] for labels, value in totals.get(name, {}).items()])
+            for name, metric in self._metrics.items()
+        }
+
+def _accumulate(samples: Dict[Tuple[str, ...], Any], labels: Tuple[str, ...], value: Any):
+    if isinstance(value, list):
+        current = samples.get(labels)
+        samples[labels] = list(value) if current is None else [a + b for a, b in zip(current, value)]
+    else:
+        samples[labels] = samples.get(labels, 0.0) + value
+
+REGISTRY = MetricsRegistry()
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), registry: MetricsRegistry = REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._registry = registry
+        registry.register(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, Tuple[Any, ...]]:
+        return self.name, tuple([labels.get(n, "") for n in self.labelnames])
+
+    def describe(self) -> Dict[str, Any]:
+        return {"kind": self.kind, "help": self.help, "labelnames": list(self.labelnames)}
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any):
+        shard = self._registry._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0.0) + amount
+
+class Gauge(_Metric):
+    """Additive gauge: inc/dec from any thread, the scrape sums the shards"""
+    kind = "gauge"
+
+    def inc(self, amount: float = 1.0, **labels: Any):
+        shard = self._registry._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any):
+        """Absolute value; only meaningful when a single thread owns the gauge"""
+        shard = self._registry._shard()
+        key = self._key(labels)
+        shard[key] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: MetricsRegistry = REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, registry)
+
+    def observe(self, value: float, **labels: Any):
+        shard = self._registry._shard()
+        key = self._key(labels)
+        # [per-bucket counts..., +Inf count, sum, count]
+        state = shard.get(key)
+        if state is None:
+            state = shard[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        state[bisect_left(self.buckets, value)] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    def describe(self) -> Dict[str, Any]:
+        return dict(super().describe(), buckets=list(self.buckets))
+
+# ─────────────────────── Exposition ───────────────────────
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _label_str(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _format_number(value: float) -> str:
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+def render(snapshot: Dict[str, Any]) -> str:
+    """Prometheus text exposition of a (possibly merged) snapshot"""
+    lines = []
+    for name, metric in sorted(snapshot.items()):
+        kind = metric["kind"]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {kind}")
+        names = metric["labelnames"]
+        for labels, value in sorted(metric["samples"], key=lambda s: s[0]):
+            if kind != "histogram":
+                lines.append(f"{name}{_label_str(names, labels)} {_format_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric["buckets"] + ["+Inf"], value[:-2]):
+                cumulative += count
+                le = 'le="+Inf"' if bound == "+Inf" else f'le="{_format_number(bound)}"'
+                lines.append(f"{name}_bucket{_label_str(names, labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_label_str(names, labels)} {_format_number(value[-2])}")
+            lines.append(f"{name}_count{_label_str(names, labels)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+# ─────────────────────── Multi-process snapshots ───────────────────────
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def merge_snapshots(snapshots: List[Tuple[Dict[str, Any], bool]]) -> Dict[str, Any]:
+    """Sum (snapshot, alive) pairs; gauges of dead processes are dropped"""
+    merged: Dict[str, Any] = {}
+    totals: Dict[str, Dict[Tuple[str, ...], Any]] = {}
+    for snapshot, alive in snapshots:
+        for name, metric in snapshot.items():
+            if name not in merged:
+                merged[name] = {k: v for k, v in metric.items() if k != "samples"}
+            if metric["kind"] == "gauge" and not alive:
+                continue
+            samples = totals.setdefault(name, {})
+            for labels, value in metric["samples"]:
+                _accumulate(samples, tuple(labels), value)
+    for name, metric in merged.items():
+        metric["samples"] = [[list(labels), value] for labels, value in totals.get(name, {}).items()]
+    return merged
+
+class SnapshotWriter:
+    """Periodically writes this process's snapshot to <dir>/metrics-<pid>-<token>.json"""
+
+    def __init__(self, directory: str, registry: MetricsRegistry = REGISTRY, interval: float = METRICS_FLUSH_INTERVAL):
+        self.directory = directory
+        self.registry = registry
+        self.interval = interval
+        os.makedirs(directory, exist_ok=True)
+        self._reset_path()
+        self._thread = threading.Thread(target=self._run, name="metrics-snapshot", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _reset_path(self):
+        self.path = os.path.join(self.directory, f"metrics-{os.getpid()}-{os.urandom(4).hex()}.json")
+
+    def _after_fork(self):
+        self._reset_path()
+        self._thread = threading.Thread(target=self._run, name="metrics-snapshot", daemon=True)
+        self._thread.start()
+
+    def flush(self):
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.registry.snapshot(), f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            log.debug(f"Metrics snapshot failed: {e}")
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+_writer: Optional[SnapshotWriter] = None
+
+def start_snapshot_writer(directory: str = METRICS_DIR) -> Optional[SnapshotWriter]:
+    """Start exporting this process's metrics to `directory` (no-op without METRICS_DIR)"""
+    global _writer
+    if directory and _writer is None:
+        _writer = SnapshotWriter(directory)
+    return _writer
+
+def flush_snapshot():
+    """Write this process's snapshot now (e.g. right before a job process exits)"""
+    if _writer is not None:
+        _writer.flush()
+
+def collect_directory(directory: str, compact: bool = False) -> Dict[str, Any]:
+    """
+    Merge every snapshot in `directory`.
+
+    With compact=True, files of processes that have exited are folded into one
+    archive file (their gauges discarded) and deleted, keeping the directory small.
+    """
+    snapshots = []
+    dead = []
+    archive_path = os.path.join(directory, _ARCHIVE_FILE)
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return {}
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if name == _ARCHIVE_FILE:
+            snapshots.append((snapshot, False))
+            continue
+        try:
+            alive = _pid_alive(int(name.split("-")[1]))
+        except (IndexError, ValueError):
+            alive = False
+        snapshots.append((snapshot, alive))
+        if not alive:
+            dead.append((path, snapshot))
+
+    if compact and dead:
+        archive = merge_snapshots([(s, False) for s, alive in snapshots if not alive])
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(archive, f)
+        os.replace(tmp_path, archive_path)
+        for path, _ in dead:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    return merge_snapshots(snapshots)
+
+def exposition(registry: MetricsRegistry = REGISTRY, directory: str = METRICS_DIR) -> str:
+    """/metrics body: this process alone, or every process sharing METRICS_DIR"""
+    if not directory:
+        return render(registry.snapshot())
+    flush_snapshot()
+    return render(collect_directory(directory))
+
+# ─────────────────────── Sidecar ───────────────────────
+def serve(directory: str, port: int):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    compact_lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            with compact_lock:
+                body = render(collect_directory(directory, compact=True)).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            log.debug(format % args)
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    log.info(f"📈 Serving merged metrics from {directory} on :{port}/metrics")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Merge and serve per-process metric snapshots")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("serve", help="expose METRICS_DIR on /metrics for Prometheus")
+    p.add_argument("--dir", default=METRICS_DIR or "metrics")
+    p.add_argument("--port", type=int, default=METRICS_SIDECAR_PORT)
+    args = parser.parse_args()
+    try:
+        serve(args.dir, args.port)
+    except KeyboardInterrupt:
+        pass
@@ -4,43 +4,72 @@ import asyncio
 import logging
 import os
 import json
-import aiohttp
+from dataclasses import dataclass
 from datetime import datetime
 from typing import Optional, Dict, Any
 from dotenv import load_dotenv
 from livekit import api, rtc
-from livekit.agents import Agent, AgentSession, JobContext, cli, WorkerOptions, WorkerType
+from livekit.agents import Agent, AgentSession, JobContext, JobProcess, cli, WorkerOptions, WorkerType
 from livekit.plugins import openai
 from openai.types.beta.realtime.session import TurnDetection
-from zoneinfo import ZoneInfo
-import hashlib
 from collections import defaultdict
 import time
 
+from amd import AMD_ENABLED, AMD_RESULTS, caller_audio, detect_answering_machine, wait_for_greeting_end
+from call_usage import CallUsage
+from call_watchdog import CallWatchdog
+from greeting_audio import GREETING_AUDIO_CACHE, GreetingAudioCache, nameless_metadata, pcm_frames
+from metrics import Counter, Gauge, Histogram, flush_snapshot, start_snapshot_writer
+from config import PERSONA_REGISTRY, PersonaConfig, PersonaRegistry, resolve_tools
+from prompts.templates import PORTUGAL_TZ
+from structured_logging import configure_logging, set_log_context
+from tools.common_tools import TRANSFER_MODES, ToolContext
+from tracing import get_tracer
+from transcripts import TranscriptSummary, build_transcript_payload, hash_sensitive_data, summarize_session_history
+from transcript_journal import TranscriptJournal, start_journal_recovery
+from transcript_outbox import MAKE_WEBHOOK_URL, TRANSCRIPT_OUTBOX_PATH, TranscriptOutbox, start_background_drainer
+from worker_load import WorkerLoad
+
 # ─────────────────────── Configuração inicial ───────────────────────
 load_dotenv(".env.local")
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+configure_logging("outbound-agent")
 log = logging.getLogger("agent_outbound")
+tracer = get_tracer("outbound-agent")
+
+# ─────────────────────── Metrics ───────────────────────
+# Every worker/job process writes snapshots to AGENT_METRICS_DIR; `python metrics.py serve` exposes them
+AGENT_METRICS_DIR = os.getenv("METRICS_DIR", "metrics")
+ACTIVE_CALLS = Gauge("agent_active_calls", "Calls currently connected")
+SIP_FAILURES = Counter("agent_sip_failures_total", "Failed outbound dials by reason", ["reason"])
+CALL_DURATION = Histogram(
+    "agent_call_duration_seconds", "Call duration from job start to hang-up", ["persona"],
+    buckets=(15, 30, 60, 120, 300, 600, 1200, 1800, 3600),
+)
+TRANSCRIPT_CHARS = Histogram(
+    "agent_transcript_chars", "Transcript size in characters",
+    buckets=(100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000),
+)
+ANSWER_TO_FIRST_AUDIO = Histogram(
+    "agent_answer_to_first_audio_seconds", "Callee answer until the agent starts speaking", ["greeting_audio_cached"],
+    buckets=(0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0),
+)
 
 # ─────────────────────── Constantes configuráveis ───────────────────────
 # ✅ SECURITY FIX: Move sensitive values to environment variables
 SIP_TRUNK_ID = os.getenv("SIP_TRUNK_ID", "ST_SSjcbMkbf6nB")  # Should be in .env.local
 CALLER_ID = os.getenv("CALLER_ID", "+351210607606")  # Should be in .env.local
 DEFAULT_FALLBACK_PHONE = os.getenv("DEFAULT_FALLBACK_PHONE", "+351933792547")  # Emergency fallback
+TRANSFER_PHONE_NUMBER = os.getenv("TRANSFER_PHONE_NUMBER", "")  # Human agent for the transfer_human tool
+TRANSFER_PHONE_NUMBERS = os.getenv("TRANSFER_PHONE_NUMBERS", TRANSFER_PHONE_NUMBER)  # Comma-separated, rung in parallel (warm mode)
+TRANSFER_MODE = os.getenv("TRANSFER_MODE", "cold")  # cold | warm
 
 # Validate environment variables
 LIVEKIT_URL = os.getenv("LIVEKIT_URL")
 LIVEKIT_API_KEY = os.getenv("LIVEKIT_API_KEY")
 LIVEKIT_API_SECRET = os.getenv("LIVEKIT_API_SECRET")
 
-# Webhook configuration
-MAKE_WEBHOOK_URL = "https://hook.eu2.make.com/3piew3wpiu0jtewr1tlb66r6e8medd9r"  # Hardcoded after-call webhook
-MAKE_WEBHOOK_SECRET = os.getenv("MAKE_WEBHOOK_SECRET")  # Optional for verification
-WEBHOOK_TIMEOUT = int(os.getenv("WEBHOOK_TIMEOUT", "30"))
-WEBHOOK_RETRIES = int(os.getenv("WEBHOOK_RETRIES", "3"))
+# Webhook configuration (delivery happens through the durable transcript outbox)
+TRANSCRIPT_OUTBOX_DRAINER = os.getenv("TRANSCRIPT_OUTBOX_DRAINER", "1") == "1"  # Drain from the worker process
 
 # ✅ SECURITY: Validate critical environment variables
 if not LIVEKIT_URL:
@@ -51,125 +80,37 @@ if not MAKE_WEBHOOK_URL:
     log.warning("MAKE_WEBHOOK_URL não definido no arquivo .env.local - transcripts não serão enviados")
 if not SIP_TRUNK_ID or SIP_TRUNK_ID == "ST_SSjcbMkbf6nB":
     log.warning("⚠️  Using default SIP_TRUNK_ID - configure SIP_TRUNK_ID in .env.local for production")
+if TRANSFER_MODE not in TRANSFER_MODES:
+    log.warning(f"⚠️  Unknown TRANSFER_MODE '{TRANSFER_MODE}', using cold transfers")
+    TRANSFER_MODE = "cold"
 if not CALLER_ID or CALLER_ID == "+351210607606":
     log.warning("⚠️  Using default CALLER_ID - configure CALLER_ID in .env.local for production")
-
-# ─────────────────────── Embedded Prompt Definitions ───────────────────────
-# Common prompt definitions
-BASE_AGENT_INSTRUCTIONS = (
-    "Você é um assistente de IA conversacional amigável e útil. "
-    "Seja conciso e direto ao ponto, a menos que seja solicitado o contrário. "
-    "NUNCA invente respostas. Se você não sabe a resposta, diga que não sabe. "
-    "SEMPRE use EXCLUSIVAMENTE Português de Portugal (não do Brasil) em todas as interações. "
-    "Use expressões, vocabulário e construções frásicas típicas de Portugal, NUNCA do Brasil. "
-    "Evite termos brasileiros como 'você' (prefira 'tu' ou o formal 'o senhor/a senhora'), 'legal', 'a gente', etc. "
-    "Prefira dizer 'casa de banho' em vez de 'banheiro', 'autocarro' em vez de 'ônibus', 'pequeno-almoço' em vez de 'café da manhã'. "
-)
-
-# Common prompts
-async def build_common_system_prompt(initial_data: Dict[str, Any], metadata: Dict[str, Any]) -> str:
-    """
-    Builds a generic system prompt for the selected persona for Phase 1.
-    """
-    persona_key = metadata.get("persona", "assistente virtual") # e.g. "restaurante", "clinica", "vendedor"
-    customer_name = metadata.get("customer_name", "utilizador")
-
-    # Determine a more descriptive name for the persona if available
-    persona_display_names = {
-        "restaurante": "agente de apoio a restaurantes",
-        "clinica": "agente de apoio a clínicas dentárias",
-        "vendedor": "agente de vendas",
-        "assistente virtual": "assistente virtual"
-    }
-    persona_display_name = persona_display_names.get(persona_key, "assistente virtual")
-
-    prompt = f"""O seu nome é {persona_key.capitalize()} e você é um {persona_display_name} amigável e prestável para uma demonstração.
-O nome do cliente é {customer_name if customer_name and customer_name != "Website User" else 'Utilizador'}.
-
-Você foi contactado porque o cliente clicou no botão 'Experimenta Grátis' no nosso website para uma demonstração da persona '{persona_key}'.
-O objetivo principal desta chamada é demonstrar as suas capacidades de conversação como um {persona_display_name}.
-
-Instruções Chave:
-1.  Apresente-se cordialmente como o {persona_key.capitalize()}, um {persona_display_name}.
-2.  Confirme que esta é uma chamada de demonstração para a persona '{persona_key}'.
-3.  Mantenha a conversa curta e focada na demonstração.
-4.  Você pode fornecer informações genéricas sobre o tipo de tarefas que um {persona_display_name} como você poderia realizar no dia-a-dia.
-    Por exemplo:
-    - Se for 'restaurante': "Normalmente, eu poderia ajudar com reservas, pedidos de menu, ou informações sobre o nosso horário."
-    - Se for 'clinica': "Normalmente, eu poderia ajudar a marcar consultas, fornecer informações sobre os nossos tratamentos, ou dar moradas e contactos."
-    - Se for 'vendedor': "Normalmente, eu poderia apresentar produtos, verificar stock, ou ajudar a processar uma encomenda."
-    Adapte o exemplo à persona '{persona_key}'.
-5.  Após uma breve interação ou se o cliente perguntar como proceder, pode mencionar que, numa situação real, haveria mais ferramentas e informações disponíveis.
-6.  Se o cliente pedir para falar com um humano, quiser terminar a demonstração, ou se a conversa se desviar muito, utilize a ferramenta 'transfer_human' para encaminhar a chamada educadamente, mencionando que está a transferir para um colega humano.
-7.  Seja breve, educado e profissional.
-{BASE_AGENT_INSTRUCTIONS}
-"""
-    return prompt
-
-async def build_common_greeting(metadata: Dict[str, Any]) -> str:
-    """
-    Builds a generic greeting for the selected persona for Phase 1.
-    """
-    persona_key = metadata.get("persona", "assistente virtual")
-    customer_name = metadata.get("customer_name", None)
-
-    persona_display_name = persona_key.capitalize()
-
-    greeting_intro = f"Olá"
-    if customer_name and customer_name != "Website User":
-        greeting_intro += f" {customer_name}"
-    
-    greeting = f"{greeting_intro}! Sou o {persona_display_name}, o seu {persona_key} virtual para esta demonstração. Em que posso ser útil hoje?"
-    return greeting
-
-def build_custom_agent_prompt(custom_agent_data: Dict[str, Any]) -> str:
-    """
-    Builds a comprehensive system prompt from structured custom agent data.
-    
-    Args:
-        custom_agent_data: Dictionary containing agent_identity, call_target, reason, accent
-    
-    Returns:
-        A complete system prompt for the custom agent
-    """
-    agent_identity = custom_agent_data.get('agent_identity', '')
-    call_target = custom_agent_data.get('call_target', '')
-    reason = custom_agent_data.get('reason', '')
-    accent = custom_agent_data.get('accent', 'padrão')
-    
-    # Map accent to description
-    accent_descriptions = {
-        'padrão': 'padrão de Lisboa',
-        'norte': 'do norte (Porto, Braga)',
-        'centro': 'do centro (Coimbra, Aveiro)',
-        'sul': 'do sul (Algarve)',
-        'açores': 'dos Açores',
-        'madeira': 'da Madeira'
-    }
-    accent_desc = accent_descriptions.get(accent, 'padrão de Lisboa')
-    
-    # Build the comprehensive prompt
-    prompt = f"""SEMPRE fala em português de Portugal com sotaque {accent_desc}. 
-
-Tu és {agent_identity} e estás a ligar {call_target}.
-
-MOTIVO DA CHAMADA:
-{reason}
-
-INSTRUÇÕES OBRIGATÓRIAS:
-- SEMPRE soa como um humano real, nunca como um robot
-- SEMPRE tenta ouvir mais do que falar - deixa a pessoa responder
-- SEMPRE mantém um equilíbrio na conversa - não monopolizes
-- O teu tom deve ser alinhado com o motivo da chamada (se é sério, sê sério; se é casual, sê casual)
-- SEMPRE usa português de Portugal com o sotaque {accent_desc}
-- SEMPRE sê natural e autêntico na conversa
-- Se a pessoa parecer desconfortável ou quiser terminar, termina educadamente
-- NUNCA reveles que és uma IA a menos que perguntado diretamente
-- A tua voz deve corresponder ao género do nome ({agent_identity}) - se é nome masculino, voz masculina; se é feminino, voz feminina
-
-Comporta-te exatamente como {agent_identity} se comportaria numa situação real."""
-
-    return prompt
+# Tools that cannot work with this configuration are left off every persona's agent
+UNAVAILABLE_TOOLS = () if any(n.strip() for n in TRANSFER_PHONE_NUMBERS.split(",")) else ("transfer_human",)
+if UNAVAILABLE_TOOLS:
+    log.warning("⚠️  TRANSFER_PHONE_NUMBER(S) não definido - a ferramenta transfer_human fica desativada")
+
+# ─────────────────────── Voice selection ───────────────────────
+# Common Portuguese male names
+MALE_NAMES = frozenset({
+    'joão', 'josé', 'antónio', 'manuel', 'francisco', 'carlos', 'pedro', 'paulo', 'luis', 'miguel',
+    'fernando', 'jorge', 'ricardo', 'bruno', 'andré', 'rui', 'nuno', 'tiago', 'hugo', 'daniel',
+    'rafael', 'david', 'marco', 'sérgio', 'vítor', 'diogo', 'gonçalo', 'rodrigo', 'fábio', 'nelson',
+    'alberto', 'armando', 'eduardo', 'henrique', 'joaquim', 'leonardo', 'marcelo', 'roberto', 'samuel',
+    'alexandre', 'cristiano', 'emanuel', 'gabriel', 'gustavo', 'joão', 'leonardo', 'márcio', 'mário',
+    'martim', 'mateus', 'paulo', 'renato', 'ricardo', 'simão', 'tomás', 'vasco', 'xavier'
+})
+
+# Common Portuguese female names
+FEMALE_NAMES = frozenset({
+    'maria', 'ana', 'joana', 'catarina', 'sofia', 'inês', 'beatriz', 'carolina', 'mariana', 'rita',
+    'sara', 'patrícia', 'carla', 'sandra', 'cristina', 'helena', 'isabel', 'paula', 'teresa', 'vera',
+    'alexandra', 'andreia', 'bárbara', 'cláudia', 'diana', 'elisabete', 'fernanda', 'gabriela', 'lúcia',
+    'marta', 'mónica', 'raquel', 'sónia', 'susana', 'vanessa', 'alice', 'amélia', 'ângela', 'célia',
+    'conceição', 'fátima', 'graça', 'leonor', 'liliana', 'manuela', 'natália', 'olívia', 'rosa', 'sílvia'
+})
+
+VOICE_BY_GENDER = {'male': 'echo', 'female': 'coral'}  # OpenAI Realtime voices
 
 def detect_gender_from_name(name: str) -> str:
     """
@@ -187,28 +128,9 @@ def detect_gender_from_name(name: str) -> str:
     # Extract first name (before comma or first word)
     first_name = name.split(',')[0].strip().split()[0].lower()
     
-    # Common Portuguese male names
-    male_names = {
-        'joão', 'josé', 'antónio', 'manuel', 'francisco', 'carlos', 'pedro', 'paulo', 'luis', 'miguel',
-        'fernando', 'jorge', 'ricardo', 'bruno', 'andré', 'rui', 'nuno', 'tiago', 'hugo', 'daniel',
-        'rafael', 'david', 'marco', 'sérgio', 'vítor', 'diogo', 'gonçalo', 'rodrigo', 'fábio', 'nelson',
-        'alberto', 'armando', 'eduardo', 'henrique', 'joaquim', 'leonardo', 'marcelo', 'roberto', 'samuel',
-        'alexandre', 'cristiano', 'emanuel', 'gabriel', 'gustavo', 'joão', 'leonardo', 'márcio', 'mário',
-        'martim', 'mateus', 'paulo', 'renato', 'ricardo', 'simão', 'tomás', 'vasco', 'xavier'
-    }
-    
-    # Common Portuguese female names
-    female_names = {
-        'maria', 'ana', 'joana', 'catarina', 'sofia', 'inês', 'beatriz', 'carolina', 'mariana', 'rita',
-        'sara', 'patrícia', 'carla', 'sandra', 'cristina', 'helena', 'isabel', 'paula', 'teresa', 'vera',
-        'alexandra', 'andreia', 'bárbara', 'cláudia', 'diana', 'elisabete', 'fernanda', 'gabriela', 'lúcia',
-        'marta', 'mónica', 'raquel', 'sónia', 'susana', 'vanessa', 'alice', 'amélia', 'ângela', 'célia',
-        'conceição', 'fátima', 'graça', 'leonor', 'liliana', 'manuela', 'natália', 'olívia', 'rosa', 'sílvia'
-    }
-    
-    if first_name in male_names:
+    if first_name in MALE_NAMES:
         return 'male'
-    elif first_name in female_names:
+    elif first_name in FEMALE_NAMES:
         return 'female'
     else:
         # Default to female if name not recognized
@@ -224,180 +146,12 @@ def get_voice_for_gender(gender: str) -> str:
     Returns:
         Voice name for OpenAI Realtime API
     """
-    if gender == 'male':
-        return 'echo'  # Male voice
-    else:
-        return 'coral'  # Female voice (default)
-
-# Clinic prompts
-PORTUGAL_TZ = ZoneInfo("Europe/Lisbon")
-DAYS_PT = {
-    "monday": "Segunda-feira", "tuesday": "Terça-feira", "wednesday": "Quarta-feira",
-    "thursday": "Quinta-feira", "friday": "Sexta-feira", "saturday": "Sábado", "sunday": "Domingo"
-}
-
-async def build_clinic_greeting(metadata: Dict[str, Any]) -> str:
-    customer_name = metadata.get("customer_name", "Utente")
-    return f"Olá, {customer_name}, da Clínica Sorriso. Ligamos porque clicou no nosso botão 'Experimenta Grátis'. Como posso ajudar?"
-
-async def build_clinic_prompt(persona_initial_data: Dict[str, Any], metadata: Dict[str, Any]) -> str:
-    now = datetime.now(PORTUGAL_TZ)
-    current_time = now.strftime("%H:%M")
-    current_day_en = now.strftime("%A").lower()
-    current_day_pt = DAYS_PT.get(current_day_en, current_day_en.capitalize())
-
-    metadata_instructions = ""
-    if metadata:
-        customer_name = metadata.get("customer_name", "")
-        instructions = metadata.get("instructions", "")
-        if customer_name:
-            metadata_instructions += f"\n\nDirige-te ao utente como '{customer_name}'."
-        if instructions:
-            metadata_instructions += f"\nInstruções específicas para esta chamada: {instructions}"
-
-    return (
-        f"Função: És um assistente virtual da Clínica Dentária Sorriso. Estás a ligar a um utente que interagiu com o botão 'Experimenta Grátis' no website. "
-        f"Usa EXCLUSIVAMENTE Português de Portugal (nunca do Brasil), com termos e expressões tipicamente portugueses. "
-        + BASE_AGENT_INSTRUCTIONS + "\n"
-        f"HORA ATUAL: {current_time} de {current_day_pt}.\n"
-        + metadata_instructions
-        + "\n\nOBJETIVO DA CHAMADA (FASE 1 - DEMONSTRAÇÃO SIMPLES):"
-        + "\n1. Confirma que o utente se lembra de ter clicado no botão 'Experimenta Grátis' para a Clínica Sorriso."
-        + "\n2. Explica brevemente que esta é uma demonstração da capacidade do nosso assistente virtual para marcar consultas ou dar informações básicas."
-        + "\n3. Pergunta se o utente tem alguma questão simples sobre a clínica (ex: tipos de serviços gerais, localização genérica)."
-        + "\n4. Se o utente quiser marcar uma consulta real ou tiver questões médicas complexas, informa que esta é uma demonstração e oferece transferir para um humano usando a ferramenta 'transfer_human'."
-        + "\n5. Mantém a conversa curta e agradável."
-        + "\n\nClínica Info Genérica (para a demo):"
-        + "\n- Serviços: Consultas gerais, limpezas, branqueamentos."
-        + "\n- Localização: Temos várias clínicas na cidade (não especificar morada exata)."
-        + "\n- Marcações: Para marcações reais, o melhor é falar com a nossa receção."
-        + "\n\nNÃO TENTES verificar disponibilidade real de horários ou marcar consultas nesta fase. Usa 'transfer_human' para esses casos."
-    )
-
-# Sales prompts
-async def build_sales_prompt(initial_data: Dict[str, Any], metadata: Dict[str, Any]) -> str:
-    """
-    Build a system prompt for the sales persona.
-    
-    Args:
-        initial_data: Pre-loaded data about the sales context
-        metadata: Request-specific metadata, including customer information
-    
-    Returns:
-        A formatted prompt string
-    """
-    log.info("Building sales system prompt")
-    
-    customer_name = metadata.get("customer_name", "")
-    customer_specific = f"\nDirige-te ao cliente como '{customer_name}'." if customer_name else ""
-    
-    website_request_id = metadata.get("website_request_id", "")
-    request_context = f"\nPedido da web: {website_request_id}" if website_request_id else ""
-    
-    instructions = metadata.get("instructions", "")
-    additional_instructions = f"\nInstruções específicas: {instructions}" if instructions else ""
-    
-    return (
-        "Função: És um representante de vendas profissional da Chamada.ai para o nosso serviço 'Experimenta Grátis'. "
-        "Usa EXCLUSIVAMENTE Português de Portugal (nunca do Brasil), com linguagem formal mas acessível. "
-        "Utiliza sempre expressões, vocabulário e construções frásicas típicas de Portugal, NUNCA do Brasil. "
-        f"{customer_specific}"
-        f"{request_context}"
-        f"{additional_instructions}\n\n"
-        "Objetivo da chamada:\n"
-        "1. Apresentar o serviço de chamadas automatizadas da Chamada.ai\n"
-        "2. Explicar que é possível criar assistentes virtuais para diversos casos de uso\n"
-        "3. Recolher informações sobre o interesse do cliente\n"
-        "4. Agendar uma demonstração mais detalhada\n\n"
-        "Pontos importantes a mencionar:\n"
-        "- Processo simples e rápido de implementação\n"
-        "- Capacidade de personalização para diferentes negócios\n"
-        "- Disponibilidade para esclarecimento de dúvidas\n\n"
-        "Lembra-te:\n"
-        "- Sê sempre atencioso e paciente\n"
-        "- Adapta o discurso consoante o interesse do cliente\n"
-        "- Não insistas demasiado se o cliente não mostrar interesse\n"
-        "- Agradece pelo tempo dispensado no final da chamada"
-    )
-
-async def build_sales_greeting(metadata: Dict[str, Any]) -> str:
-    """
-    Build a greeting message for the sales persona.
-    
-    Args:
-        metadata: Request-specific metadata, including customer information
-    
-    Returns:
-        A greeting string
-    """
-    log.info("Building sales greeting")
-    
-    customer_name = metadata.get("customer_name", "")
-    
-    if customer_name:
-        return f"Olá {customer_name}, bom dia! Sou da Chamada.ai. Estou a ligar sobre o nosso serviço 'Experimenta Grátis' que permite criar assistentes virtuais para o seu negócio. Tem alguns minutos para falar sobre como isto pode ajudar a sua empresa?"
-    else:
-        return "Olá, bom dia! Sou da Chamada.ai. Estou a ligar sobre o nosso serviço 'Experimenta Grátis' que permite criar assistentes virtuais para o seu negócio. Tem alguns minutos para falar sobre como isto pode ajudar a sua empresa?" 
-
-# ─────────────────────── System Prompt Builders ───────────────────────
-async def get_system_prompt(metadata: Dict[str, Any]) -> str:
-    """
-    Select and build the appropriate system prompt based on persona in metadata
-    """
-    persona = metadata.get("persona", "default")
-    log.info(f"Building system prompt for persona: {persona}")
-    
-    # Handle custom persona - build structured prompt
-    if persona == "custom":
-        custom_agent_data = metadata.get("custom_agent_data")
-        if custom_agent_data:
-            log.info("Building custom agent prompt from structured data")
-            return build_custom_agent_prompt(custom_agent_data)
-        else:
-            log.warning("Custom persona requested but no custom_agent_data provided, falling back to default")
-    
-    # Initial data that might be needed for certain personas (could be expanded)
-    initial_data = {}
-    
-    if persona == "clinica" or persona == "dentist":
-        # For dental clinic use case
-        return await build_clinic_prompt(initial_data, metadata)
-    elif persona == "vendedor" or persona == "sales":
-        # For sales representative use case
-        return await build_sales_prompt(initial_data, metadata)
-    else:
-        # Default to common prompt for any other persona
-        return await build_common_system_prompt(initial_data, metadata)
-
-async def get_initial_greeting(metadata: Dict[str, Any]) -> str:
-    """
-    Select and build the appropriate greeting based on persona in metadata
-    """
-    persona = metadata.get("persona", "default")
-    log.info(f"Building greeting for persona: {persona}")
-    
-    # Handle custom persona - simple generic greeting
-    if persona == "custom":
-        return "Olá!"
-    
-    if persona == "clinica" or persona == "dentist":
-        return await build_clinic_greeting(metadata)
-    elif persona == "vendedor" or persona == "sales":
-        return await build_sales_greeting(metadata)
-    else:
-        return await build_common_greeting(metadata)
+    return VOICE_BY_GENDER.get(gender, VOICE_BY_GENDER['female'])  # Female voice (default)
 
 # ─────────────────────── Webhook Functions ───────────────────────
-def hash_sensitive_data(data: str) -> str:
-    """Hash sensitive data for privacy protection"""
-    if not data or data in ["unknown", "Website User"]:
-        return data
-    return hashlib.sha256(data.encode()).hexdigest()[:16]  # First 16 chars for brevity
-
 def format_transcript_from_session_history(session_history: Dict[str, Any]) -> str:
     """
     Convert LiveKit session history into a clean, readable transcript string.
-    Based on official LiveKit documentation for OpenAI Realtime API.
 
     Args:
         session_history: The session.history.to_dict() output from LiveKit AgentSession
@@ -406,216 +160,66 @@ def format_transcript_from_session_history(session_history: Dict[str, Any]) -> s
         A formatted transcript string with the complete conversation
     """
     try:
-        log.info("🔍 Extracting transcript from LiveKit session history")
-        
-        # According to LiveKit docs, session.history.to_dict() contains conversation items
-        # The structure follows the OpenAI Realtime API conversation format
-        items = session_history.get("items", [])
-        
-        if not items:
+        if not session_history.get("items"):
             log.warning("❌ No conversation items found in session_history")
-            log.debug(f"Session history structure: {list(session_history.keys())}")
             return "No conversation found."
-        
-        log.info(f"📝 Found {len(items)} conversation items")
-        
-        transcript_lines = []
-        transcript_lines.append("=== CONVERSATION TRANSCRIPT ===")
-        transcript_lines.append("")
-        
-        for i, item in enumerate(items):
-            try:
-                # Each item should have a role and content according to OpenAI Realtime API
-                role = item.get("role", "unknown")
-                content = item.get("content", [])
-                
-                # Handle different content formats
-                if isinstance(content, str):
-                    # Simple string content
-                    text_content = content
-                elif isinstance(content, list):
-                    # List of content objects (OpenAI format)
-                    text_parts = []
-                    for content_item in content:
-                        if isinstance(content_item, dict):
-                            if content_item.get("type") == "text":
-                                text_parts.append(content_item.get("text", ""))
-                            elif "text" in content_item:
-                                text_parts.append(content_item["text"])
-                        elif isinstance(content_item, str):
-                            text_parts.append(content_item)
-                    text_content = " ".join(text_parts)
-                else:
-                    # Fallback for other formats
-                    text_content = str(content)
-                
-                # Clean up the text content
-                text_content = text_content.strip()
-                
-                if text_content:
-                    # Format based on role
-                    if role == "user":
-                        speaker = "👤 User"
-                    elif role == "assistant":
-                        speaker = "🤖 Assistant"
-                    elif role == "system":
-                        speaker = "⚙️ System"
-                    else:
-                        speaker = f"❓ {role.title()}"
-                    
-                    transcript_lines.append(f"{speaker}: {text_content}")
-                    transcript_lines.append("")
-                
-            except Exception as item_error:
-                log.warning(f"⚠️ Error processing conversation item {i}: {item_error}")
-                continue
-        
-        if len(transcript_lines) <= 2:  # Only header lines
+        summary = summarize_session_history(session_history)
+        if not summary.turns:
             log.warning("❌ No valid conversation content found")
             return "No valid conversation content found."
-        
-        transcript = "\n".join(transcript_lines)
-        log.info(f"✅ Successfully formatted transcript with {len(transcript_lines)} lines")
-        
-        return transcript
-        
+        return summary.text
     except Exception as e:
         log.error(f"❌ Error formatting transcript: {e}")
-        log.debug(f"Session history type: {type(session_history)}")
-        log.debug(f"Session history keys: {list(session_history.keys()) if isinstance(session_history, dict) else 'Not a dict'}")
         return f"Error formatting transcript: {str(e)}"
 
+_outbox: Optional[TranscriptOutbox] = None
+
+def get_outbox() -> TranscriptOutbox:
+    """Per-process handle on the transcript outbox"""
+    global _outbox
+    if _outbox is None:
+        _outbox = TranscriptOutbox(TRANSCRIPT_OUTBOX_PATH)
+    return _outbox
+
 async def send_transcript_webhook(
     call_metadata: Dict[str, Any], 
-    formatted_transcript: str,
+    transcript: TranscriptSummary,
     session_start_time: datetime,
     session_end_time: datetime
 ) -> bool:
     """
-    Send a single, clean webhook request with consolidated transcript.
+    Queue the consolidated transcript for webhook delivery.
     
-    Args:
-        call_metadata: Information about the call (persona, phone, etc.)
-        formatted_transcript: Clean, formatted transcript string
-        session_start_time: When the session started
-        session_end_time: When the session ended
+    The payload is written to the durable outbox and delivered by the background
+    drainer, so the job does not wait on (or lose transcripts to) Make.com outages.
     
     Returns:
-        bool: True if webhook sent successfully, False otherwise
+        bool: True if the transcript was queued, False otherwise
     """
     if not MAKE_WEBHOOK_URL:
         log.warning("MAKE_WEBHOOK_URL not configured - transcript not sent")
         return False
     
     try:
-        # Calculate call duration
-        duration_seconds = int((session_end_time - session_start_time).total_seconds())
-        
-        # ✅ SECURITY: Hash sensitive data for privacy
-        phone_hash = hash_sensitive_data(call_metadata.get("phone_number", "unknown"))
-        customer_hash = hash_sensitive_data(call_metadata.get("customer_name", "Website User"))
-        
-        # Analyze transcript for better analytics
-        transcript_lines = [line for line in formatted_transcript.split('\n') if line.strip()]
-        agent_messages = len([line for line in transcript_lines if line.startswith('Agente:')])
-        client_messages = len([line for line in transcript_lines if line.startswith('Cliente:')])
-        total_messages = len(transcript_lines)
-        
-        # Determine call outcome based on transcript content
-        call_outcome = "completed"
-        if "erro" in formatted_transcript.lower() or "falha" in formatted_transcript.lower():
-            call_outcome = "error"
-        elif total_messages < 2:
-            call_outcome = "no_conversation"
-        elif agent_messages == 0 or client_messages == 0:
-            call_outcome = "one_sided"
-        
-        # Build comprehensive webhook payload
-        payload = {
-            "call_metadata": {
-                "call_id": call_metadata.get("call_id", "unknown"),
-                "room_name": call_metadata.get("room_name", "unknown"),
-                "persona": call_metadata.get("persona", "default"),
-                "phone_hash": phone_hash,
-                "customer_hash": customer_hash,
-                "start_time": session_start_time.isoformat(),
-                "end_time": session_end_time.isoformat(),
-                "duration_seconds": duration_seconds,
-                "call_outcome": call_outcome
-            },
-            "transcript": {
-                "content": formatted_transcript,  # ✅ Single consolidated transcript
-                "format": "text",
-                "language": "pt-PT",
-                "encoding": "utf-8"
-            },
-            "analytics": {
-                "total_messages": total_messages,
-                "agent_messages": agent_messages,
-                "client_messages": client_messages,
-                "conversation_turns": max(agent_messages, client_messages),
-                "avg_message_length": len(formatted_transcript) // max(total_messages, 1),
-                "timestamp_utc": session_end_time.isoformat()
-            },
-            "technical": {
-                "agent_version": "1.0",
-                "model_used": "gpt-4o-mini-realtime-preview",
-                "livekit_session": True,
-                "webhook_version": "2.0"
-            }
-        }
-        
-        # Prepare headers
-        headers = {
-            "Content-Type": "application/json",
-            "User-Agent": "ChamadaAI-Agent/1.0",
-            "X-Webhook-Version": "2.0"
-        }
-        
-        # ✅ SECURITY: Authentication if configured
-        if MAKE_WEBHOOK_SECRET:
-            headers["Authorization"] = f"Bearer {MAKE_WEBHOOK_SECRET}"
-            headers["X-Timestamp"] = str(int(session_end_time.timestamp()))
-        
-        # Send webhook with retries and exponential backoff
-        for attempt in range(WEBHOOK_RETRIES):
-            try:
-                timeout = aiohttp.ClientTimeout(total=WEBHOOK_TIMEOUT)
-                async with aiohttp.ClientSession(timeout=timeout) as session:
-                    log.info(f"📤 Sending consolidated transcript to webhook (attempt {attempt + 1}/{WEBHOOK_RETRIES})")
-                    log.info(f"📊 Transcript: {total_messages} messages ({agent_messages} agent, {client_messages} client)")
-                    
-                    async with session.post(MAKE_WEBHOOK_URL, json=payload, headers=headers) as response:
-                        if response.status == 200:
-                            log.info(f"✅ Transcript sent successfully - Status: {response.status}")
-                            return True  # ✅ Success - stop retrying
-                        else:
-                            response_text = await response.text()
-                            log.warning(f"❌ Webhook failed with status {response.status}: {response_text}")
-                            
-                            # Don't retry on client errors (4xx)
-                            if 400 <= response.status < 500:
-                                log.error(f"🚫 Client error {response.status} - not retrying")
-                                return False
-                            
-            except asyncio.TimeoutError:
-                log.warning(f"⏰ Timeout on attempt {attempt + 1} - webhook took longer than {WEBHOOK_TIMEOUT}s")
-            except aiohttp.ClientError as e:
-                log.warning(f"🔌 Connection error on attempt {attempt + 1}: {type(e).__name__}")
-            except Exception as e:
-                log.error(f"💥 Unexpected error on attempt {attempt + 1}: {type(e).__name__}")
-            
-            # Wait before retry with exponential backoff
-            if attempt < WEBHOOK_RETRIES - 1:
-                wait_time = min(2 ** attempt, 10)  # Cap at 10 seconds
-                log.info(f"⏳ Waiting {wait_time}s before next attempt...")
-                await asyncio.sleep(wait_time)
-        
-        log.error(f"❌ Failed to send transcript after {WEBHOOK_RETRIES} attempts")
-        return False
+        payload = build_transcript_payload(call_metadata, transcript, session_start_time, session_end_time)
+        job_id = call_metadata.get("call_id", "unknown")
+        CALL_DURATION.observe(payload["call_metadata"]["duration_seconds"], persona=call_metadata.get("persona", "default"))
+        TRANSCRIPT_CHARS.observe(len(transcript.text))
+        website_request_id = call_metadata.get("website_request_id")
+        tracer.record(
+            "job.call", website_request_id, session_start_time.timestamp(), session_end_time.timestamp(),
+            call_metadata.get("trace_parent_id"), job_id=job_id, turns=transcript.total_messages
+        )
+        with tracer.span("webhook.enqueue", website_request_id, call_metadata.get("trace_parent_id")):
+            queued = get_outbox().enqueue(job_id, payload)
+        if queued:
+            log.info(f"📮 Transcript queued for delivery ({payload['analytics']['total_messages']} messages)")
+        else:
+            log.warning(f"🚫 Transcript for job {job_id} already queued - ignoring duplicate")
+        return True
         
     except Exception as e:
-        log.error(f"💥 Critical error preparing webhook: {type(e).__name__}", exc_info=True)
+        log.error(f"💥 Critical error queueing webhook: {type(e).__name__}", exc_info=True)
         return False
 
 # ─────────────────────── Global state for preventing duplicate webhooks ───────────────────────
@@ -642,13 +246,14 @@ def _cleanup_old_webhook_jobs():
         _last_cleanup = current_time
 
 async def save_transcript_to_webhook(
-    session: AgentSession,
     call_metadata: Dict[str, Any],
-    session_start_time: datetime
+    session_start_time: datetime,
+    journal: TranscriptJournal,
+    usage: Optional[CallUsage] = None
 ) -> None:
     """
-    Extract transcript from session history, format it cleanly, and send ONE webhook request.
-    This function is called as a shutdown callback when the call ends.
+    Close the call's transcript journal and queue ONE webhook request.
+    Called as a shutdown callback when the call ends.
     """
     global _webhook_sent_jobs
     
@@ -666,75 +271,216 @@ async def save_transcript_to_webhook(
     _webhook_sent_jobs[job_id] = time.time()
     
     try:
-        session_end_time = datetime.now(ZoneInfo("Europe/Lisbon"))
-        
-        # Get the complete conversation history
-        log.info("📋 Extracting and formatting transcript from session...")
-        
-        # ✅ SAFETY: Check if session is still valid
-        if not session or not hasattr(session, 'history'):
-            log.warning("⚠️ Session or session.history is not available")
-            formatted_transcript = "Agente: [Sessão não disponível para extração de transcript]"
+        session_end_time = datetime.now(PORTUGAL_TZ)
+        if usage is not None:
+            call_metadata["usage"] = usage.finish()
+
+        # Turns were captured live during the call; just flush and close the journal
+        transcript = journal.finish()
+        formatted_transcript = transcript.text
+        log.info(f"📝 Transcript journal closed: {transcript.total_messages} turns")
+        if not transcript.turns:
+            log.warning("⚠️ No conversation content captured - webhook not sent")
+            journal.discard()
+            return
+        webhook_success = await send_transcript_webhook(
+            call_metadata=call_metadata,
+            transcript=transcript,
+            session_start_time=session_start_time,
+            session_end_time=session_end_time
+        )
+        if webhook_success:
+            log.info("✅ Transcript webhook queued successfully")
+            journal.discard()
         else:
-            try:
-                session_history = session.history.to_dict()
-                
-                # Add comprehensive debugging to understand the structure
-                log.info(f"🔍 Session history type: {type(session_history)}")
-                log.info(f"🔍 Session history keys: {list(session_history.keys()) if isinstance(session_history, dict) else 'Not a dict'}")
-                
-                # Log the full structure for debugging (first few items only to avoid spam)
-                if isinstance(session_history, dict):
-                    for key, value in session_history.items():
-                        if isinstance(value, list):
-                            log.info(f"🔍 Key '{key}' contains list with {len(value)} items")
-                            if value:  # If list is not empty, show first item structure
-                                log.info(f"🔍 First item in '{key}': {type(value[0])} - {value[0] if len(str(value[0])) < 200 else str(value[0])[:200] + '...'}")
-                        else:
-                            log.info(f"🔍 Key '{key}': {type(value)} - {value if len(str(value)) < 100 else str(value)[:100] + '...'}")
-                
-                # Extract and format the transcript
-                formatted_transcript = format_transcript_from_session_history(session_history)
-                
-                if not formatted_transcript or formatted_transcript.startswith("Error") or formatted_transcript.startswith("No"):
-                    log.warning(f"⚠️ Transcript extraction failed: {formatted_transcript}")
-                    # Don't send webhook if transcript is empty or error
-                    return
-                
-                log.info(f"📝 Transcript extracted successfully: {len(formatted_transcript)} characters")
-                
-                # Send the webhook with the transcript
-                webhook_success = await send_transcript_webhook(
-                    call_metadata=call_metadata,
-                    formatted_transcript=formatted_transcript,
-                    session_start_time=session_start_time,
-                    session_end_time=session_end_time
-                )
-                
-                if webhook_success:
-                    log.info("✅ Transcript webhook sent successfully")
-                else:
-                    log.error("❌ Failed to send transcript webhook")
-                
-            except Exception as history_error:
-                log.error(f"❌ Error accessing session history: {history_error}")
-                formatted_transcript = f"Agente: [Erro ao acessar histórico da sessão: {str(history_error)}]"
-        
-        log.info(f"✅ Transcript formatted with {len(formatted_transcript.split())} words")
-        log.info(f"📝 Complete transcript: {formatted_transcript}")
+            log.error("❌ Failed to queue transcript webhook - journal kept for recovery")
+
+        log.debug("📝 Complete transcript: %s", formatted_transcript)
         
     except Exception as e:
         log.error(f"💥 Critical error saving transcript: {type(e).__name__}", exc_info=True)
     finally:
         # Keep the job ID marked as processed (will be cleaned up automatically after 1 hour)
-        pass
+        flush_snapshot()
+
+# ─────────────────────── Call outcome reporting ───────────────────────
+# SIP status codes from create_sip_participant errors, mapped to campaign outcomes
+SIP_BUSY_CODES = {486, 600}
+SIP_NO_ANSWER_CODES = {408, 480, 487}
+
+def classify_sip_failure(error: Exception) -> str:
+    """Map a failed create_sip_participant call to busy / no_answer / failed"""
+    metadata = getattr(error, "metadata", None) or {}
+    try:
+        status_code = int(metadata.get("sip_status_code", 0))
+    except (TypeError, ValueError):
+        status_code = 0
+    if status_code in SIP_BUSY_CODES:
+        return "busy"
+    if status_code in SIP_NO_ANSWER_CODES:
+        return "no_answer"
+    return "failed"
+
+async def report_call_outcome(ctx: JobContext, outcome: str) -> None:
+    """Publish the call outcome in the room metadata (read by campaign_scheduler)"""
+    try:
+        await ctx.api.room.update_room_metadata(
+            api.UpdateRoomMetadataRequest(room=ctx.room.name, metadata=json.dumps({"call_outcome": outcome}))
+        )
+    except Exception as e:
+        log.warning(f"Could not record call outcome '{outcome}': {type(e).__name__}")
+
+# ─────────────────────── Worker prewarm ───────────────────────
+AGENT_PREWARM = os.getenv("AGENT_PREWARM", "1") == "1"  # Set to 0 to compare job→dial latency without prewarm
+AGENT_PIPELINED_STARTUP = os.getenv("AGENT_PIPELINED_STARTUP", "1") == "1"  # Start the realtime session while ringing
+
+@dataclass
+class WorkerState:
+    """Process-level state shared by every job the process runs"""
+    personas: PersonaRegistry
+    turn_detection: TurnDetection
+    outbox: TranscriptOutbox
+    greeting_audio: Optional[GreetingAudioCache]
+    prewarmed: bool
+    load_ms: float
+
+    def realtime_model(self, persona: PersonaConfig, voice: str) -> openai.realtime.RealtimeModel:
+        return openai.realtime.RealtimeModel(
+            model=persona.model,
+            voice=voice,
+            temperature=persona.temperature,
+            turn_detection=self.turn_detection,
+        )
+
+def load_worker_state(prewarmed: bool = False) -> WorkerState:
+    """Load the persona registry, realtime config and outbox handle once per process"""
+    started = time.perf_counter()
+    state = WorkerState(
+        personas=PERSONA_REGISTRY,
+        turn_detection=TurnDetection(
+            type="semantic_vad",
+            eagerness="auto",
+            create_response=True,
+            interrupt_response=True,
+        ),
+        outbox=get_outbox(),
+        greeting_audio=GreetingAudioCache() if GREETING_AUDIO_CACHE else None,
+        prewarmed=prewarmed,
+        load_ms=0.0,
+    )
+    PERSONA_REGISTRY.start_watching()
+    # Touch the voice mapping and time zone so first use in a call is a lookup
+    detect_gender_from_name("Maria")
+    datetime.now(PORTUGAL_TZ)
+    state.load_ms = (time.perf_counter() - started) * 1000
+    return state
+
+_background_tasks: set = set()
+
+def run_in_background(coro) -> asyncio.Task:
+    """Fire-and-forget a coroutine on the job's loop, keeping a reference until it finishes"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def hang_up(ctx: JobContext, reason: str, call_metadata: Dict[str, Any]):
+    """End the call from the agent side: deleting the room hangs up the SIP leg, then the job shuts down"""
+    call_metadata.setdefault("end_reason", reason)
+    try:
+        await ctx.api.room.delete_room(api.DeleteRoomRequest(room=ctx.room.name))
+    except Exception as e:
+        log.warning(f"Could not delete room {ctx.room.name}: {type(e).__name__}")
+    ctx.shutdown(reason=reason)  # the shutdown callbacks still send the transcript
+
+def leave_call(ctx: JobContext, reason: str, call_metadata: Dict[str, Any]):
+    """Shut the job down but keep the room, e.g. once a warm transfer bridged caller and human"""
+    call_metadata.setdefault("end_reason", reason)
+    ctx.shutdown(reason=reason)
+
+def set_caller_audio(session: AgentSession, enabled: bool):
+    """Stop/resume feeding the caller's audio to the realtime model"""
+    try:
+        session.input.set_audio_enabled(enabled)
+    except Exception as e:
+        log.debug(f"Could not toggle session audio input: {type(e).__name__}")
+
+async def screen_answer(
+    ctx: JobContext, session: AgentSession, state: WorkerState, persona: str, persona_config: PersonaConfig,
+    voice: str, caller_identity: str, call_metadata: Dict[str, Any], answered_reported: asyncio.Task,
+) -> bool:
+    """
+    Answering-machine detection on the callee's first seconds (see amd.py).
+
+    Returns True when a person (or nothing conclusive) answered. On a machine
+    the persona's voicemail is left after the beep, if it has one, the call is
+    hung up and the job shut down; returns False.
+    """
+    audio = caller_audio(ctx.room, caller_identity)
+    set_caller_audio(session, False)  # the model must not answer the machine's greeting
+    try:
+        result = await detect_answering_machine(audio)
+        record = call_metadata["amd"] = result.as_dict()
+        if result.result != "machine":
+            record["action"] = "continue"
+            AMD_RESULTS.inc(result=result.result, action="continue")
+            log.info(f"📠 AMD: {result.result} ({result.reason}) after {result.decision_ms:.0f}ms")
+            return True
+
+        log.info(f"📠 AMD: answering machine ({result.reason}) after {result.decision_ms:.0f}ms")
+        record["action"] = "hangup"
+        voicemail = persona_config.voicemail
+        if voicemail:
+            record["greeting_end"] = await wait_for_greeting_end(audio)
+            pcm = None
+            if state.greeting_audio is not None:
+                pcm = state.greeting_audio.get(persona, voice, voicemail)
+                if pcm is None:
+                    pcm = await state.greeting_audio.render(persona, voice, voicemail)
+            if pcm is not None:
+                await session.say(voicemail, audio=pcm_frames(pcm), add_to_chat_ctx=True)
+            else:
+                await session.generate_reply(
+                    instructions=f"Diz apenas '{voicemail}' usando EXCLUSIVAMENTE Português de Portugal."
+                )
+            record["action"] = "voicemail"
+    finally:
+        await audio.aclose()
+        if call_metadata.get("amd", {}).get("result") != "machine":
+            set_caller_audio(session, True)
+
+    AMD_RESULTS.inc(result="machine", action=record["action"])
+    await answered_reported  # so "answered" cannot overwrite the outcome below
+    await report_call_outcome(ctx, "voicemail" if record["action"] == "voicemail" else "machine")
+    await hang_up(ctx, f"amd_{record['action']}", call_metadata)
+    return False
+
+def prewarm(proc: JobProcess):
+    """WorkerOptions.prewarm_fnc: runs in each job process before it is handed a job"""
+    start_snapshot_writer(AGENT_METRICS_DIR)
+    proc.userdata["worker_state"] = load_worker_state(prewarmed=True)
+    log.info(f"🔥 Job process prewarmed in {proc.userdata['worker_state'].load_ms:.1f}ms")
+
+def get_worker_state(ctx: JobContext) -> WorkerState:
+    state = ctx.proc.userdata.get("worker_state")
+    if state is None:
+        start_snapshot_writer(AGENT_METRICS_DIR)
+        state = ctx.proc.userdata["worker_state"] = load_worker_state()
+    return state
+
+async def call_ended():
+    """Shutdown callback for answered calls"""
+    ACTIVE_CALLS.dec()
+    flush_snapshot()
 
 # ─────────────────────── Entrypoint LiveKit ───────────────────────
 async def entrypoint(ctx: JobContext):
     """Ponto de entrada principal do agente adaptável para diferentes personas"""
+    job_received = time.perf_counter()
     try:
         log.info(f"Received job: id={ctx.job.id}, room={ctx.room.name}")
-        session_start_time = datetime.now(ZoneInfo("Europe/Lisbon"))
+        state = get_worker_state(ctx)
+        session_start_time = datetime.now(PORTUGAL_TZ)
 
         # Extract metadata
         try:
@@ -744,6 +490,16 @@ async def entrypoint(ctx: JobContext):
             log.warning(f"Invalid metadata JSON format: {e}. Using empty metadata.")
             metadata = {}
 
+        # 🧭 Trace context from the backend: one trace per website_request_id
+        website_request_id = metadata.get("website_request_id")
+        trace_parent = metadata.get("trace_parent_id")
+        set_log_context(job_id=ctx.job.id, website_request_id=website_request_id)
+        if metadata.get("dispatched_at"):
+            tracer.record(
+                "job.pickup", website_request_id, float(metadata["dispatched_at"]), time.time(), trace_parent,
+                job_id=ctx.job.id, prewarmed=state.prewarmed
+            )
+
         # Extract persona and customer information
         persona = metadata.get("persona", "default")
         phone_number = metadata.get("phone_number", DEFAULT_FALLBACK_PHONE)  # Use default fallback
@@ -760,85 +516,204 @@ async def entrypoint(ctx: JobContext):
             "persona": persona,
             "phone_number": phone_number,
             "customer_name": customer_name,
+            "website_request_id": website_request_id,
+            "trace_parent_id": trace_parent,
             "job_metadata": metadata
         }
 
-        # Determine appropriate voice based on agent's gender
-        selected_voice = "coral"  # Default female voice
-        if persona == "custom":
-            custom_agent_data = metadata.get("custom_agent_data")
-            if custom_agent_data:
-                agent_identity = custom_agent_data.get('agent_identity', '')
-                detected_gender = detect_gender_from_name(agent_identity)
-                selected_voice = get_voice_for_gender(detected_gender)
-                log.info(f"Agent '{agent_identity}' detected as {detected_gender}, using voice: {selected_voice}")
+        # Model, voice, temperature, tools and prompts all come from the persona registry
+        persona_config = await state.personas.aget(persona)
+        selected_voice = persona_config.voice
+        custom_agent_data = metadata.get("custom_agent_data")
+        if persona_config.voice_by_gender and custom_agent_data:
+            # Match the voice to the custom agent's gender
+            agent_identity = custom_agent_data.get('agent_identity', '')
+            detected_gender = detect_gender_from_name(agent_identity)
+            selected_voice = get_voice_for_gender(detected_gender)
+            log.info(f"Agent '{agent_identity}' detected as {detected_gender}, using voice: {selected_voice}")
         
         # Configure realtime model
         log.debug("Configuring realtime model")
-        realtime_model = openai.realtime.RealtimeModel(
-            model="gpt-4o-mini-realtime-preview-2024-12-17",
-            voice=selected_voice,  # Gender-appropriate voice
-            temperature=0.9,  # Lower temperature for more consistent language style
-            turn_detection=TurnDetection(
-                type="semantic_vad",
-                eagerness="auto",
-                create_response=True,
-                interrupt_response=True,
-            ),
-        )
+        realtime_model = state.realtime_model(persona_config, selected_voice)
 
         # Build the system prompt based on the persona
-        system_prompt = await get_system_prompt(metadata)
-        agent = Agent(instructions=system_prompt)
-        session = AgentSession(llm=realtime_model)
+        system_prompt = state.personas.system_prompt(metadata)
+        tool_names = tuple(name for name in persona_config.tools if name not in UNAVAILABLE_TOOLS)
+        agent = Agent(instructions=system_prompt, tools=resolve_tools(tool_names))
+        # Tools get the call's room, SIP identity and API client through the session userdata
+        tool_ctx = ToolContext.for_call(
+            ctx.room.name, phone_number, ctx.api, TRANSFER_PHONE_NUMBERS, metadata,
+            transfer_mode=TRANSFER_MODE, sip_trunk_id=SIP_TRUNK_ID, call_record=call_metadata,
+            end_call=lambda reason: leave_call(ctx, reason, call_metadata),
+        )
+        session = AgentSession(llm=realtime_model, userdata=tool_ctx)
+        call_metadata["model"] = persona_config.model
+        call_metadata["temperature"] = persona_config.temperature
+
+        # 💶 Realtime tokens per response, priced with the trunk minutes when the call ends
+        usage = CallUsage(persona, persona_config.model)
+        session.on("metrics_collected", usage.add)
+
+        # 📝 Journal each finished turn to disk as it happens
+        journal = TranscriptJournal(ctx.job.id, call_metadata, session_start_time)
+
+        @session.on("conversation_item_added")
+        def _on_conversation_item(ev):
+            text = getattr(ev.item, "text_content", None)
+            if text:
+                journal.append(ev.item.role, text)
 
         # 📋 ADD TRANSCRIPT WEBHOOK CALLBACK
         log.info("🔗 Configurando callback para envio de transcript...")
         ctx.add_shutdown_callback(
-            lambda: save_transcript_to_webhook(session, call_metadata, session_start_time)
+            lambda: save_transcript_to_webhook(call_metadata, session_start_time, journal, usage)
         )
         log.info("✅ Callback de transcript configurado - será executado ao final da chamada")
 
+        # ⏱️ Answer→first-audio instrumentation (reported in the webhook payload)
+        timings = call_metadata["timings"] = {"pipelined_startup": AGENT_PIPELINED_STARTUP}
+        answered_at: Optional[float] = None
+        answered_wall = 0.0
+
+        @session.on("agent_state_changed")
+        def _on_agent_state_changed(ev):
+            if ev.new_state == "speaking" and answered_at is not None and "answer_to_first_audio_ms" not in timings:
+                timings["answer_to_first_audio_ms"] = round((time.perf_counter() - answered_at) * 1000, 1)
+                ANSWER_TO_FIRST_AUDIO.observe(
+                    timings["answer_to_first_audio_ms"] / 1000,
+                    greeting_audio_cached=timings.get("greeting_audio_cached", False)
+                )
+                tracer.record(
+                    "agent.first_audio", website_request_id, answered_wall, time.time(), trace_parent,
+                    pipelined=AGENT_PIPELINED_STARTUP, greeting_audio_cached=timings.get("greeting_audio_cached", False)
+                )
+                log.info(
+                    f"⏱️ Answer→first audio {timings['answer_to_first_audio_ms']:.1f}ms "
+                    f"(pipelined={AGENT_PIPELINED_STARTUP})"
+                )
+
+        initial_greeting = state.personas.greeting(metadata)
+        # Only the greeting without the caller's name is cached; named greetings are spoken by the model
+        greeting_cacheable = (
+            state.greeting_audio is not None and initial_greeting == state.personas.greeting(nameless_metadata(metadata))
+        )
+        greeting_pcm = state.greeting_audio.get(persona, selected_voice, initial_greeting) if greeting_cacheable else None
+        timings["greeting_audio_cached"] = greeting_pcm is not None
+
         # 1. First, connect to LiveKit room
         log.debug("Connecting to room")
-        await ctx.connect()
+        with tracer.span("room.connect", website_request_id, trace_parent, room=ctx.room.name):
+            await ctx.connect()
         log.info("Connected to room successfully")
 
-        # 2. Initiate outbound call BEFORE starting the agent session
+        async def start_session():
+            with tracer.span("session.start", website_request_id, trace_parent, pipelined=AGENT_PIPELINED_STARTUP):
+                await session.start(agent, room=ctx.room)
+            if answered_at is None:
+                # Ringback and early media must not reach the model's VAD before the callee answers
+                set_caller_audio(session, False)
+
+        # 2. In pipelined mode, bring the realtime session up while the phone rings
+        session_start: Optional[asyncio.Task] = None
+        if AGENT_PIPELINED_STARTUP:
+            log.info("Starting agent session while dialing")
+            session_start = asyncio.create_task(start_session())
+
+        # 3. Initiate outbound call
         log.info(f"Dialing {phone_number}...")
         try:
             formatted_phone = phone_number.replace("tel:", "") if phone_number.startswith("tel:") else phone_number
             log.info(f"Attempting SIP call: trunk={SIP_TRUNK_ID}, to={formatted_phone}, from={CALLER_ID}")
-            await ctx.api.sip.create_sip_participant(
-                api.CreateSIPParticipantRequest(
-                    sip_trunk_id=SIP_TRUNK_ID,
-                    sip_call_to=formatted_phone,
-                    room_name=ctx.room.name,
-                    participant_identity=f"sip_{formatted_phone.replace('+', '')}",
-                    wait_until_answered=True,
-                    krisp_enabled=True
-                )
+            timings["job_to_dial_ms"] = round((time.perf_counter() - job_received) * 1000, 1)
+            log.info(
+                f"⏱️ Job→dial {timings['job_to_dial_ms']:.1f}ms "
+                f"(prewarmed={state.prewarmed}, state load {state.load_ms:.1f}ms)"
             )
+            with tracer.span("sip.ring", website_request_id, trace_parent, trunk=SIP_TRUNK_ID):
+                await ctx.api.sip.create_sip_participant(
+                    api.CreateSIPParticipantRequest(
+                        sip_trunk_id=SIP_TRUNK_ID,
+                        sip_call_to=formatted_phone,
+                        room_name=ctx.room.name,
+                        participant_identity=tool_ctx.sip_identity,
+                        wait_until_answered=True,
+                        krisp_enabled=True
+                    )
+                )
+            answered_at = time.perf_counter()
+            answered_wall = time.time()
+            usage.answered_at = answered_wall
+            tracer.record("sip.answer", website_request_id, answered_wall, answered_wall, trace_parent)
+            ACTIVE_CALLS.inc()
+            ctx.add_shutdown_callback(call_ended)
             log.info("SIP call initiated successfully")
         except Exception as e:
             log.error(f"Failed to initiate outbound call: {str(e)}")
             log.error(f"Call parameters: trunk={SIP_TRUNK_ID}, phone={formatted_phone}, room={ctx.room.name}")
             if hasattr(e, 'metadata') and e.metadata:
                 log.error(f"Error metadata: {e.metadata}")
+            if session_start is not None:
+                session_start.cancel()
+                try:
+                    await session.aclose()
+                except Exception as close_error:
+                    log.warning(f"Could not close pre-started session: {type(close_error).__name__}")
+            failure = classify_sip_failure(e)
+            SIP_FAILURES.inc(reason=failure)
+            flush_snapshot()
+            await report_call_outcome(ctx, failure)
             raise
 
-        # 3. Start agent session AFTER call is initiated
-        log.info("Starting agent session")
-        await session.start(agent, room=ctx.room)
+        # Publishing the outcome must not delay the first words
+        outcome_reported = asyncio.create_task(report_call_outcome(ctx, "answered"))
+
+        # 4. Attach the agent session (already warm in pipelined mode)
+        if session_start is not None:
+            await session_start
+            timings["session_ready_before_answer"] = True
+            if not AMD_ENABLED:
+                set_caller_audio(session, True)  # with AMD, screen_answer turns it back on for a person
+        else:
+            log.info("Starting agent session")
+            await start_session()
         log.info("Agent session started successfully")
 
-        # 4. Send greeting based on the persona
-        initial_greeting = await get_initial_greeting(metadata)
-        
+        # 5. Make sure a person answered before saying anything
+        if AMD_ENABLED:
+            amd_started = time.perf_counter()
+            human = await screen_answer(
+                ctx, session, state, persona, persona_config, selected_voice, tool_ctx.sip_identity, call_metadata,
+                outcome_reported,
+            )
+            timings["amd_ms"] = round((time.perf_counter() - amd_started) * 1000, 1)
+            if not human:
+                return
+
+        # 6. Send greeting based on the persona
         log.info(f"Call connected, sending initial greeting: '{initial_greeting}'")
-        await session.generate_reply(
-            instructions=f"Diz apenas '{initial_greeting}' usando EXCLUSIVAMENTE Português de Portugal (não do Brasil). Usa expressões, vocabulário e sotaque típicos de Portugal, nunca do Brasil. Espera pela resposta."
+        if greeting_pcm is not None:
+            # 🔊 Play the pre-synthesized greeting; the model takes over from the callee's reply
+            await session.say(initial_greeting, audio=pcm_frames(greeting_pcm), add_to_chat_ctx=True)
+        else:
+            await session.generate_reply(
+                instructions=f"Diz apenas '{initial_greeting}' usando EXCLUSIVAMENTE Português de Portugal (não do Brasil). Usa expressões, vocabulário e sotaque típicos de Portugal, nunca do Brasil. Espera pela resposta."
+            )
+            if greeting_cacheable and state.greeting_audio.should_render(persona, selected_voice, initial_greeting):
+                # Render it for the next nameless call of this persona and voice
+                run_in_background(state.greeting_audio.render(persona, selected_voice, initial_greeting))
+        await outcome_reported
+
+        # 7. Bound the call: silent lines and overlong calls get a goodbye and a hang-up
+        watchdog = CallWatchdog(
+            session,
+            lambda reason: hang_up(ctx, reason, call_metadata),
+            call_metadata,
+            max_duration=persona_config.max_call_seconds,
+            # A warm transfer keeps the caller on hold (silent) while a human is rung and briefed
+            suspended=lambda: tool_ctx.transfer_task is not None and not tool_ctx.transfer_task.done(),
         )
+        watchdog.start()
+        ctx.add_shutdown_callback(watchdog.stop)
         
         log.info("Initial greeting sent, waiting for client response")
         log.info("📋 Transcript será automaticamente capturado e enviado para webhook ao final da chamada")
@@ -849,6 +724,22 @@ async def entrypoint(ctx: JobContext):
 
 # ─────────────────────── Run worker ───────────────────────
 if __name__ == "__main__":
-    cli.run_app(
-        WorkerOptions(entrypoint_fnc=entrypoint, worker_type=WorkerType.ROOM, agent_name="outbound-agent")
-    ) 
\ No newline at end of file
+    start_snapshot_writer(AGENT_METRICS_DIR)  # the outbox drainer runs in this process
+    if TRANSCRIPT_OUTBOX_DRAINER:
+        # Keep shipping journals whose job ended without queuing them, and draining the outbox
+        start_journal_recovery(TRANSCRIPT_OUTBOX_PATH)
+        start_background_drainer(TRANSCRIPT_OUTBOX_PATH)
+    # Report CPU, memory and open call slots so LiveKit stops routing to a saturated worker
+    worker_load = WorkerLoad()
+    log.info(f"🚦 Admission control: max {worker_load.max_calls or 'unlimited'} calls, load threshold {worker_load.threshold}")
+    worker_options = dict(
+        entrypoint_fnc=entrypoint,
+        worker_type=WorkerType.ROOM,
+        agent_name="outbound-agent",
+        load_fnc=worker_load.load,
+        load_threshold=worker_load.threshold,
+        request_fnc=worker_load.request,
+    )
+    if AGENT_PREWARM:
+        worker_options["prewarm_fnc"] = prewarm
+    cli.run_app(WorkerOptions(**worker_options)) 
\ No newline at end of file
@@ -0,0 +1,386 @@
+"""
+Per-tenant persona definitions in SQLite or Postgres, behind an in-process cache.
+
+A tenant persona is addressed as "<tenant_id>:<persona_key>" wherever a persona
+key is accepted (start_call bodies, campaigns, job metadata). Its definition is a
+JSON object in the same format as a PERSONA_REGISTRY_FILE entry (see config.py):
+
+    {"template": "clinica", "business_name": "Clínica Dentária Luz", "voice": "shimmer"}
+
+Stores share one interface (`PersonaStore`) and are picked with
+`create_persona_store` / the PERSONA_STORE_BACKEND environment variable:
+
+- none:     no tenant personas (default)
+- sqlite:   tenant_personas table in a WAL file shared by the processes on one host
+- postgres: the Supabase `public.tenant_personas` table, shared across hosts
+
+TenantPersonaCache is read-through with a TTL for found personas and a shorter
+one for missing keys (negative caching), so a hot persona is a dict hit. Edits
+are pushed to every process: a trigger NOTIFYs the `persona_changed` channel
+(Postgres) or appends to the tenant_persona_changes log (SQLite), and a
+listener thread drops the affected cache entries.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Generic, Optional, Tuple, TypeVar
+
+from metrics import Counter
+
+log = logging.getLogger("persona_store")
+
+PERSONA_CACHE_TTL = float(os.getenv("PERSONA_CACHE_TTL", "300"))  # seconds a found persona is served from cache
+PERSONA_NEGATIVE_TTL = float(os.getenv("PERSONA_NEGATIVE_TTL", "30"))  # seconds a missing persona is remembered
+PERSONA_CACHE_SIZE = int(os.getenv("PERSONA_CACHE_SIZE", "1024"))  # tenant personas kept per process
+PERSONA_CHANGES_POLL = float(os.getenv("PERSONA_CHANGES_POLL", "1"))  # SQLite change-log poll / Postgres stop check interval
+
+TENANT_SEPARATOR = ":"
+TENANT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+NOTIFY_CHANNEL = "persona_changed"
+
+PERSONA_CACHE_LOOKUPS = Counter(
+    "persona_cache_lookups_total", "Tenant persona lookups by cache result", ["result"]
+)
+
+def split_tenant_key(persona_key: str) -> Optional[Tuple[str, str]]:
+    """(tenant_id, persona_key) for a "<tenant_id>:<persona_key>" key, None for global personas"""
+    tenant_id, separator, key = persona_key.partition(TENANT_SEPARATOR)
+    if not separator or not key or not TENANT_ID_PATTERN.match(tenant_id):
+        return None
+    return tenant_id, key
+
+class PersonaStore:
+    """Interface implemented by every tenant persona backend"""
+
+    def fetch(self, tenant_id: str, persona_key: str) -> Optional[Dict[str, Any]]:
+        """The persona's definition, or None if the tenant has no such persona"""
+        raise NotImplementedError
+
+    def save(self, tenant_id: str, persona_key: str, definition: Dict[str, Any]):
+        raise NotImplementedError
+
+    def delete(self, tenant_id: str, persona_key: str):
+        raise NotImplementedError
+
+    def listen(self, on_change: Callable[[Optional[str], Optional[str]], None], stop: threading.Event):
+        """
+        Block until `stop` is set, calling on_change(tenant_id, persona_key) for every
+        edited persona; on_change(None, None) means changes may have been missed.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+_SQLITE_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS tenant_personas ("
+    " tenant_id TEXT NOT NULL,"
+    " persona_key TEXT NOT NULL,"
+    " definition TEXT NOT NULL,"
+    " updated_at REAL NOT NULL,"
+    " PRIMARY KEY (tenant_id, persona_key))",
+    "CREATE TABLE IF NOT EXISTS tenant_persona_changes ("
+    " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+    " tenant_id TEXT NOT NULL,"
+    " persona_key TEXT NOT NULL)",
+    *(
+        f"CREATE TRIGGER IF NOT EXISTS tenant_personas_{event.lower()} AFTER {event} ON tenant_personas BEGIN"
+        f" INSERT INTO tenant_persona_changes (tenant_id, persona_key) VALUES ({row}.tenant_id, {row}.persona_key);"
+        " END"
+        for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD"))
+    ),
+)
+
+class SQLitePersonaStore(PersonaStore):
+    """
+    Tenant personas in a SQLite file (WAL mode) shared by the backend and agent on one host.
+
+    Triggers append every edit to tenant_persona_changes, which listen() tails.
+    Each thread gets its own connection.
+    """
+
+    CHANGE_LOG_SIZE = 10_000  # change rows kept for listeners that fall behind
+
+    def __init__(self, path: str, poll_interval: float = PERSONA_CHANGES_POLL, busy_timeout_ms: int = 5000):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._connect()  # create the schema eagerly so misconfiguration fails at startup
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in _SQLITE_SCHEMA:
+                conn.execute(statement)
+            self._local.conn = conn
+        return conn
+
+    def fetch(self, tenant_id: str, persona_key: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            "SELECT definition FROM tenant_personas WHERE tenant_id = ? AND persona_key = ?",
+            (tenant_id, persona_key),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, tenant_id: str, persona_key: str, definition: Dict[str, Any]):
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO tenant_personas (tenant_id, persona_key, definition, updated_at) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT (tenant_id, persona_key) DO UPDATE SET"
+            " definition = excluded.definition, updated_at = excluded.updated_at",
+            (tenant_id, persona_key, json.dumps(definition, ensure_ascii=False), time.time()),
+        )
+        conn.execute(
+            "DELETE FROM tenant_persona_changes WHERE id <= (SELECT MAX(id) FROM tenant_persona_changes) - ?",
+            (self.CHANGE_LOG_SIZE,),
+        )
+
+    def delete(self, tenant_id: str, persona_key: str):
+        self._connect().execute(
+            "DELETE FROM tenant_personas WHERE tenant_id = ? AND persona_key = ?", (tenant_id, persona_key)
+        )
+
+    def listen(self, on_change: Callable[[Optional[str], Optional[str]], None], stop: threading.Event):
+        conn = self._connect()
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM tenant_persona_changes").fetchone()[0]
+        on_change(None, None)  # anything cached before we started tailing
+        while not stop.wait(self.poll_interval):
+            rows = conn.execute(
+                "SELECT id, tenant_id, persona_key FROM tenant_persona_changes WHERE id > ? ORDER BY id",
+                (last_id,),
+            ).fetchall()
+            if rows and rows[0][0] > last_id + 1:
+                on_change(None, None)  # the log was pruned past our position
+            for last_id, tenant_id, persona_key in rows:
+                on_change(tenant_id, persona_key)
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+class PostgresPersonaStore(PersonaStore):
+    """
+    Tenant personas in the Supabase `public.tenant_personas` table.
+
+    Requires supabase/migrations/20261016010000_create_tenant_personas_table.sql
+    (table + NOTIFY trigger) and the optional `psycopg` package (3.2+ for
+    notifies with a timeout).
+    """
+
+    def __init__(self, dsn: str):
+        try:
+            import psycopg
+        except ImportError as e:
+            raise RuntimeError("PERSONA_STORE_BACKEND=postgres requires the 'psycopg' package") from e
+        self._psycopg = psycopg
+        self.dsn = dsn
+        self._local = threading.local()
+        self._connect()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or conn.closed:
+            conn = self._psycopg.connect(self.dsn, autocommit=True)
+            self._local.conn = conn
+        return conn
+
+    def _execute(self, sql: str, params: tuple):
+        try:
+            return self._connect().execute(sql, params)
+        except self._psycopg.OperationalError:
+            # Stale connection (e.g. pooler restart); reconnect once
+            self.close()
+            return self._connect().execute(sql, params)
+
+    def fetch(self, tenant_id: str, persona_key: str) -> Optional[Dict[str, Any]]:
+        row = self._execute(
+            "SELECT definition FROM public.tenant_personas WHERE tenant_id = %s AND persona_key = %s",
+            (tenant_id, persona_key),
+        ).fetchone()
+        return row[0] if row else None  # jsonb arrives as a dict
+
+    def save(self, tenant_id: str, persona_key: str, definition: Dict[str, Any]):
+        self._execute(
+            "INSERT INTO public.tenant_personas (tenant_id, persona_key, definition) VALUES (%s, %s, %s::jsonb)"
+            " ON CONFLICT (tenant_id, persona_key) DO UPDATE SET definition = excluded.definition, updated_at = now()",
+            (tenant_id, persona_key, json.dumps(definition, ensure_ascii=False)),
+        )
+
+    def delete(self, tenant_id: str, persona_key: str):
+        self._execute(
+            "DELETE FROM public.tenant_personas WHERE tenant_id = %s AND persona_key = %s", (tenant_id, persona_key)
+        )
+
+    def listen(self, on_change: Callable[[Optional[str], Optional[str]], None], stop: threading.Event):
+        backoff = 1.0
+        while not stop.is_set():
+            try:
+                with self._psycopg.connect(self.dsn, autocommit=True) as conn:
+                    conn.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                    on_change(None, None)  # anything edited while we were not listening
+                    backoff = 1.0
+                    # Wake up every PERSONA_CHANGES_POLL seconds so stop is seen and the connection closed
+                    while not stop.is_set():
+                        for notify in conn.notifies(timeout=PERSONA_CHANGES_POLL):
+                            tenant_id, _, persona_key = notify.payload.partition(TENANT_SEPARATOR)
+                            on_change(tenant_id, persona_key or None)  # bare tenant id: all its personas
+            except self._psycopg.OperationalError as e:
+                log.warning(f"⚠️ Persona change listener disconnected, retrying in {backoff:.0f}s: {e}")
+                stop.wait(backoff)
+                backoff = min(backoff * 2, 60.0)
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+PERSONA_STORE_BACKENDS = ("none", "sqlite", "postgres")
+
+def create_persona_store(backend: Optional[str] = None) -> Optional[PersonaStore]:
+    """Build the configured persona store (defaults to PERSONA_STORE_BACKEND, then 'none')"""
+    backend = (backend or os.getenv("PERSONA_STORE_BACKEND", "none")).lower()
+
+    if backend == "none":
+        return None
+    if backend == "sqlite":
+        return SQLitePersonaStore(os.getenv("PERSONA_SQLITE_PATH", "personas.db"))
+    if backend == "postgres":
+        dsn = os.getenv("PERSONA_DATABASE_URL")
+        if not dsn:
+            raise ValueError("PERSONA_DATABASE_URL is required for PERSONA_STORE_BACKEND=postgres")
+        return PostgresPersonaStore(dsn)
+
+    raise ValueError(f"Invalid PERSONA_STORE_BACKEND '{backend}'. Allowed: {', '.join(PERSONA_STORE_BACKENDS)}")
+
+T = TypeVar("T")
+MISS = object()  # peek() result when the cache cannot answer
+
+class TenantPersonaCache(Generic[T]):
+    """
+    Read-through TTL cache of built tenant personas with negative caching.
+
+    `build(tenant_id, persona_key, definition)` turns a stored definition into the
+    cached value; definitions it rejects with ValueError are cached as missing.
+    If the store fails, a stale entry is served rather than failing the call,
+    and that answer is kept for negative_ttl so the outage is not hit on every call.
+    """
+
+    def __init__(
+        self,
+        store: PersonaStore,
+        build: Callable[[str, str, Dict[str, Any]], T],
+        ttl: float = PERSONA_CACHE_TTL,
+        negative_ttl: float = PERSONA_NEGATIVE_TTL,
+        max_entries: int = PERSONA_CACHE_SIZE,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.store = store
+        self.build = build
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Optional[T]]]" = OrderedDict()
+        self._generation = 0  # bumped by every invalidation so in-flight loads are not cached
+        self._lock = threading.Lock()
+        self._listener_pid: Optional[int] = None
+        self._stop = threading.Event()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def peek(self, tenant_id: str, persona_key: str):
+        """The cached value if it is still fresh, else MISS (never touches the store)"""
+        with self._lock:
+            entry = self._entries.get((tenant_id, persona_key))
+        if entry is None or entry[0] <= self._clock():
+            return MISS
+        return entry[1]
+
+    def get(self, tenant_id: str, persona_key: str) -> Optional[T]:
+        key = (tenant_id, persona_key)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                PERSONA_CACHE_LOOKUPS.inc(result="hit" if entry[1] is not None else "negative_hit")
+                return entry[1]
+            generation = self._generation
+
+        try:
+            definition = self.store.fetch(tenant_id, persona_key)
+        except Exception as e:
+            PERSONA_CACHE_LOOKUPS.inc(result="error")
+            log.error(f"❌ Persona store lookup failed for {tenant_id}{TENANT_SEPARATOR}{persona_key}: {type(e).__name__}: {e}")
+            value = entry[1] if entry is not None else None
+            self._store(key, generation, value, self.negative_ttl)
+            return value
+        PERSONA_CACHE_LOOKUPS.inc(result="miss")
+
+        value = None
+        if definition is not None:
+            try:
+                value = self.build(tenant_id, persona_key, definition)
+            except (ValueError, TypeError, KeyError) as e:
+                log.error(f"❌ Invalid persona {tenant_id}{TENANT_SEPARATOR}{persona_key}: {type(e).__name__}: {e}")
+
+        self._store(key, generation, value, self.ttl if value is not None else self.negative_ttl)
+        return value
+
+    def _store(self, key: Tuple[str, str], generation: int, value: Optional[T], ttl: float):
+        """Cache `value` unless an invalidation happened since `generation` was read"""
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (self._clock() + ttl, value)
+                self._entries.move_to_end(key)
+                if len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+    def invalidate(self, tenant_id: Optional[str] = None, persona_key: Optional[str] = None):
+        """Drop one persona, all of a tenant's personas, or (no arguments) everything"""
+        with self._lock:
+            self._generation += 1
+            if tenant_id is None:
+                self._entries.clear()
+            elif persona_key is not None:
+                self._entries.pop((tenant_id, persona_key), None)
+            else:
+                for key in [key for key in self._entries if key[0] == tenant_id]:
+                    del self._entries[key]
+
+    def start_listening(self):
+        """Apply pushed invalidations from a daemon thread (once per process; forked children start their own)"""
+        if self._listener_pid == os.getpid():
+            return
+        self._listener_pid = os.getpid()
+        self._stop = threading.Event()
+
+        def listen():
+            try:
+                self.store.listen(self.invalidate, self._stop)
+            except Exception as e:
+                # Without pushes, entries still expire after PERSONA_CACHE_TTL
+                log.error(f"❌ Persona change listener stopped: {type(e).__name__}: {e}")
+
+        threading.Thread(target=listen, name="persona-change-listener", daemon=True).start()
+
+    def stop_listening(self):
+        self._stop.set()
+        self._listener_pid = None
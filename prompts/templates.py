@@ -0,0 +1,372 @@
+"""
+Precompiled persona prompt templates.
+
+Each persona's system prompt and greeting are compiled once (at import, i.e. at
+worker start): everything that does not change between calls - persona names,
+the base instructions, the fixed call objectives - is folded into static text,
+leaving only the per-call slots (customer name, Lisbon time and day, extra
+instructions). Rendering a prompt is then a single join.
+
+Custom personas are fully determined by their custom_agent_data, so their
+rendered prompts are kept in an LRU cache keyed on the normalized fields.
+
+The persona registry that maps persona keys to these templates (together with
+model, voice, temperature and tools) lives in config.py.
+"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass, replace
+from datetime import datetime
+from functools import lru_cache
+from string import Formatter
+from typing import Any, Callable, Dict, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", "256"))  # distinct custom personas kept rendered
+
+PORTUGAL_TZ = ZoneInfo("Europe/Lisbon")
+DAYS_PT = (  # indexed by datetime.weekday()
+    "Segunda-feira", "Terça-feira", "Quarta-feira", "Quinta-feira", "Sexta-feira", "Sábado", "Domingo"
+)
+
+Slots = Dict[str, str]
+SlotBuilder = Callable[[Dict[str, Any]], Slots]
+
+class PromptTemplate:
+    """
+    A prompt split once into static text and named slots.
+
+    `{field}` placeholders whose values are passed as keyword arguments are folded
+    into the static text at compile time; the remaining ones become slots that
+    render() fills per call.
+    """
+
+    __slots__ = ("_pieces", "slots")
+
+    def __init__(self, source: str, **static: Any):
+        pieces = []
+        slots = []
+        buffer = []
+        for literal, field, spec, conversion in Formatter().parse(source):
+            buffer.append(literal)
+            if field is None:
+                continue
+            if spec or conversion:
+                raise ValueError(f"Format specs are not supported in prompt templates: {field}")
+            if field in static:
+                buffer.append(str(static[field]))
+            else:
+                pieces.append("".join(buffer))
+                buffer = []
+                slots.append(field)
+        pieces.append("".join(buffer))
+        self._pieces: Tuple[str, ...] = tuple(pieces)
+        self.slots: Tuple[str, ...] = tuple(slots)
+
+    def render(self, values: Slots) -> str:
+        pieces = self._pieces
+        if not self.slots:
+            return pieces[0]
+        out = [pieces[0]]
+        for index, slot in enumerate(self.slots, 1):
+            out.append(values[slot])
+            out.append(pieces[index])
+        return "".join(out)
+
+@dataclass(frozen=True)
+class CompiledPersona:
+    prompt: PromptTemplate
+    greeting: PromptTemplate
+    prompt_slots: SlotBuilder
+    greeting_slots: SlotBuilder
+
+# ─────────────────────── Template sources ───────────────────────
+BASE_AGENT_INSTRUCTIONS = (
+    "Você é um assistente de IA conversacional amigável e útil. "
+    "Seja conciso e direto ao ponto, a menos que seja solicitado o contrário. "
+    "NUNCA invente respostas. Se você não sabe a resposta, diga que não sabe. "
+    "SEMPRE use EXCLUSIVAMENTE Português de Portugal (não do Brasil) em todas as interações. "
+    "Use expressões, vocabulário e construções frásicas típicas de Portugal, NUNCA do Brasil. "
+    "Evite termos brasileiros como 'você' (prefira 'tu' ou o formal 'o senhor/a senhora'), 'legal', 'a gente', etc. "
+    "Prefira dizer 'casa de banho' em vez de 'banheiro', 'autocarro' em vez de 'ônibus', 'pequeno-almoço' em vez de 'café da manhã'. "
+)
+
+COMMON_PROMPT = """O seu nome é {persona_title} e você é um {persona_display_name} amigável e prestável para uma demonstração.
+O nome do cliente é {customer_name}.
+
+Você foi contactado porque o cliente clicou no botão 'Experimenta Grátis' no nosso website para uma demonstração da persona '{persona_key}'.
+O objetivo principal desta chamada é demonstrar as suas capacidades de conversação como um {persona_display_name}.
+
+Instruções Chave:
+1.  Apresente-se cordialmente como o {persona_title}, um {persona_display_name}.
+2.  Confirme que esta é uma chamada de demonstração para a persona '{persona_key}'.
+3.  Mantenha a conversa curta e focada na demonstração.
+4.  Você pode fornecer informações genéricas sobre o tipo de tarefas que um {persona_display_name} como você poderia realizar no dia-a-dia.
+    Por exemplo:
+    - Se for 'restaurante': "Normalmente, eu poderia ajudar com reservas, pedidos de menu, ou informações sobre o nosso horário."
+    - Se for 'clinica': "Normalmente, eu poderia ajudar a marcar consultas, fornecer informações sobre os nossos tratamentos, ou dar moradas e contactos."
+    - Se for 'vendedor': "Normalmente, eu poderia apresentar produtos, verificar stock, ou ajudar a processar uma encomenda."
+    Adapte o exemplo à persona '{persona_key}'.
+5.  Após uma breve interação ou se o cliente perguntar como proceder, pode mencionar que, numa situação real, haveria mais ferramentas e informações disponíveis.
+6.  Se o cliente pedir para falar com um humano, quiser terminar a demonstração, ou se a conversa se desviar muito, utilize a ferramenta 'transfer_human' para encaminhar a chamada educadamente, mencionando que está a transferir para um colega humano.
+7.  Seja breve, educado e profissional.
+{base_instructions}
+"""
+
+COMMON_GREETING = "Olá{customer_name}! Sou o {persona_title}, o seu {persona_key} virtual para esta demonstração. Em que posso ser útil hoje?"
+
+PERSONA_DISPLAY_NAMES = {
+    "restaurante": "agente de apoio a restaurantes",
+    "clinica": "agente de apoio a clínicas dentárias",
+    "vendedor": "agente de vendas",
+    "assistente virtual": "assistente virtual"
+}
+
+CLINIC_PROMPT = (
+    "Função: És um assistente virtual da {business_name}. Estás a ligar a um utente que interagiu com o botão 'Experimenta Grátis' no website. "
+    "Usa EXCLUSIVAMENTE Português de Portugal (nunca do Brasil), com termos e expressões tipicamente portugueses. "
+    "{base_instructions}\n"
+    "HORA ATUAL: {current_time} de {current_day}.\n"
+    "{metadata_instructions}"
+    "\n\nOBJETIVO DA CHAMADA (FASE 1 - DEMONSTRAÇÃO SIMPLES):"
+    "\n1. Confirma que o utente se lembra de ter clicado no botão 'Experimenta Grátis' para a {business_short_name}."
+    "\n2. Explica brevemente que esta é uma demonstração da capacidade do nosso assistente virtual para marcar consultas ou dar informações básicas."
+    "\n3. Pergunta se o utente tem alguma questão simples sobre a clínica (ex: tipos de serviços gerais, localização genérica)."
+    "\n4. Se o utente quiser marcar uma consulta real ou tiver questões médicas complexas, informa que esta é uma demonstração e oferece transferir para um humano usando a ferramenta 'transfer_human'."
+    "\n5. Mantém a conversa curta e agradável."
+    "\n\nClínica Info Genérica (para a demo):"
+    "\n- Serviços: Consultas gerais, limpezas, branqueamentos."
+    "\n- Localização: Temos várias clínicas na cidade (não especificar morada exata)."
+    "\n- Marcações: Para marcações reais, o melhor é falar com a nossa receção."
+    "\n\nNÃO TENTES verificar disponibilidade real de horários ou marcar consultas nesta fase. Usa 'transfer_human' para esses casos."
+)
+
+CLINIC_GREETING = "Olá, {customer_name}, da {business_short_name}. Ligamos porque clicou no nosso botão 'Experimenta Grátis'. Como posso ajudar?"
+
+SALES_PROMPT = (
+    "Função: És um representante de vendas profissional da Chamada.ai para o nosso serviço 'Experimenta Grátis'. "
+    "Usa EXCLUSIVAMENTE Português de Portugal (nunca do Brasil), com linguagem formal mas acessível. "
+    "Utiliza sempre expressões, vocabulário e construções frásicas típicas de Portugal, NUNCA do Brasil. "
+    "{customer_specific}"
+    "{request_context}"
+    "{additional_instructions}\n\n"
+    "Objetivo da chamada:\n"
+    "1. Apresentar o serviço de chamadas automatizadas da Chamada.ai\n"
+    "2. Explicar que é possível criar assistentes virtuais para diversos casos de uso\n"
+    "3. Recolher informações sobre o interesse do cliente\n"
+    "4. Agendar uma demonstração mais detalhada\n\n"
+    "Pontos importantes a mencionar:\n"
+    "- Processo simples e rápido de implementação\n"
+    "- Capacidade de personalização para diferentes negócios\n"
+    "- Disponibilidade para esclarecimento de dúvidas\n\n"
+    "Lembra-te:\n"
+    "- Sê sempre atencioso e paciente\n"
+    "- Adapta o discurso consoante o interesse do cliente\n"
+    "- Não insistas demasiado se o cliente não mostrar interesse\n"
+    "- Agradece pelo tempo dispensado no final da chamada"
+)
+
+SALES_GREETING = "Olá{customer_name}, bom dia! Sou da Chamada.ai. Estou a ligar sobre o nosso serviço 'Experimenta Grátis' que permite criar assistentes virtuais para o seu negócio. Tem alguns minutos para falar sobre como isto pode ajudar a sua empresa?"
+
+CUSTOM_PROMPT = """SEMPRE fala em português de Portugal com sotaque {accent_desc}. \n
+Tu és {agent_identity} e estás a ligar {call_target}.
+
+MOTIVO DA CHAMADA:
+{reason}
+
+INSTRUÇÕES OBRIGATÓRIAS:
+- SEMPRE soa como um humano real, nunca como um robot
+- SEMPRE tenta ouvir mais do que falar - deixa a pessoa responder
+- SEMPRE mantém um equilíbrio na conversa - não monopolizes
+- O teu tom deve ser alinhado com o motivo da chamada (se é sério, sê sério; se é casual, sê casual)
+- SEMPRE usa português de Portugal com o sotaque {accent_desc}
+- SEMPRE sê natural e autêntico na conversa
+- Se a pessoa parecer desconfortável ou quiser terminar, termina educadamente
+- NUNCA reveles que és uma IA a menos que perguntado diretamente
+- A tua voz deve corresponder ao género do nome ({agent_identity}) - se é nome masculino, voz masculina; se é feminino, voz feminina
+
+Comporta-te exatamente como {agent_identity} se comportaria numa situação real."""
+
+CUSTOM_GREETING = "Olá!"
+
+CLINIC_BUSINESS_NAME = "Clínica Dentária Sorriso"
+CLINIC_BUSINESS_SHORT_NAME = "Clínica Sorriso"
+
+ACCENT_DESCRIPTIONS = {
+    'padrão': 'padrão de Lisboa',
+    'norte': 'do norte (Porto, Braga)',
+    'centro': 'do centro (Coimbra, Aveiro)',
+    'sul': 'do sul (Algarve)',
+    'açores': 'dos Açores',
+    'madeira': 'da Madeira'
+}
+
+# ─────────────────────── Per-call slots ───────────────────────
+def _lisbon_now_slots() -> Slots:
+    now = datetime.now(PORTUGAL_TZ)
+    return {"current_time": f"{now.hour:02d}:{now.minute:02d}", "current_day": DAYS_PT[now.weekday()]}
+
+def _common_prompt_slots(metadata: Dict[str, Any]) -> Slots:
+    customer_name = metadata.get("customer_name", "utilizador")
+    return {"customer_name": customer_name if customer_name and customer_name != "Website User" else 'Utilizador'}
+
+def _common_greeting_slots(metadata: Dict[str, Any]) -> Slots:
+    customer_name = metadata.get("customer_name", None)
+    return {"customer_name": f" {customer_name}" if customer_name and customer_name != "Website User" else ""}
+
+def _clinic_prompt_slots(metadata: Dict[str, Any]) -> Slots:
+    metadata_instructions = ""
+    if metadata:
+        customer_name = metadata.get("customer_name", "")
+        instructions = metadata.get("instructions", "")
+        if customer_name:
+            metadata_instructions += f"\n\nDirige-te ao utente como '{customer_name}'."
+        if instructions:
+            metadata_instructions += f"\nInstruções específicas para esta chamada: {instructions}"
+    slots = _lisbon_now_slots()
+    slots["metadata_instructions"] = metadata_instructions
+    return slots
+
+def _clinic_greeting_slots(metadata: Dict[str, Any]) -> Slots:
+    return {"customer_name": metadata.get("customer_name", "Utente")}
+
+def _sales_prompt_slots(metadata: Dict[str, Any]) -> Slots:
+    customer_name = metadata.get("customer_name", "")
+    website_request_id = metadata.get("website_request_id", "")
+    instructions = metadata.get("instructions", "")
+    return {
+        "customer_specific": f"\nDirige-te ao cliente como '{customer_name}'." if customer_name else "",
+        "request_context": f"\nPedido da web: {website_request_id}" if website_request_id else "",
+        "additional_instructions": f"\nInstruções específicas: {instructions}" if instructions else "",
+    }
+
+def _sales_greeting_slots(metadata: Dict[str, Any]) -> Slots:
+    customer_name = metadata.get("customer_name", "")
+    return {"customer_name": f" {customer_name}" if customer_name else ""}
+
+def _no_slots(metadata: Dict[str, Any]) -> Slots:
+    return {}
+
+def _generic_slots(metadata: Dict[str, Any]) -> Slots:
+    """Slots available to prompts defined in the persona registry file"""
+    customer_name = metadata.get("customer_name", "")
+    named = bool(customer_name) and customer_name != "Website User"
+    slots = _lisbon_now_slots()
+    slots.update({
+        "customer_name": customer_name if named else "Utilizador",
+        "greeting_name": f" {customer_name}" if named else "",
+        "instructions": metadata.get("instructions", ""),
+    })
+    return slots
+
+GENERIC_SLOTS = frozenset(_generic_slots({}))
+
+# ─────────────────────── Custom personas ───────────────────────
+_CUSTOM_TEMPLATE = PromptTemplate(CUSTOM_PROMPT)
+
+def normalize_custom_agent_data(custom_agent_data: Dict[str, Any]) -> Tuple[str, str, str, str]:
+    """(agent_identity, call_target, reason, accent description) - the custom prompt cache key"""
+    accent = str(custom_agent_data.get('accent') or 'padrão').strip().lower()
+    return (
+        str(custom_agent_data.get('agent_identity', '')).strip(),
+        str(custom_agent_data.get('call_target', '')).strip(),
+        str(custom_agent_data.get('reason', '')).strip(),
+        ACCENT_DESCRIPTIONS.get(accent, 'padrão de Lisboa'),
+    )
+
+@lru_cache(maxsize=PROMPT_CACHE_SIZE)
+def _render_custom_prompt(key: Tuple[str, str, str, str]) -> str:
+    agent_identity, call_target, reason, accent_desc = key
+    return _CUSTOM_TEMPLATE.render({
+        "agent_identity": agent_identity,
+        "call_target": call_target,
+        "reason": reason,
+        "accent_desc": accent_desc,
+    })
+
+def build_custom_agent_prompt(custom_agent_data: Dict[str, Any]) -> str:
+    """
+    Builds the system prompt for a custom agent from its structured data.
+
+    Args:
+        custom_agent_data: Dictionary containing agent_identity, call_target, reason, accent
+
+    Returns:
+        A complete system prompt for the custom agent (cached per distinct agent)
+    """
+    return _render_custom_prompt(normalize_custom_agent_data(custom_agent_data))
+
+custom_prompt_cache_info = _render_custom_prompt.cache_info
+
+# ─────────────────────── Compiled personas ───────────────────────
+def compile_common_persona(persona_key: str) -> CompiledPersona:
+    static = {
+        "persona_key": persona_key,
+        "persona_title": persona_key.capitalize(),
+        "persona_display_name": PERSONA_DISPLAY_NAMES.get(persona_key, "assistente virtual"),
+        "base_instructions": BASE_AGENT_INSTRUCTIONS,
+    }
+    return CompiledPersona(
+        prompt=PromptTemplate(COMMON_PROMPT, **static),
+        greeting=PromptTemplate(COMMON_GREETING, **static),
+        prompt_slots=_common_prompt_slots,
+        greeting_slots=_common_greeting_slots,
+    )
+
+def compile_clinic_persona(
+    business_name: str = CLINIC_BUSINESS_NAME, business_short_name: Optional[str] = None
+) -> CompiledPersona:
+    static = {
+        "base_instructions": BASE_AGENT_INSTRUCTIONS,
+        "business_name": business_name,
+        "business_short_name": business_short_name or business_name,
+    }
+    return CompiledPersona(
+        prompt=PromptTemplate(CLINIC_PROMPT, **static),
+        greeting=PromptTemplate(CLINIC_GREETING, **static),
+        prompt_slots=_clinic_prompt_slots,
+        greeting_slots=_clinic_greeting_slots,
+    )
+
+def compile_sales_persona() -> CompiledPersona:
+    return CompiledPersona(
+        prompt=PromptTemplate(SALES_PROMPT),
+        greeting=PromptTemplate(SALES_GREETING),
+        prompt_slots=_sales_prompt_slots,
+        greeting_slots=_sales_greeting_slots,
+    )
+
+# Built-in personas whose templates take the business name of the tenant using them
+BUSINESS_TEMPLATES: Dict[str, Callable[[str], CompiledPersona]] = {
+    "clinica": compile_clinic_persona,
+    "dentist": compile_clinic_persona,
+}
+
+def compile_text_persona(prompt: str, greeting: str, business_name: Optional[str] = None) -> CompiledPersona:
+    """Compile prompt/greeting texts from a persona definition; unknown slots raise ValueError"""
+    static = {"business_name": business_name} if business_name else {}
+    compiled = CompiledPersona(
+        prompt=PromptTemplate(prompt, base_instructions=BASE_AGENT_INSTRUCTIONS, **static),
+        greeting=PromptTemplate(greeting, **static),
+        prompt_slots=_generic_slots,
+        greeting_slots=_generic_slots,
+    )
+    unknown = set(compiled.prompt.slots + compiled.greeting.slots) - GENERIC_SLOTS
+    if unknown:
+        raise ValueError(f"Unknown prompt slot(s): {', '.join(sorted(unknown))} (available: {', '.join(sorted(GENERIC_SLOTS))})")
+    return compiled
+
+def builtin_personas() -> Dict[str, CompiledPersona]:
+    """Compiled templates of the built-in personas, by persona key (aliases share one object)"""
+    clinic = compile_clinic_persona(CLINIC_BUSINESS_NAME, CLINIC_BUSINESS_SHORT_NAME)
+    sales = compile_sales_persona()
+    personas = {"clinica": clinic, "dentist": clinic, "vendedor": sales, "sales": sales}
+    # Custom personas without custom_agent_data fall back to the common prompt
+    personas["custom"] = replace(
+        compile_common_persona("custom"), greeting=PromptTemplate(CUSTOM_GREETING), greeting_slots=_no_slots
+    )
+    for persona_key in ("restaurante", "clinica_dentaria", "default", "assistente virtual"):
+        personas[persona_key] = compile_common_persona(persona_key)
+    return personas
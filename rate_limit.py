@@ -0,0 +1,296 @@
+"""
+IP rate limiting for the call-dispatch backend.
+
+Stores share one interface (`RateLimitStore.hit`) and are picked with
+`create_rate_limit_store` / the RATE_LIMIT_BACKEND environment variable:
+
+- memory:   per-process sliding window (single worker only)
+- sqlite:   WAL file store shared by every worker on one host
+- postgres: the Supabase `backend_rate_limits` table, shared across hosts
+
+The database tables are the backend's own: the Next.js route keeps its
+per-IP cooldown in `rate_limits`, which these stores never touch.
+
+The database stores do blocking I/O (`blocking = True`); async callers run
+their `hit` in a thread. They also delete rows whose window has expired every
+RATE_LIMIT_PURGE_EVERY hits, so the table holds roughly the IPs seen in the
+last window instead of one row per IP ever seen.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+log = logging.getLogger("rate_limit")
+
+_NEVER = float("-inf")
+RATE_LIMIT_PURGE_EVERY = int(os.getenv("RATE_LIMIT_PURGE_EVERY", "1000"))  # hits between expired-row purges
+
+class _Window:
+    """Ring of the last `max_requests` accepted timestamps (epoch seconds) for one key"""
+    __slots__ = ("times", "pos", "newest")
+
+    def __init__(self, size: int):
+        self.times = [_NEVER] * size
+        self.pos = 0  # slot holding the oldest timestamp
+        self.newest = _NEVER
+
+class RateLimitStore:
+    """Interface implemented by every rate-limit backend"""
+
+    max_requests: int
+    window_seconds: float
+    blocking = False  # True when hit() does network/disk I/O
+
+    def hit(self, key: str, now: Optional[float] = None) -> bool:
+        """Record a request for `key`; returns False if it exceeds the limit"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class SlidingWindowRateLimiter(RateLimitStore):
+    """
+    Exact sliding-window limiter with constant-time checks and bounded memory.
+
+    Each key keeps only its last `max_requests` accepted timestamps in a ring, so a
+    check is a single comparison against the oldest slot. Keys are kept in LRU
+    order: idle keys whose whole window has expired are swept from the front on
+    every call, and the least recently seen key is evicted once `max_keys` is reached.
+    """
+
+    def __init__(
+        self,
+        max_requests: int,
+        window_seconds: float,
+        max_keys: int = 100_000,
+        clock: Callable[[], float] = time.time,
+    ):
+        if max_requests < 1:
+            raise ValueError("max_requests must be at least 1")
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self._clock = clock
+        self._entries: OrderedDict[str, _Window] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def hit(self, key: str, now: Optional[float] = None) -> bool:
+        """Record a request for `key`; returns False if it exceeds the limit"""
+        if now is None:
+            now = self._clock()
+        cutoff = now - self.window_seconds
+
+        with self._lock:
+            entries = self._entries
+            self._sweep(cutoff)
+
+            window = entries.get(key)
+            if window is None:
+                if len(entries) >= self.max_keys:
+                    entries.popitem(last=False)
+                window = _Window(self.max_requests)
+                entries[key] = window
+            else:
+                entries.move_to_end(key)
+
+            pos = window.pos
+            if window.times[pos] > cutoff:
+                return False
+
+            window.times[pos] = now
+            window.pos = (pos + 1) % self.max_requests
+            window.newest = now
+            return True
+
+    def remaining(self, key: str, now: Optional[float] = None) -> int:
+        """Number of requests `key` may still make in the current window"""
+        if now is None:
+            now = self._clock()
+        cutoff = now - self.window_seconds
+        with self._lock:
+            window = self._entries.get(key)
+            if window is None:
+                return self.max_requests
+            return sum(1 for t in window.times if t <= cutoff)
+
+    def _sweep(self, cutoff: float, budget: int = 8):
+        """Drop up to `budget` expired keys from the LRU front (amortised O(1))"""
+        entries = self._entries
+        while budget and entries:
+            key, window = next(iter(entries.items()))
+            if window.newest > cutoff:
+                return
+            del entries[key]
+            budget -= 1
+
+# Fixed window anchored at the first request, enforced in one statement: the
+# conflicting row is only updated (and so the request only accepted) while its
+# window has expired or it is still under the limit. Row locking makes
+# concurrent upserts for the same IP serialise, so the count can never overshoot.
+_UPSERT_SQL = """
+INSERT INTO {table} AS rl (ip_address, window_start, request_count)
+VALUES ({p}, {p}, 1)
+ON CONFLICT (ip_address) DO UPDATE SET
+    request_count = CASE WHEN rl.window_start <= {p} THEN 1 ELSE rl.request_count + 1 END,
+    window_start = CASE WHEN rl.window_start <= {p} THEN excluded.window_start ELSE rl.window_start END
+WHERE rl.window_start <= {p} OR rl.request_count < {p}
+"""
+
+def _upsert_params(key: str, now: int, cutoff: int, max_requests: int) -> tuple:
+    return (key, now, cutoff, cutoff, cutoff, max_requests)
+
+# Rows whose window has expired carry no state: the next hit would reset them anyway
+_PURGE_SQL = "DELETE FROM {table} WHERE window_start <= {p}"
+
+class SQLiteRateLimitStore(RateLimitStore):
+    """
+    Fixed-window counters in a SQLite file (WAL mode) shared by all workers on one host.
+
+    Each thread gets its own connection; SQLite serialises the upserts.
+    """
+    blocking = True
+
+    def __init__(self, path: str, max_requests: int, window_seconds: float, busy_timeout_ms: int = 5000,
+                 purge_every: int = RATE_LIMIT_PURGE_EVERY):
+        self.path = path
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self.busy_timeout_ms = busy_timeout_ms
+        self.purge_every = purge_every
+        self._hits = itertools.count(1)
+        self._local = threading.local()
+        self._sql = _UPSERT_SQL.format(table="backend_rate_limits", p="?")
+        self._purge_sql = _PURGE_SQL.format(table="backend_rate_limits", p="?")
+        self._connect()  # create the schema eagerly so misconfiguration fails at startup
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS backend_rate_limits ("
+                " ip_address TEXT PRIMARY KEY,"
+                " window_start INTEGER NOT NULL,"
+                " request_count INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS backend_rate_limits_window_start_idx ON backend_rate_limits (window_start)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def hit(self, key: str, now: Optional[float] = None) -> bool:
+        now = int(time.time() if now is None else now)
+        cutoff = now - int(self.window_seconds)
+        conn = self._connect()
+        cursor = conn.execute(self._sql, _upsert_params(key, now, cutoff, self.max_requests))
+        if self.purge_every and next(self._hits) % self.purge_every == 0:
+            self.purge(cutoff, conn)
+        return cursor.rowcount == 1
+
+    def purge(self, cutoff: int, conn: Optional[sqlite3.Connection] = None) -> int:
+        """Delete rows whose window started before `cutoff`; returns how many"""
+        return (conn or self._connect()).execute(self._purge_sql, (cutoff,)).rowcount
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+class PostgresRateLimitStore(RateLimitStore):
+    """
+    Fixed-window counters in the Supabase `public.backend_rate_limits` table.
+
+    Requires supabase/migrations/20261017000000_create_backend_rate_limits_table.sql
+    and the optional `psycopg` (v3) package.
+    """
+    blocking = True
+
+    def __init__(self, dsn: str, max_requests: int, window_seconds: float, purge_every: int = RATE_LIMIT_PURGE_EVERY):
+        try:
+            import psycopg
+        except ImportError as e:
+            raise RuntimeError("RATE_LIMIT_BACKEND=postgres requires the 'psycopg' package") from e
+        self._psycopg = psycopg
+        self.dsn = dsn
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self._local = threading.local()
+        self.purge_every = purge_every
+        self._hits = itertools.count(1)
+        self._sql = _UPSERT_SQL.format(table="public.backend_rate_limits", p="%s") + " RETURNING request_count"
+        self._purge_sql = _PURGE_SQL.format(table="public.backend_rate_limits", p="%s")
+        self._connect()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or conn.closed:
+            conn = self._psycopg.connect(self.dsn, autocommit=True)
+            self._local.conn = conn
+        return conn
+
+    def hit(self, key: str, now: Optional[float] = None) -> bool:
+        now = int(time.time() if now is None else now)
+        cutoff = now - int(self.window_seconds)
+        params = _upsert_params(key, now, cutoff, self.max_requests)
+        try:
+            row = self._connect().execute(self._sql, params).fetchone()
+        except self._psycopg.OperationalError:
+            # Stale connection (e.g. pooler restart); reconnect once
+            self.close()
+            row = self._connect().execute(self._sql, params).fetchone()
+        if self.purge_every and next(self._hits) % self.purge_every == 0:
+            try:
+                self.purge(cutoff)
+            except self._psycopg.Error as e:
+                log.warning(f"Rate limit purge failed: {type(e).__name__}")
+        return row is not None
+
+    def purge(self, cutoff: int) -> int:
+        """Delete rows whose window started before `cutoff`; returns how many"""
+        return self._connect().execute(self._purge_sql, (cutoff,)).rowcount
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+RATE_LIMIT_BACKENDS = ("memory", "sqlite", "postgres")
+
+def create_rate_limit_store(
+    max_requests: int,
+    window_seconds: float,
+    backend: Optional[str] = None,
+) -> RateLimitStore:
+    """Build the configured rate-limit store (defaults to RATE_LIMIT_BACKEND, then 'memory')"""
+    backend = (backend or os.getenv("RATE_LIMIT_BACKEND", "memory")).lower()
+
+    if backend == "memory":
+        max_keys = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+        return SlidingWindowRateLimiter(max_requests, window_seconds, max_keys=max_keys)
+    if backend == "sqlite":
+        path = os.getenv("RATE_LIMIT_SQLITE_PATH", "rate_limits.db")
+        return SQLiteRateLimitStore(path, max_requests, window_seconds)
+    if backend == "postgres":
+        dsn = os.getenv("RATE_LIMIT_DATABASE_URL")
+        if not dsn:
+            raise ValueError("RATE_LIMIT_DATABASE_URL is required for RATE_LIMIT_BACKEND=postgres")
+        return PostgresRateLimitStore(dsn, max_requests, window_seconds)
+
+    raise ValueError(f"Invalid RATE_LIMIT_BACKEND '{backend}'. Allowed: {', '.join(RATE_LIMIT_BACKENDS)}")
@@ -0,0 +1,194 @@
+"""
+Structured logging shared by the backend, the agent worker and the scheduler.
+
+configure_logging() replaces logging.basicConfig for the long-running services:
+
+- records are written as one JSON object per line (or the classic text format
+  with LOG_FORMAT=text) by a QueueListener thread, so a request or shutdown
+  path only pays for building the LogRecord and a queue put - formatting and
+  the write to stderr happen off the hot path
+- repetitive DEBUG records are sampled per call site: the first
+  LOG_SAMPLE_BURST records of every LOG_SAMPLE_INTERVAL seconds are kept and
+  the next kept record carries how many were dropped ("sampled_out")
+- levels are set per logger, e.g.
+      LOG_LEVEL=INFO LOG_LEVELS="website_backend=DEBUG,livekit=WARNING"
+  so verbose diagnostics are rejected by Logger.isEnabledFor() before any
+  argument is formatted
+
+Request-scoped fields (website_request_id, job_id, ...) are attached with
+set_log_context()/reset_log_context() and show up on every record logged from
+that thread or asyncio task.
+"""
+
+from __future__ import annotations
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "10"))
+LOG_SAMPLE_INTERVAL = float(os.getenv("LOG_SAMPLE_INTERVAL", "60"))
+LOG_SAMPLE_MAX_LEVEL = os.getenv("LOG_SAMPLE_MAX_LEVEL", "DEBUG").upper()  # records above this are never sampled
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_log_context: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar("log_context", default={})
+
+def set_log_context(**fields: Any) -> contextvars.Token:
+    """Add fields to every record logged from the current thread/task until reset_log_context(token)"""
+    return _log_context.set({**_log_context.get(), **fields})
+
+def reset_log_context(token: contextvars.Token):
+    _log_context.reset(token)
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """'a=DEBUG,b.c=WARNING' -> {'a': 10, 'b.c': 30}; unknown levels raise ValueError"""
+    levels = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, level = item.partition("=")
+        value = logging.getLevelName(level.strip().upper())
+        if not isinstance(value, int):
+            raise ValueError(f"Unknown log level in LOG_LEVELS: {item.strip()}")
+        levels[name.strip()] = value
+    return levels
+
+# ─────────────────────── Formatting ───────────────────────
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "context"}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; `extra=` fields and the log context become top-level keys"""
+
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "service": self.service,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "context", None) or {})
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class SamplingFilter(logging.Filter):
+    """Keep at most `burst` records per call site per `interval`; only for levels <= max_level"""
+
+    def __init__(self, burst: int = LOG_SAMPLE_BURST, interval: float = LOG_SAMPLE_INTERVAL,
+                 max_level: int = logging.DEBUG):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.max_level = max_level
+        self._sites: Dict[Tuple[str, int], list] = {}  # (pathname, lineno) -> [window start, kept, dropped]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level or self.burst <= 0:
+            return True
+        now = record.created
+        with self._lock:
+            site = self._sites.get((record.pathname, record.lineno))
+            if site is None or now - site[0] >= self.interval:
+                dropped = site[2] if site else 0
+                self._sites[(record.pathname, record.lineno)] = [now, 1, 0]
+            elif site[1] < self.burst:
+                site[1] += 1
+                dropped = 0
+            else:
+                site[2] += 1
+                return False
+        if dropped:
+            record.sampled_out = dropped
+        return True
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Freeze the message and the caller's context now; args may be mutated after we return
+        record.msg = record.getMessage()
+        record.args = None
+        record.context = _log_context.get()
+        return record
+
+# ─────────────────────── Setup ───────────────────────
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[_DeferredQueueHandler] = None
+_setup_lock = threading.Lock()
+
+def _output_handler(service: str, fmt: str) -> logging.Handler:
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter(service) if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+    return handler
+
+def _start_listener(handler: logging.Handler):
+    global _listener
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, handler, respect_handler_level=False)
+    _listener.start()
+
+def _after_fork():
+    # The listener thread does not survive fork; start a fresh one for the child's records
+    if _listener is not None:
+        _queue_handler.queue = queue.SimpleQueue()
+        _start_listener(_listener.handlers[0])
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+def configure_logging(
+    service: str,
+    level: str = LOG_LEVEL,
+    levels: str = LOG_LEVELS,
+    fmt: str = LOG_FORMAT,
+) -> logging.Logger:
+    """
+    Route the root logger through the background queue; safe to call again (e.g. to rename the service).
+
+    Returns:
+        The root logger
+    """
+    global _queue_handler
+    root = logging.getLogger()
+    with _setup_lock:
+        handler = _output_handler(service, fmt)
+        if _queue_handler is None:
+            _queue_handler = _DeferredQueueHandler(queue.SimpleQueue())
+            _queue_handler.addFilter(SamplingFilter(max_level=logging.getLevelName(LOG_SAMPLE_MAX_LEVEL)))
+            _start_listener(handler)
+            atexit.register(_stop_listener)
+            os.register_at_fork(after_in_child=_after_fork)
+        else:
+            _listener.handlers = (handler,)
+        for existing in root.handlers[:]:
+            if existing is not _queue_handler:
+                root.removeHandler(existing)
+        if _queue_handler not in root.handlers:
+            root.addHandler(_queue_handler)
+        root.setLevel(level.upper())
+        for name, value in parse_levels(levels).items():
+            logging.getLogger(name).setLevel(value)
+    return root
+
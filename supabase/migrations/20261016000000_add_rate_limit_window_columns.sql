@@ -0,0 +1,5 @@
+-- Add fixed-window counters to rate_limits so the Python backend can enforce
+-- MAX_REQUESTS_PER_IP per RATE_LIMIT_WINDOW with a single atomic upsert
+ALTER TABLE public.rate_limits
+  ADD COLUMN IF NOT EXISTS window_start INTEGER NOT NULL DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS request_count INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,31 @@
+-- Per-tenant persona definitions read by the agent and backend (persona_store.py).
+-- `definition` uses the PERSONA_REGISTRY_FILE entry format (config.py).
+CREATE TABLE IF NOT EXISTS public.tenant_personas (
+  tenant_id TEXT NOT NULL,
+  persona_key TEXT NOT NULL,
+  definition JSONB NOT NULL,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (tenant_id, persona_key)
+);
+
+ALTER TABLE public.tenant_personas ENABLE ROW LEVEL SECURITY;
+
+-- Push every edit to the processes caching personas ("tenant_id:persona_key")
+CREATE OR REPLACE FUNCTION public.notify_persona_changed() RETURNS trigger AS $$
+DECLARE
+  changed RECORD;
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    changed := OLD;
+  ELSE
+    changed := NEW;
+  END IF;
+  PERFORM pg_notify('persona_changed', changed.tenant_id || ':' || changed.persona_key);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tenant_personas_notify ON public.tenant_personas;
+CREATE TRIGGER tenant_personas_notify
+  AFTER INSERT OR UPDATE OR DELETE ON public.tenant_personas
+  FOR EACH ROW EXECUTE FUNCTION public.notify_persona_changed();
@@ -0,0 +1,46 @@
+-- Fixed-window counters for the Python backend's RATE_LIMIT_BACKEND=postgres.
+-- They live in their own table: the Next.js route keeps its 1-hour cooldown in
+-- rate_limits (last_call_time only), and sharing that table let backend hits
+-- reset its cooldowns and backend purges delete them.
+CREATE TABLE IF NOT EXISTS public.backend_rate_limits (
+  ip_address TEXT PRIMARY KEY,
+  window_start INTEGER NOT NULL,
+  request_count INTEGER NOT NULL
+);
+
+ALTER TABLE public.backend_rate_limits ENABLE ROW LEVEL SECURITY;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_policies
+        WHERE tablename = 'backend_rate_limits'
+        AND policyname = 'Service role can manage backend_rate_limits'
+    ) THEN
+        EXECUTE 'CREATE POLICY "Service role can manage backend_rate_limits" ON public.backend_rate_limits FOR ALL TO service_role USING (true)';
+    END IF;
+END
+$$;
+
+-- Expired rows carry no state (the next hit resets them); the backend deletes
+-- them every RATE_LIMIT_PURGE_EVERY hits and this index keeps that cheap
+CREATE INDEX IF NOT EXISTS backend_rate_limits_window_start_idx ON public.backend_rate_limits (window_start);
+
+CREATE OR REPLACE FUNCTION public.purge_expired_backend_rate_limits(window_seconds INTEGER DEFAULT 86400)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+  WITH deleted AS (
+    DELETE FROM public.backend_rate_limits
+    WHERE window_start <= EXTRACT(EPOCH FROM now())::INTEGER - window_seconds
+    RETURNING 1
+  )
+  SELECT count(*)::INTEGER FROM deleted;
+$$;
+
+-- With pg_cron enabled: SELECT cron.schedule('purge-backend-rate-limits', '0 * * * *', 'SELECT public.purge_expired_backend_rate_limits(86400)');
+
+-- The window columns added to rate_limits by 20261016000000 are no longer used
+ALTER TABLE public.rate_limits
+  DROP COLUMN IF EXISTS window_start,
+  DROP COLUMN IF EXISTS request_count;
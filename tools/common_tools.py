@@ -1,81 +1,127 @@
 from __future__ import annotations
+import asyncio
 import logging
-import json
-from typing import Awaitable, Callable, Dict, Any, List
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple, Union
 
 from livekit import api
+from livekit.agents import RunContext
 from livekit.agents.llm import function_tool
 from livekit.protocol.sip import TransferSIPParticipantRequest
 
-# This import will be problematic if transfer_human is moved here and AGENT_CONTEXT is in main file.
-# We need to refactor how AGENT_CONTEXT and TRANSFER_PHONE_NUMBER are accessed.
-# For now, this is a placeholder.
-# from quitanda_outbound_agent import AGENT_CONTEXT, TRANSFER_PHONE_NUMBER 
+from tools.warm_transfer import TRANSFERS, WarmTransfer
 
 log = logging.getLogger("common_tools")
 
-# Placeholder for AGENT_CONTEXT and TRANSFER_PHONE_NUMBER access
-# These would ideally be passed to the tool function or accessed via a shared context object
-# that is properly initialized and passed around.
-
-class AgentContextAccess:
-    _job_context = None
-    _transfer_phone_number = None
-
-    @staticmethod
-    def get_job_context():
-        if AgentContextAccess._job_context is None:
-            log.error("JobContext not set in AgentContextAccess")
-            # Attempt to import dynamically if not set (example, might not be best practice)
-            try:
-                from __main__ import AGENT_CONTEXT # Try to get it from the main script if run directly
-                AgentContextAccess._job_context = AGENT_CONTEXT.get_job_context()
-            except ImportError:
-                log.error("Could not import AGENT_CONTEXT from __main__")
-                pass # Fallback or raise error
-        return AgentContextAccess._job_context
-
-    @staticmethod
-    def set_job_context(context):
-        AgentContextAccess._job_context = context
-
-    @staticmethod
-    def get_transfer_phone_number() -> str | None:
-        if AgentContextAccess._transfer_phone_number is None:
-            log.warning("Transfer phone number not set in AgentContextAccess. Attempting to get from __main__ if available.")
-            # This dynamic import from __main__ is fragile and generally not recommended for robust applications.
-            # It's better to ensure TRANSFER_PHONE_NUMBER is explicitly passed or set during initialization.
-            try:
-                # Dynamically import from the executing script's scope if possible
-                main_module = __import__("__main__")
-                AgentContextAccess._transfer_phone_number = getattr(main_module, 'TRANSFER_PHONE_NUMBER', None)
-                if AgentContextAccess._transfer_phone_number:
-                    log.info(f"Dynamically loaded TRANSFER_PHONE_NUMBER: {AgentContextAccess._transfer_phone_number}")
-                else:
-                    log.error("TRANSFER_PHONE_NUMBER not found in __main__ module.")
-                    # Consider a default fallback if absolutely necessary and make it clear
-                    # AgentContextAccess._transfer_phone_number = "+10000000000" # Example default, log this choice
-            except ImportError:
-                log.error("Could not import __main__ module to get TRANSFER_PHONE_NUMBER.")
-            except AttributeError:
-                log.error("TRANSFER_PHONE_NUMBER not found as an attribute in __main__ module.")
-
-        if AgentContextAccess._transfer_phone_number is None:
-            log.error("TRANSFER_PHONE_NUMBER is still not set. Transfer will likely fail or use a default if hardcoded elsewhere.")
-            # raise ValueError("Transfer phone number is not configured.") # Optionally raise an error
-
-        return AgentContextAccess._transfer_phone_number
-
-    @staticmethod
-    def set_transfer_phone_number(phone_number: str):
-        if not phone_number:
-            log.warning("Attempted to set an empty or None transfer phone number.")
-            return 
-        AgentContextAccess._transfer_phone_number = phone_number
-        log.info(f"Transfer phone number set in AgentContextAccess: {phone_number}")
+TRANSFER_MODES = ("cold", "warm")
+
+def sip_identity(phone_number: str) -> str:
+    """Participant identity of the SIP leg dialed for `phone_number` (see outbound_agent.entrypoint)"""
+    return f"sip_{phone_number.replace('tel:', '').replace('+', '')}"
+
+def _tel_uri(phone_number: str) -> str:
+    return phone_number if phone_number.startswith("tel:") else f"tel:{phone_number}"
+
+@dataclass
+class ToolContext:
+    """
+    Per-call state for the tools, passed as AgentSession(userdata=...) when the session starts.
+
+    Everything a tool needs is resolved once by the entrypoint: the parsed job
+    metadata, the SIP participant it dialed and the job's LiveKit API client
+    (JobContext.api, one keep-alive session per job process).
+    """
+    room_name: str
+    sip_identity: str
+    livekit_api: api.LiveKitAPI
+    transfer_numbers: Tuple[str, ...] = ()  # human agents, empty if transfers are not configured
+    transfer_mode: str = "cold"  # "cold": hand the SIP leg over; "warm": ring humans in parallel and brief them first
+    sip_trunk_id: str = ""  # outbound trunk for the warm-transfer human legs
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    call_record: Dict[str, Any] = field(default_factory=dict)  # call metadata sent with the transcript
+    end_call: Optional[Callable[[str], Any]] = None  # makes the agent leave once a warm transfer is bridged
+    transfer_task: Optional[asyncio.Task] = None
+
+    @property
+    def transfer_to(self) -> Optional[str]:
+        """tel: URI for a cold transfer: the first configured human agent"""
+        return _tel_uri(self.transfer_numbers[0]) if self.transfer_numbers else None
+
+    @classmethod
+    def for_call(cls, room_name: str, phone_number: str, livekit_api: api.LiveKitAPI,
+                 transfer_phone_numbers: Union[str, Sequence[str], None] = None,
+                 metadata: Optional[Dict[str, Any]] = None, **options: Any) -> "ToolContext":
+        if isinstance(transfer_phone_numbers, str):
+            transfer_phone_numbers = transfer_phone_numbers.split(",")
+        numbers = tuple(n.strip() for n in transfer_phone_numbers or () if n.strip())
+        return cls(
+            room_name=room_name,
+            sip_identity=sip_identity(phone_number),
+            livekit_api=livekit_api,
+            transfer_numbers=numbers,
+            metadata=metadata or {},
+            **options,
+        )
+
+async def start_transfer(tool_ctx: ToolContext, reason: str | None = None) -> dict:
+    """Cold-transfer the call's SIP participant to the human agent: one TransferSIPParticipant RPC"""
+    if not tool_ctx.transfer_to:
+        log.error("Transferência falhou: TRANSFER_PHONE_NUMBER não configurado")
+        return {"ok": False, "error": "Número de transferência não configurado"}
+
+    transfer_request = TransferSIPParticipantRequest(
+        participant_identity=tool_ctx.sip_identity,
+        room_name=tool_ctx.room_name,
+        transfer_to=tool_ctx.transfer_to,
+        play_dialtone=False
+    )
+    await tool_ctx.livekit_api.sip.transfer_sip_participant(transfer_request)
+    tool_ctx.call_record["transfer"] = {"mode": "cold", "reason": reason, "outcome": "transferred"}
+    TRANSFERS.inc(mode="cold", outcome="transferred")
+    log.info(f"Successfully transferred participant {tool_ctx.sip_identity} to {tool_ctx.transfer_to} (reason: {reason})")
+    return {
+        "ok": True,
+        "message": "Transferência iniciada com sucesso",
+        "participant": tool_ctx.sip_identity,
+        "room": tool_ctx.room_name,
+        "transfer_to": tool_ctx.transfer_to
+    }
+
+def start_warm_transfer(tool_ctx: ToolContext, session: Any, reason: str | None = None) -> dict:
+    """Ring every human agent in the background; the agent keeps talking to the caller meanwhile"""
+    if not tool_ctx.transfer_numbers:
+        log.error("Transferência falhou: TRANSFER_PHONE_NUMBERS não configurado")
+        return {"ok": False, "error": "Número de transferência não configurado"}
+    if tool_ctx.transfer_task is not None and not tool_ctx.transfer_task.done():
+        return {"ok": True, "message": "Já estamos a ligar a um colega. Continua a conversa com o cliente."}
+
+    transfer = WarmTransfer(
+        livekit_api=tool_ctx.livekit_api,
+        room_name=tool_ctx.room_name,
+        caller_identity=tool_ctx.sip_identity,
+        numbers=[_tel_uri(number) for number in tool_ctx.transfer_numbers],
+        sip_trunk_id=tool_ctx.sip_trunk_id,
+        session=session,
+        end_call=tool_ctx.end_call,
+        record=tool_ctx.call_record.setdefault("transfer", {}),
+    )
+    tool_ctx.transfer_task = asyncio.create_task(transfer.run(reason))
+    tool_ctx.transfer_task.add_done_callback(lambda task: _transfer_finished(task, transfer.record))
+    log.info(f"Warm transfer started: ringing {len(tool_ctx.transfer_numbers)} human agent(s) (reason: {reason})")
+    return {
+        "ok": True,
+        "message": "A ligar a um colega humano. Diz ao cliente que o vais passar a um colega "
+                   "e continua a conversa até o colega atender.",
+    }
+
+def _transfer_finished(task: asyncio.Task, record: Dict[str, Any]):
+    if not task.cancelled() and task.exception() is not None:
+        record["outcome"] = "error"
+        TRANSFERS.inc(mode="warm", outcome="error")
+        log.error(f"Erro na transferência assistida: {task.exception()!r}")
 
 @function_tool()
-async def transfer_human(reason: str | None = None) -> dict:
+async def transfer_human(context: RunContext[ToolContext], reason: str | None = None) -> dict:
     """
     Transfers the current call to a human agent.
     Use this function if the user explicitly asks to speak to a human,
@@ -86,64 +132,9 @@ async def transfer_human(reason: str | None = None) -> dict:
     """
     log.info(f"TRANSFERÊNCIA PARA HUMANO (common_tool) → Motivo: {reason}")
     try:
-        job_ctx = AgentContextAccess.get_job_context()
-        transfer_phone_number_val = AgentContextAccess.get_transfer_phone_number()
-
-        if not job_ctx or not job_ctx.room:
-            log.error("Transferência falhou: Contexto ou sala não disponível")
-            return {"ok": False, "error": "Contexto ou sala não disponível"}
-        
-        room_name = job_ctx.room.name
-        log.info(f"Room name: {room_name}")
-        
-        phone_number = None
-        if job_ctx.job and job_ctx.job.metadata:
-            try:
-                metadata = json.loads(job_ctx.job.metadata)
-                phone_number = metadata.get("phone_number")
-            except json.JSONDecodeError as e:
-                log.warning(f"Invalid metadata JSON format in transfer_human: {e}")
-        
-        if not phone_number:
-            # Fallback: Try to get identity of the first SIP participant if available
-            participants = await job_ctx.room.list_participants()
-            for p_info in participants:
-                if p_info.identity.startswith("sip_"):
-                    phone_number = p_info.identity.replace("sip_","") # a bit of a guess
-                    log.info(f"Using participant identity as fallback phone_number: {phone_number}")
-                    break
-            if not phone_number:
-                 log.error("Transferência falhou: Não foi possível extrair número de telefone do metadata ou participante")
-                 return {"ok": False, "error": "Número de telefone não encontrado para identificar participante SIP"}
-
-        participant_identity = f"sip_{phone_number.replace('tel:', '').replace('+', '')}" # Ensure consistent formatting
-        log.info(f"SIP participant identity: {participant_identity}")
-        
-        transfer_to = f"tel:{transfer_phone_number_val}" if not transfer_phone_number_val.startswith("tel:") else transfer_phone_number_val
-        
-        transfer_request = TransferSIPParticipantRequest(
-            participant_identity=participant_identity,
-            room_name=room_name,
-            transfer_to=transfer_to,
-            play_dialtone=False
-        )
-        log.info(f"Transfer request created: room={room_name}, participant={participant_identity}, to={transfer_to}")
-        
-        async with api.LiveKitAPI() as livekit_api:
-            await livekit_api.sip.transfer_sip_participant(transfer_request)
-            log.info(f"Successfully transferred participant {participant_identity} to {transfer_to}")
-        
-        return {
-            "ok": True,
-            "message": "Transferência iniciada com sucesso",
-            "participant": participant_identity,
-            "room": room_name,
-            "transfer_to": transfer_to
-        }
+        if context.userdata.transfer_mode == "warm":
+            return start_warm_transfer(context.userdata, context.session, reason)
+        return await start_transfer(context.userdata, reason)
     except Exception as e:
         log.error(f"Erro ao transferir para humano (common_tool): {str(e)}", exc_info=True)
         return {"ok": False, "error": str(e)}
-
-common_tools_list: List[Callable[..., Awaitable[Dict[str, Any]]]] = [
-    transfer_human,
-] 
\ No newline at end of file
@@ -0,0 +1,157 @@
+"""
+Warm transfer: reach a human while the agent keeps the caller company.
+
+In warm mode (TRANSFER_MODE=warm) transfer_human starts a WarmTransfer in the
+background and returns at once, so the model keeps talking to the caller while
+every number in TRANSFER_PHONE_NUMBERS rings in parallel into the call's room.
+The first human to answer wins and the other legs are hung up. The caller is
+then put on hold (their subscribe permission is revoked, so they hear nothing),
+the agent briefs the human with a short summary generated from the
+conversation, the caller is taken off hold and the agent leaves the room,
+bridging caller and human.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import inspect
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Sequence
+
+from livekit import api
+
+from metrics import Counter, Histogram
+
+log = logging.getLogger("warm_transfer")
+
+WARM_TRANSFER_RING_TIMEOUT = float(os.getenv("WARM_TRANSFER_RING_TIMEOUT", "30"))  # seconds before giving up
+
+TRANSFERS = Counter("agent_transfers_total", "Transfers to a human by mode and outcome", ["mode", "outcome"])
+TIME_TO_HUMAN = Histogram(
+    "agent_transfer_time_to_human_seconds", "Warm transfer start until a human answered",
+    buckets=(2, 5, 10, 15, 20, 30, 45, 60),
+)
+
+BRIEFING_INSTRUCTIONS = (
+    "Estás agora a falar com um colega humano, NÃO com o cliente; o cliente está em espera e não te ouve. "
+    "Em no máximo duas frases curtas, resume quem é o cliente, o que pretende e porque pediu para falar com "
+    "um humano{reason}. Termina a dizer que vais passar a chamada. Usa EXCLUSIVAMENTE Português de Portugal."
+)
+NO_HUMAN_INSTRUCTIONS = (
+    "Diz ao cliente que neste momento nenhum colega está disponível, pede desculpa e continua a ajudá-lo. "
+    "Usa EXCLUSIVAMENTE Português de Portugal."
+)
+
+@dataclass
+class WarmTransfer:
+    """One warm transfer for one call; `record` collects what happened for the call's webhook payload"""
+    livekit_api: api.LiveKitAPI
+    room_name: str
+    caller_identity: str
+    numbers: Sequence[str]
+    sip_trunk_id: str
+    session: Any  # AgentSession
+    end_call: Optional[Callable[[str], Any]] = None
+    ring_timeout: float = WARM_TRANSFER_RING_TIMEOUT
+    record: Dict[str, Any] = field(default_factory=dict)
+
+    def _identity(self, index: int) -> str:
+        return f"human_{index}_{self.room_name}"
+
+    async def _dial(self, identity: str, number: str):
+        await self.livekit_api.sip.create_sip_participant(
+            api.CreateSIPParticipantRequest(
+                sip_trunk_id=self.sip_trunk_id,
+                sip_call_to=number,
+                room_name=self.room_name,
+                participant_identity=identity,
+                participant_name="Humano",
+                wait_until_answered=True,
+            )
+        )
+
+    async def _hang_up(self, identity: str):
+        """Remove a ringing or answered human leg (ends that SIP call)"""
+        try:
+            await self.livekit_api.room.remove_participant(
+                api.RoomParticipantIdentity(room=self.room_name, identity=identity)
+            )
+        except Exception as e:
+            log.debug(f"Could not hang up {identity}: {type(e).__name__}")
+
+    async def dial_first(self) -> Optional[str]:
+        """Ring every number at once; returns the identity of the first human to answer (None if nobody did)"""
+        tasks = {
+            asyncio.create_task(self._dial(self._identity(index), number)): self._identity(index)
+            for index, number in enumerate(self.numbers)
+        }
+        winner = None
+        pending = set(tasks)
+        deadline = asyncio.get_running_loop().time() + self.ring_timeout
+        try:
+            while pending and winner is None:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        log.warning(f"Human leg {tasks[task]} failed: {type(task.exception()).__name__}")
+                    elif winner is None:
+                        winner = tasks[task]
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(
+                *(self._hang_up(identity) for identity in tasks.values() if identity != winner),
+                return_exceptions=True,
+            )
+        return winner
+
+    async def _set_caller_hold(self, on_hold: bool):
+        try:
+            await self.livekit_api.room.update_participant(api.UpdateParticipantRequest(
+                room=self.room_name,
+                identity=self.caller_identity,
+                permission=api.ParticipantPermission(
+                    can_subscribe=not on_hold, can_publish=True, can_publish_data=True
+                ),
+            ))
+        except Exception as e:
+            log.warning(f"Could not {'hold' if on_hold else 'resume'} caller: {type(e).__name__}: {e}")
+
+    async def run(self, reason: Optional[str] = None):
+        started = time.perf_counter()
+        self.record.update(mode="warm", reason=reason, numbers_dialed=len(self.numbers), outcome="dialing")
+        winner = await self.dial_first()
+        if winner is None:
+            self.record["outcome"] = "no_answer"
+            TRANSFERS.inc(mode="warm", outcome="no_answer")
+            log.warning(f"☎️ Warm transfer: no human answered within {self.ring_timeout:.0f}s")
+            await self.session.generate_reply(instructions=NO_HUMAN_INSTRUCTIONS)
+            return
+
+        time_to_human = time.perf_counter() - started
+        self.record.update(human=winner, time_to_human_ms=round(time_to_human * 1000, 1))
+        TIME_TO_HUMAN.observe(time_to_human)
+        log.info(f"☎️ Warm transfer: {winner} answered after {time_to_human:.1f}s, briefing")
+
+        self.session.interrupt()
+        await self._set_caller_hold(True)
+        try:
+            await self.session.generate_reply(
+                instructions=BRIEFING_INSTRUCTIONS.format(reason=f" (motivo: {reason})" if reason else "")
+            )
+        finally:
+            await self._set_caller_hold(False)
+
+        self.record["outcome"] = "bridged"
+        TRANSFERS.inc(mode="warm", outcome="bridged")
+        log.info(f"☎️ Warm transfer: caller bridged with {winner}")
+        if self.end_call is not None:
+            result = self.end_call("warm_transfer")
+            if inspect.isawaitable(result):
+                await result
@@ -0,0 +1,290 @@
+"""
+Lightweight per-call tracing shared by the backend and the agent worker.
+
+Every call is one trace whose id is derived from its website_request_id, so the
+backend (HTTP request, room creation, dispatch), the agent job (pickup, connect,
+SIP ring, answer, session start, first audio) and the transcript outbox
+(webhook delivery) all land in the same trace even though they run in different
+processes. Spans are handed to a background thread in batches and exported to
+a local JSONL file or to an OTLP/HTTP (JSON) collector, so recording a span on
+the request path is one object allocation and a deque append.
+
+Configuration:
+    TRACING_EXPORTER      none (default) | jsonl | otlp
+    TRACING_JSONL_PATH    file for the jsonl exporter (default traces.jsonl); every
+                          process appends whole lines with O_APPEND, and the file is
+                          rotated to <path>.1 past TRACING_JSONL_MAX_MB
+    OTEL_EXPORTER_OTLP_TRACES_ENDPOINT / OTEL_EXPORTER_OTLP_ENDPOINT
+                          collector for the otlp exporter (default http://localhost:4318)
+    TRACING_SAMPLE_RATE   fraction of calls traced; decided from the trace id,
+                          so every service keeps or drops the same calls
+"""
+
+from __future__ import annotations
+
+import atexit
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional
+from uuid import UUID
+
+log = logging.getLogger("tracing")
+
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none").lower()
+TRACING_JSONL_PATH = os.getenv("TRACING_JSONL_PATH", "traces.jsonl")
+TRACING_JSONL_MAX_MB = float(os.getenv("TRACING_JSONL_MAX_MB", "100"))  # rotate to <path>.1 beyond this, 0 = never
+TRACING_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT") or (
+    os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318").rstrip("/") + "/v1/traces"
+)
+TRACING_SAMPLE_RATE = float(os.getenv("TRACING_SAMPLE_RATE", "1.0"))
+TRACING_FLUSH_INTERVAL = float(os.getenv("TRACING_FLUSH_INTERVAL", "2"))
+TRACING_MAX_QUEUE = int(os.getenv("TRACING_MAX_QUEUE", "10000"))  # oldest spans are dropped beyond this
+
+def trace_id_for(website_request_id: str) -> str:
+    """32-hex-char (OTLP) trace id for a website_request_id"""
+    try:
+        return UUID(website_request_id).hex
+    except (ValueError, TypeError, AttributeError):
+        return hashlib.sha256(str(website_request_id).encode()).hexdigest()[:32]
+
+def new_span_id() -> str:
+    return os.urandom(8).hex()
+
+class Span:
+    __slots__ = ("name", "service", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, service: str, trace_id: str, parent_id: Optional[str] = None,
+                 span_id: Optional[str] = None, start_ns: Optional[int] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.service = service
+        self.trace_id = trace_id
+        self.span_id = span_id or new_span_id()
+        self.parent_id = parent_id
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes or {}
+        self.error: Optional[str] = None
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "service": self.service,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+class _NoopSpan:
+    """Stand-in for unsampled calls; keeps call sites free of sampling checks"""
+    span_id = None
+
+    def set(self, key: str, value: Any):
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+# ─────────────────────── Exporters ───────────────────────
+class JsonlSpanExporter:
+    """
+    Appends one JSON line per span. Backend workers, agent job processes and the
+    outbox drainer share the file, so each line is a single write() on an
+    O_APPEND descriptor (the kernel never interleaves those); past max_bytes the
+    file is renamed to <path>.1, replacing the previous one.
+    """
+
+    def __init__(self, path: str = TRACING_JSONL_PATH, max_bytes: int = int(TRACING_JSONL_MAX_MB * 1024 * 1024)):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def _rotate_if_full(self):
+        try:
+            if self.max_bytes and os.path.getsize(self.path) >= self.max_bytes:
+                os.replace(self.path, self.path + ".1")
+        except FileNotFoundError:
+            pass  # not created yet, or another process just rotated it
+
+    def export(self, spans: List[Span]):
+        self._rotate_if_full()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            for span in spans:
+                os.write(fd, (json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n").encode())
+        finally:
+            os.close(fd)
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+class OtlpHttpSpanExporter:
+    """OTLP/HTTP with the JSON encoding, using only the standard library"""
+
+    def __init__(self, endpoint: str = TRACING_OTLP_ENDPOINT, timeout: float = 5.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def _encode(self, spans: List[Span]) -> bytes:
+        by_service: Dict[str, List[Dict[str, Any]]] = {}
+        for span in spans:
+            encoded = {
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span.attributes.items()],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            }
+            if span.parent_id:
+                encoded["parentSpanId"] = span.parent_id
+            by_service.setdefault(span.service, []).append(encoded)
+        return json.dumps({"resourceSpans": [
+            {
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+                "scopeSpans": [{"scope": {"name": "chamada-ai"}, "spans": encoded_spans}],
+            }
+            for service, encoded_spans in by_service.items()
+        ]}).encode()
+
+    def export(self, spans: List[Span]):
+        import urllib.request
+
+        request = urllib.request.Request(
+            self.endpoint, data=self._encode(spans), headers={"Content-Type": "application/json"}, method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+def create_exporter(kind: str = TRACING_EXPORTER):
+    if kind == "jsonl":
+        return JsonlSpanExporter()
+    if kind == "otlp":
+        return OtlpHttpSpanExporter()
+    if kind in ("none", "off", ""):
+        return None
+    raise ValueError(f"Unknown TRACING_EXPORTER: {kind}")
+
+class _BatchProcessor:
+    """Buffers finished spans and exports them from a daemon thread"""
+
+    def __init__(self, exporter, max_queue: int = TRACING_MAX_QUEUE, interval: float = TRACING_FLUSH_INTERVAL):
+        self.exporter = exporter
+        self.interval = interval
+        self._queue: Deque[Span] = deque(maxlen=max_queue)
+        self._export_lock = threading.Lock()
+        self._start_thread()
+        atexit.register(self.flush)
+        # Forked workers (gunicorn --preload, multiprocessing) need their own export thread
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _start_thread(self):
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def _after_fork(self):
+        self._queue.clear()
+        self._export_lock = threading.Lock()
+        self._start_thread()
+
+    def add(self, span: Span):
+        self._queue.append(span)
+
+    def flush(self):
+        with self._export_lock:
+            while self._queue:
+                batch = []
+                while self._queue and len(batch) < 512:
+                    batch.append(self._queue.popleft())
+                try:
+                    self.exporter.export(batch)
+                except Exception as e:
+                    log.debug(f"Span export failed, dropped {len(batch)} span(s): {type(e).__name__}: {e}")
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+# ─────────────────────── Tracer ───────────────────────
+class Tracer:
+    def __init__(self, service: str, processor: Optional[_BatchProcessor], sample_rate: float = TRACING_SAMPLE_RATE):
+        self.service = service
+        self._processor = processor
+        self.sample_rate = sample_rate
+
+    def sampled(self, trace_id: str) -> bool:
+        if self._processor is None:
+            return False
+        return self.sample_rate >= 1.0 or int(trace_id[:8], 16) / 0xFFFFFFFF < self.sample_rate
+
+    @contextmanager
+    def span(self, name: str, website_request_id: Optional[str], parent_id: Optional[str] = None,
+             span_id: Optional[str] = None, **attributes: Any) -> Iterator[Any]:
+        """Time the enclosed block as one span; exceptions mark the span as failed and propagate"""
+        trace_id = trace_id_for(website_request_id) if website_request_id else None
+        if trace_id is None or not self.sampled(trace_id):
+            yield _NOOP_SPAN
+            return
+        span = Span(name, self.service, trace_id, parent_id, span_id, attributes=attributes)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            self._processor.add(span)
+
+    def record(self, name: str, website_request_id: Optional[str], start: float, end: float,
+               parent_id: Optional[str] = None, span_id: Optional[str] = None,
+               error: Optional[str] = None, **attributes: Any) -> Optional[str]:
+        """Record a span from epoch-second timestamps measured elsewhere; returns its span id"""
+        if not website_request_id:
+            return None
+        trace_id = trace_id_for(website_request_id)
+        if not self.sampled(trace_id):
+            return None
+        span = Span(name, self.service, trace_id, parent_id, span_id, int(start * 1e9), attributes)
+        span.end_ns = int(end * 1e9)
+        span.error = error
+        self._processor.add(span)
+        return span.span_id
+
+    def flush(self):
+        if self._processor is not None:
+            self._processor.flush()
+
+_processor: Optional[_BatchProcessor] = None
+_processor_lock = threading.Lock()
+_tracers: Dict[str, Tracer] = {}
+
+def get_tracer(service: str) -> Tracer:
+    """Per-process tracer for `service`; all tracers in a process share one export thread"""
+    global _processor
+    tracer = _tracers.get(service)
+    if tracer is None:
+        with _processor_lock:
+            if _processor is None and TRACING_EXPORTER not in ("none", "off", ""):
+                _processor = _BatchProcessor(create_exporter())
+            tracer = _tracers.setdefault(service, Tracer(service, _processor))
+    return tracer
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Per-call transcript journal written while the call is in progress.
+
+Each finished conversation turn is appended (and flushed) to
+TRANSCRIPT_JOURNAL_DIR/<job_id>.jsonl as it happens, so a crashed worker still
+leaves the conversation on disk and shutdown only has to close the file.
+
+The job holds an exclusive lock on its journal until the call ends. Job
+processes are pooled and outlive their jobs, so "the writing process is still
+alive" says nothing about the call. "Nobody holds the lock" does: the job
+ended without shipping its transcript, or its process died. The worker runs
+recovery every JOURNAL_RECOVERY_INTERVAL seconds
+(start_journal_recovery); it can also be run by hand:
+
+    python transcript_journal.py recover [--min-age SECONDS]
+"""
+
+from __future__ import annotations
+
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from transcripts import TranscriptBuilder, TranscriptSummary, build_transcript_payload
+
+log = logging.getLogger("transcript_journal")
+
+TRANSCRIPT_JOURNAL_DIR = os.getenv("TRANSCRIPT_JOURNAL_DIR", "transcript_journals")
+JOURNAL_STALE_SECONDS = int(os.getenv("JOURNAL_STALE_SECONDS", "7200"))  # treat as orphaned after this
+JOURNAL_RECOVERY_INTERVAL = float(os.getenv("JOURNAL_RECOVERY_INTERVAL", "300"))  # seconds between recovery passes
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: fall back to checking the writer's pid
+    fcntl = None
+
+def _try_lock(f) -> bool:
+    """Take the exclusive journal lock without waiting; False when a running job holds it"""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+class TranscriptJournal:
+    """Append-only JSONL journal for one call, plus the in-memory transcript built from it"""
+
+    def __init__(
+        self,
+        job_id: str,
+        call_metadata: Dict[str, Any],
+        session_start_time: datetime,
+        directory: str = TRANSCRIPT_JOURNAL_DIR,
+    ):
+        os.makedirs(directory, exist_ok=True)
+        safe_id = "".join(c for c in job_id if c.isalnum() or c in "-_") or "unknown"
+        self.path = os.path.join(directory, f"{safe_id}.jsonl")
+        self._builder = TranscriptBuilder()
+        self._file = open(self.path, "a", encoding="utf-8", buffering=1)  # line-buffered
+        _try_lock(self._file)  # held until finish()/discard(): the journal belongs to this job
+        self._write({
+            "type": "call",
+            "job_id": job_id,
+            "pid": os.getpid(),
+            "call_metadata": call_metadata,
+            "start_time": session_start_time.isoformat(),
+        })
+
+    def _write(self, record: Dict[str, Any]):
+        self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+    def append(self, role: str, content: Any):
+        """Record one finished turn (no-op for turns without text)"""
+        if self._file.closed:
+            return
+        if self._builder.add(role, content):
+            self._write({"type": "turn", "role": role, "content": content, "at": time.time()})
+
+    def finish(self) -> TranscriptSummary:
+        """Flush and close the journal; returns the transcript accumulated during the call"""
+        if not self._file.closed:
+            os.utime(self.path)  # recovery waits min_age after unlock, giving shutdown time to queue it
+            self._file.close()
+        return self._builder.finish()
+
+    def discard(self):
+        """Delete the journal once its transcript is safely in the outbox"""
+        if not self._file.closed:
+            self._file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+def read_journal(path: str) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+    """(call header, turn items) from a journal; tolerates a torn last line"""
+    header = None
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("type") == "call":
+                header = record
+            elif record.get("type") == "turn":
+                items.append({"role": record.get("role"), "content": record.get("content")})
+    return header, items
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def recover_journals(
+    outbox,
+    directory: str = TRANSCRIPT_JOURNAL_DIR,
+    min_age: float = 60,
+    stale_after: float = JOURNAL_STALE_SECONDS,
+) -> int:
+    """
+    Queue journals left behind by crashed workers and delete them.
+
+    A journal is orphaned when no running job holds its lock (or, without
+    fcntl, the process that wrote it is gone) and it has not been touched for
+    `min_age` seconds, or when it has not been written to for `stale_after`
+    seconds.
+
+    Returns:
+        Number of transcripts queued
+    """
+    recovered = 0
+    now = time.time()
+    for path in glob.glob(os.path.join(directory, "*.jsonl")):
+        try:
+            age = now - os.path.getmtime(path)
+            if age < min_age:
+                continue
+            with open(path, "a", encoding="utf-8") as lock:
+                if not _try_lock(lock) and age < stale_after:
+                    continue  # the job is still running
+                header, items = read_journal(path)
+                if fcntl is None and age < stale_after and _pid_alive(header.get("pid") if header else None):
+                    continue
+                recovered += _recover_journal(outbox, path, header, items)
+        except OSError as e:
+            log.warning(f"⚠️ Could not recover journal {path}: {e}")
+    return recovered
+
+def _recover_journal(outbox, path: str, header: Optional[Dict[str, Any]], items: List[Dict[str, Any]]) -> int:
+    """Queue one orphaned journal's transcript and delete the journal; returns 1 if a transcript was queued"""
+    if header is None:
+        log.warning(f"⚠️ Journal {path} has no call header, removing")
+        os.remove(path)
+        return 0
+
+    transcript = TranscriptBuilder().add_items(items).finish()
+    call_metadata = header.get("call_metadata", {})
+    job_id = call_metadata.get("call_id", header.get("job_id", os.path.basename(path).rsplit(".", 1)[0]))
+    queued = 0
+    if transcript.turns:
+        start = datetime.fromisoformat(header["start_time"])
+        end = datetime.fromtimestamp(os.path.getmtime(path), tz=start.tzinfo)
+        payload = build_transcript_payload(call_metadata, transcript, start, end)
+        payload["technical"]["recovered_from_journal"] = True
+        outbox.enqueue(job_id, payload)
+        queued = 1
+        log.info(f"♻️ Recovered transcript for job {job_id} ({transcript.total_messages} turns)")
+    os.remove(path)
+    return queued
+
+def start_journal_recovery(
+    outbox_path: str, interval: float = JOURNAL_RECOVERY_INTERVAL, directory: str = TRANSCRIPT_JOURNAL_DIR,
+) -> threading.Thread:
+    """Recover orphaned journals now and then every `interval` seconds, in a daemon thread"""
+    from transcript_outbox import TranscriptOutbox
+
+    def _run():
+        outbox = TranscriptOutbox(outbox_path)
+        while True:
+            try:
+                recovered = recover_journals(outbox, directory)
+                if recovered:
+                    log.info(f"♻️ Queued {recovered} transcript(s) recovered from journals")
+            except Exception as e:
+                log.error(f"❌ Journal recovery failed: {type(e).__name__}: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=_run, name="journal-recovery", daemon=True)
+    thread.start()
+    return thread
+
+if __name__ == "__main__":
+    import argparse
+
+    from structured_logging import configure_logging
+
+    configure_logging("transcript-journal")
+    parser = argparse.ArgumentParser(description="Ship transcript journals left behind by crashed workers")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("recover")
+    p.add_argument("--dir", default=TRANSCRIPT_JOURNAL_DIR)
+    p.add_argument("--min-age", type=float, default=60, help="skip journals written to more recently than this")
+    args = parser.parse_args()
+
+    from transcript_outbox import TranscriptOutbox
+
+    outbox = TranscriptOutbox()
+    count = recover_journals(outbox, args.dir, min_age=args.min_age)
+    log.info(f"📮 Queued {count} recovered transcript(s); outbox now {outbox.counts()}")
+    outbox.close()
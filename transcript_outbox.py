@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Durable outbox for after-call transcript webhooks.
+
+Jobs only write the webhook payload to a local SQLite outbox and return; a
+background drainer delivers pending payloads to Make.com over one keep-alive
+session, optionally batching several transcripts per POST, and retries with
+capped exponential backoff until delivery succeeds.
+
+Rows are claimed with a lease before they are sent, so several drainers on one
+outbox file (the in-process drainer plus a sidecar, or workers sharing a disk)
+never POST the same transcript twice; a drainer that dies mid-send loses its
+lease after OUTBOX_LEASE_SECONDS and the row becomes due again. Every POST
+carries an Idempotency-Key built from the outbox row id(s) so the receiver can
+drop the duplicate a timed-out-but-delivered retry produces.
+
+The drainer runs inside the agent worker's main process (see outbound_agent.py)
+and can also be run as a sidecar:
+
+    python transcript_outbox.py            # drain forever
+    python transcript_outbox.py --once     # deliver what is due and exit
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from metrics import Counter, Gauge, Histogram
+from tracing import get_tracer
+
+if TYPE_CHECKING:
+    import aiohttp  # imported on first delivery; the outbox itself is plain sqlite3
+
+log = logging.getLogger("transcript_outbox")
+tracer = get_tracer("transcript-outbox")
+
+WEBHOOK_DELIVERIES = Counter("webhook_deliveries_total", "Transcripts delivered or dead-lettered", ["result"])
+WEBHOOK_RETRIES = Counter("webhook_retries_total", "Failed webhook attempts by reason", ["reason"])
+WEBHOOK_ATTEMPTS = Histogram(
+    "webhook_delivery_attempts", "Attempts needed per delivered transcript", buckets=(1, 2, 3, 5, 8, 13, 21)
+)
+OUTBOX_PENDING = Gauge("transcript_outbox_pending", "Transcripts waiting in the outbox")
+
+# Webhook configuration
+MAKE_WEBHOOK_URL = "https://hook.eu2.make.com/3piew3wpiu0jtewr1tlb66r6e8medd9r"  # Hardcoded after-call webhook
+MAKE_WEBHOOK_SECRET = os.getenv("MAKE_WEBHOOK_SECRET")  # Optional for verification
+WEBHOOK_TIMEOUT = int(os.getenv("WEBHOOK_TIMEOUT", "30"))
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "1"))  # >1 sends {"batch": [...]} bodies
+WEBHOOK_MAX_BACKOFF = int(os.getenv("WEBHOOK_MAX_BACKOFF", "300"))
+WEBHOOK_MAX_AGE = int(os.getenv("WEBHOOK_MAX_AGE", str(7 * 86400)))  # give up (dead-letter) after this
+
+TRANSCRIPT_OUTBOX_PATH = os.getenv("TRANSCRIPT_OUTBOX_PATH", "transcript_outbox.db")
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "2"))
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", str(WEBHOOK_TIMEOUT + 30)))  # claim lifetime
+
+class TranscriptOutbox:
+    """SQLite (WAL) outbox shared by the job processes and the drainer"""
+
+    def __init__(self, path: str = TRANSCRIPT_OUTBOX_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=10)
+        self._lock = threading.Lock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS transcript_outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " job_id TEXT NOT NULL UNIQUE,"
+            " payload TEXT NOT NULL,"
+            " status TEXT NOT NULL DEFAULT 'pending',"  # pending | sending | dead
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt_at REAL NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL,"
+            " last_error TEXT,"
+            " lease_until REAL)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(transcript_outbox)")}
+        if "lease_until" not in columns:  # outbox files created before leases
+            self._conn.execute("ALTER TABLE transcript_outbox ADD COLUMN lease_until REAL")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_transcript_outbox_due ON transcript_outbox (status, next_attempt_at)"
+        )
+
+    def enqueue(self, job_id: str, payload: Dict[str, Any]) -> bool:
+        """Persist a payload; returns False if this job was already queued"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO transcript_outbox (job_id, payload, created_at) VALUES (?, ?, ?)",
+                (job_id, json.dumps(payload, ensure_ascii=False), time.time()),
+            )
+        return cursor.rowcount == 1
+
+    def claim(self, limit: int, lease_seconds: float = OUTBOX_LEASE_SECONDS, now: Optional[float] = None) -> List[tuple]:
+        """
+        Lease up to `limit` due rows to this drainer and return them as
+        (id, attempts, created_at, payload), oldest first. Rows another drainer
+        holds are skipped until its lease expires.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self._conn.execute(
+                "UPDATE transcript_outbox SET status = 'sending', lease_until = ?"
+                " WHERE id IN (SELECT id FROM transcript_outbox"
+                "  WHERE (status = 'pending' AND next_attempt_at <= ?) OR (status = 'sending' AND lease_until < ?)"
+                "  ORDER BY id LIMIT ?)"
+                " RETURNING id, attempts, created_at, payload",
+                (now + lease_seconds, now, now, limit),
+            ).fetchall()
+        return sorted(rows)
+
+    def mark_sent(self, ids: List[int]):
+        with self._lock:
+            self._conn.executemany("DELETE FROM transcript_outbox WHERE id = ?", [(i,) for i in ids])
+
+    def mark_failed(self, rows: List[tuple], error: str, permanent: bool = False) -> int:
+        """Schedule a retry (or dead-letter); returns how many rows were dead-lettered"""
+        now = time.time()
+        updates = []
+        dead_count = 0
+        for row_id, attempts, created_at, _ in rows:
+            dead = permanent or now - created_at > WEBHOOK_MAX_AGE
+            dead_count += dead
+            delay = min(2 ** attempts, WEBHOOK_MAX_BACKOFF)
+            updates.append(("dead" if dead else "pending", now + delay, error[:500], row_id))
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE transcript_outbox SET status = ?, attempts = attempts + 1, next_attempt_at = ?, last_error = ?,"
+                " lease_until = NULL WHERE id = ?",
+                updates,
+            )
+        return dead_count
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM transcript_outbox GROUP BY status"
+            ).fetchall())
+
+    def next_due_at(self) -> Optional[float]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT MIN(next_attempt_at) FROM transcript_outbox WHERE status = 'pending'"
+            ).fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+class OutboxDrainer:
+    """Delivers outbox payloads over one pooled, keep-alive aiohttp session"""
+
+    def __init__(
+        self,
+        outbox: TranscriptOutbox,
+        url: str = MAKE_WEBHOOK_URL,
+        secret: Optional[str] = MAKE_WEBHOOK_SECRET,
+        batch_size: int = WEBHOOK_BATCH_SIZE,
+        timeout: int = WEBHOOK_TIMEOUT,
+    ):
+        self.outbox = outbox
+        self.url = url
+        self.secret = secret
+        self.batch_size = max(1, batch_size)
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            import aiohttp
+
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit=4, keepalive_timeout=60),
+            )
+        return self._session
+
+    @staticmethod
+    def idempotency_key(row_id: int) -> str:
+        return f"transcript-outbox-{row_id}"
+
+    def _headers(self, row_ids: List[int]) -> Dict[str, str]:
+        count = len(row_ids)
+        headers = {
+            "Content-Type": "application/json",
+            "User-Agent": "ChamadaAI-Agent/1.0",
+            "X-Webhook-Version": "2.0",
+            "Idempotency-Key": ",".join(self.idempotency_key(row_id) for row_id in row_ids),
+        }
+        if count > 1:
+            headers["X-Webhook-Batch-Size"] = str(count)
+        # ✅ SECURITY: Authentication if configured
+        if self.secret:
+            headers["Authorization"] = f"Bearer {self.secret}"
+            headers["X-Timestamp"] = str(int(time.time()))
+        return headers
+
+    async def _post(self, rows: List[tuple]) -> None:
+        import aiohttp
+
+        payloads = [json.loads(row[3]) for row in rows]
+        row_ids = [row[0] for row in rows]
+        if len(payloads) == 1:
+            body = payloads[0]
+        else:
+            body = {
+                "batch": payloads, "count": len(payloads),
+                "idempotency_keys": [self.idempotency_key(row_id) for row_id in row_ids],
+            }
+        session = await self._get_session()
+        try:
+            async with session.post(self.url, json=body, headers=self._headers(row_ids)) as response:
+                if 200 <= response.status < 300:
+                    self.outbox.mark_sent(row_ids)
+                    delivered = time.time()
+                    WEBHOOK_DELIVERIES.inc(len(rows), result="delivered")
+                    for (_, attempts, created_at, _), payload in zip(rows, payloads):
+                        WEBHOOK_ATTEMPTS.observe(attempts + 1)
+                        tracer.record(
+                            "webhook.delivery", payload.get("call_metadata", {}).get("website_request_id"),
+                            created_at, delivered, attempts=attempts + 1, batch_size=len(rows)
+                        )
+                    log.info(f"✅ Delivered {len(rows)} transcript(s) - Status: {response.status}")
+                    return
+                response_text = (await response.text())[:200]
+                # Don't retry on client errors (4xx) except rate limiting
+                permanent = 400 <= response.status < 500 and response.status != 429
+                log.warning(f"❌ Webhook failed with status {response.status}: {response_text}")
+                self._failed(rows, f"HTTP {response.status}: {response_text}", f"http_{response.status}", permanent)
+        except asyncio.TimeoutError:
+            log.warning(f"⏰ Webhook timeout after {self.timeout}s")
+            self._failed(rows, "timeout", "timeout")
+        except aiohttp.ClientError as e:
+            log.warning(f"🔌 Webhook connection error: {type(e).__name__}")
+            self._failed(rows, type(e).__name__, "connection")
+        except BaseException:
+            # Hand the rows back rather than leaving them leased (e.g. the drainer is cancelled)
+            self.outbox.mark_failed(rows, "interrupted")
+            raise
+
+    def _failed(self, rows: List[tuple], error: str, reason: str, permanent: bool = False):
+        WEBHOOK_RETRIES.inc(len(rows), reason=reason)
+        dead = self.outbox.mark_failed(rows, error, permanent=permanent)
+        if dead:
+            WEBHOOK_DELIVERIES.inc(dead, result="dead")
+
+    async def drain_once(self) -> int:
+        """Deliver every payload that is currently due; returns how many were attempted"""
+        attempted = 0
+        while not self._stopping:
+            counts = self.outbox.counts()
+            OUTBOX_PENDING.set(counts.get("pending", 0) + counts.get("sending", 0))
+            # One batch per claim, so a lease only has to outlive one POST
+            rows = self.outbox.claim(self.batch_size)
+            if not rows:
+                break
+            await self._post(rows)
+            attempted += len(rows)
+        return attempted
+
+    async def run(self, poll_interval: float = OUTBOX_POLL_INTERVAL):
+        while not self._stopping:
+            try:
+                await self.drain_once()
+            except Exception as e:
+                log.error(f"💥 Outbox drain error: {type(e).__name__}: {e}")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def close(self):
+        self._stopping = True
+        self._wakeup.set()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+def start_background_drainer(path: str = TRANSCRIPT_OUTBOX_PATH) -> threading.Thread:
+    """Run an OutboxDrainer on its own event loop in a daemon thread"""
+
+    def _run():
+        outbox = TranscriptOutbox(path)
+        drainer = OutboxDrainer(outbox)
+        log.info(f"📮 Transcript outbox drainer started ({path}, batch size {drainer.batch_size})")
+        asyncio.run(drainer.run())
+
+    thread = threading.Thread(target=_run, name="transcript-outbox", daemon=True)
+    thread.start()
+    return thread
+
+async def _main(args):
+    outbox = TranscriptOutbox(args.path)
+    drainer = OutboxDrainer(outbox)
+    try:
+        if args.once:
+            attempted = await drainer.drain_once()
+            log.info(f"📮 Attempted {attempted} transcript(s); outbox now {outbox.counts()}")
+        else:
+            log.info(f"📮 Draining {args.path} every {OUTBOX_POLL_INTERVAL}s (batch size {drainer.batch_size})")
+            await drainer.run()
+    finally:
+        await drainer.close()
+        outbox.close()
+
+if __name__ == "__main__":
+    import argparse
+
+    from structured_logging import configure_logging
+
+    configure_logging("transcript-outbox")
+    parser = argparse.ArgumentParser(description="Deliver queued transcript webhooks")
+    parser.add_argument("--path", default=TRANSCRIPT_OUTBOX_PATH)
+    parser.add_argument("--once", action="store_true", help="deliver what is due and exit")
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,197 @@
+"""
+Single-pass transcript formatting for LiveKit session histories.
+
+One walk over the conversation items produces the readable text transcript,
+a structured per-turn list and the analytics counters used in the webhook payload.
+Also builds the after-call webhook payload itself, so the agent and the journal
+recovery tool produce identical payloads.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterable, List
+
+TRANSCRIPT_HEADER = "=== CONVERSATION TRANSCRIPT ==="
+
+SPEAKER_LABELS = {
+    "user": "👤 User",
+    "assistant": "🤖 Assistant",
+    "system": "⚙️ System",
+}
+
+# Words that flag a call as having gone wrong
+ERROR_TERMS = ("erro", "falha")
+
+@dataclass
+class TranscriptSummary:
+    text: str
+    turns: List[Dict[str, str]] = field(default_factory=list)
+    agent_messages: int = 0
+    client_messages: int = 0
+    total_chars: int = 0
+    has_error_terms: bool = False
+    skipped_items: int = 0
+
+    @property
+    def total_messages(self) -> int:
+        return len(self.turns)
+
+    @property
+    def conversation_turns(self) -> int:
+        return max(self.agent_messages, self.client_messages)
+
+    @property
+    def avg_message_length(self) -> int:
+        return self.total_chars // max(self.total_messages, 1)
+
+    @property
+    def call_outcome(self) -> str:
+        if self.has_error_terms:
+            return "error"
+        if self.total_messages < 2:
+            return "no_conversation"
+        if self.agent_messages == 0 or self.client_messages == 0:
+            return "one_sided"
+        return "completed"
+
+def content_to_text(content: Any) -> str:
+    """Flatten an item's content (string, OpenAI content parts, ...) into plain text"""
+    if isinstance(content, str):
+        return content.strip()
+    if isinstance(content, list):
+        parts = []
+        for part in content:
+            if isinstance(part, dict):
+                if part.get("type") == "text":
+                    parts.append(part.get("text", ""))
+                elif "text" in part:
+                    parts.append(part["text"])
+            elif isinstance(part, str):
+                parts.append(part)
+        return " ".join(parts).strip()
+    if content is None:
+        return ""
+    return str(content).strip()
+
+class TranscriptBuilder:
+    """Accumulates turns one at a time (streaming) and produces a TranscriptSummary"""
+
+    def __init__(self):
+        self._lines = [TRANSCRIPT_HEADER + "\n"]
+        self._summary = TranscriptSummary(text="")
+
+    def add(self, role: str, content: Any) -> bool:
+        """Add one conversation item; returns False if it had no text"""
+        summary = self._summary
+        text = content.strip() if isinstance(content, str) else content_to_text(content)
+        if not text:
+            summary.skipped_items += 1
+            return False
+
+        speaker = SPEAKER_LABELS.get(role) or f"❓ {str(role).title()}"
+        self._lines.append(f"\n{speaker}: {text}\n")
+        summary.turns.append({"role": role, "text": text})
+        summary.total_chars += len(text)
+        if role == "assistant":
+            summary.agent_messages += 1
+        elif role == "user":
+            summary.client_messages += 1
+        return True
+
+    def add_items(self, items: Iterable[Dict[str, Any]]) -> "TranscriptBuilder":
+        for item in items:
+            if isinstance(item, dict):
+                self.add(item.get("role", "unknown"), item.get("content", []))
+            else:
+                self._summary.skipped_items += 1
+        return self
+
+    def finish(self) -> TranscriptSummary:
+        summary = self._summary
+        summary.text = "".join(self._lines)
+        lowered = summary.text.lower()
+        summary.has_error_terms = any(term in lowered for term in ERROR_TERMS)
+        return summary
+
+def summarize_session_history(session_history: Dict[str, Any]) -> TranscriptSummary:
+    """Build the transcript and analytics from session.history.to_dict() in one pass"""
+    return TranscriptBuilder().add_items(session_history.get("items", [])).finish()
+
+# ─────────────────────── Webhook payload ───────────────────────
+def hash_sensitive_data(data: str) -> str:
+    """Hash sensitive data for privacy protection"""
+    if not data or data in ["unknown", "Website User"]:
+        return data
+    return hashlib.sha256(data.encode()).hexdigest()[:16]  # First 16 chars for brevity
+
+def build_transcript_payload(
+    call_metadata: Dict[str, Any],
+    transcript: TranscriptSummary,
+    session_start_time: datetime,
+    session_end_time: datetime
+) -> Dict[str, Any]:
+    """
+    Build the after-call webhook payload with the consolidated transcript.
+    
+    Args:
+        call_metadata: Information about the call (persona, phone, etc.)
+        transcript: Transcript text, per-turn list and counters
+        session_start_time: When the session started
+        session_end_time: When the session ended
+    
+    Returns:
+        The JSON-serialisable webhook payload
+    """
+    # Calculate call duration
+    duration_seconds = int((session_end_time - session_start_time).total_seconds())
+    
+    # ✅ SECURITY: Hash sensitive data for privacy
+    phone_hash = hash_sensitive_data(call_metadata.get("phone_number", "unknown"))
+    customer_hash = hash_sensitive_data(call_metadata.get("customer_name", "Website User"))
+    
+    # Build comprehensive webhook payload
+    payload = {
+        "call_metadata": {
+            "call_id": call_metadata.get("call_id", "unknown"),
+            "website_request_id": call_metadata.get("website_request_id"),
+            "room_name": call_metadata.get("room_name", "unknown"),
+            "persona": call_metadata.get("persona", "default"),
+            "phone_hash": phone_hash,
+            "customer_hash": customer_hash,
+            "start_time": session_start_time.isoformat(),
+            "end_time": session_end_time.isoformat(),
+            "duration_seconds": duration_seconds,
+            "call_outcome": transcript.call_outcome,
+            "end_reason": call_metadata.get("end_reason")
+        },
+        "transcript": {
+            "content": transcript.text,  # ✅ Single consolidated transcript
+            "turns": transcript.turns,
+            "format": "text",
+            "language": "pt-PT",
+            "encoding": "utf-8"
+        },
+        "analytics": {
+            "total_messages": transcript.total_messages,
+            "agent_messages": transcript.agent_messages,
+            "client_messages": transcript.client_messages,
+            "conversation_turns": transcript.conversation_turns,
+            "avg_message_length": transcript.avg_message_length,
+            "timestamp_utc": session_end_time.isoformat(),
+            "usage": call_metadata.get("usage")
+        },
+        "technical": {
+            "agent_version": "1.0",
+            "model_used": call_metadata.get("model", "gpt-4o-mini-realtime-preview"),
+            "temperature": call_metadata.get("temperature"),
+            "livekit_session": True,
+            "webhook_version": "2.0",
+            "timings": call_metadata.get("timings", {}),
+            "transfer": call_metadata.get("transfer"),
+            "amd": call_metadata.get("amd")
+        }
+    }
+    return payload
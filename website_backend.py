@@ -2,24 +2,28 @@ import os
 import json
 import logging
 import asyncio
+import atexit
 import re
+import threading
+import time
 from uuid import uuid4
-from datetime import datetime, timedelta
-from collections import defaultdict
 
-from flask import Flask, request, jsonify
+from flask import Flask, g, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
-import aiohttp
 
-# Updated imports based on inspection results
-from livekit.api import room_service, agent_dispatch_service as ad_svc
-from livekit.api.agent_dispatch_service import CreateAgentDispatchRequest
-from livekit.protocol import room as proto_room
+# aiohttp and the LiveKit API/protobuf modules are imported on first use (see
+# livekit_api()): they dominate import time and the request path only needs
+# them once the first call is dispatched.
+from config import PERSONA_REGISTRY
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Counter, Histogram, exposition, start_snapshot_writer
+from rate_limit import create_rate_limit_store
+from structured_logging import configure_logging, reset_log_context, set_log_context
+from tracing import get_tracer, new_span_id
 
 # ─────────────────────── Configuração inicial ───────────────────────
 load_dotenv(".env.local")
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging("website-backend")
 log = logging.getLogger("website_backend")
 
 # LiveKit Configuration
@@ -39,21 +43,63 @@ MAX_REQUESTS_PER_IP = int(os.getenv("MAX_REQUESTS_PER_IP", "3"))
 RATE_LIMIT_WINDOW = int(os.getenv("RATE_LIMIT_WINDOW", "86400"))  # 24 hours in seconds
 ALLOWED_PERSONAS = ["restaurante", "clinica_dentaria", "vendedor", "clinica", "dentist", "sales", "custom"]
 
+# Batch dispatch (/api/start_calls)
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "1000"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "20"))
+
 # ✅ SECURITY FIX: API Key authentication for production
 PRODUCTION_API_KEY = os.getenv("PRODUCTION_API_KEY")
 REQUIRE_API_KEY = os.getenv("FLASK_ENV") == "production"
 
-# Simple in-memory rate limiting (use Redis in production)
-request_counts = defaultdict(list)
+# Rate-limit store: in-process by default; use RATE_LIMIT_BACKEND=sqlite|postgres
+# so every gunicorn worker enforces the same quota
+rate_limiter = create_rate_limit_store(MAX_REQUESTS_PER_IP, RATE_LIMIT_WINDOW)
+
+tracer = get_tracer("website-backend")
+
+# Metrics (per-thread accumulators; METRICS_DIR merges gunicorn workers on /metrics)
+START_CALL_RESULTS = Counter("start_call_requests_total", "Call requests by persona and outcome", ["persona", "outcome"])
+RATE_LIMIT_REJECTIONS = Counter("rate_limit_rejections_total", "Requests rejected by the per-IP rate limiter")
+DISPATCH_LATENCY = Histogram("dispatch_latency_seconds", "LiveKit room creation + agent dispatch latency", ["persona"])
+STATUS_OUTCOMES = {200: "ok", 400: "invalid", 401: "unauthorized", 429: "rate_limited", 500: "error"}
+start_snapshot_writer()
 
 app = Flask(__name__)
 # ✅ SECURITY FIX: Restrict CORS to allowed origins only
 CORS(app, origins=ALLOWED_ORIGINS, methods=['POST'], allow_headers=['Content-Type'])
 
+@app.before_request
+def start_request_span():
+    """Every request gets the website_request_id that links its call's spans end to end"""
+    g.website_request_id = str(uuid4())
+    g.request_span_id = new_span_id()
+    g.request_started = time.time()
+    g.log_context = set_log_context(website_request_id=g.website_request_id)
+
+@app.after_request
+def end_request_span(response):
+    if request.path == '/metrics':
+        return response
+    if request.path == '/api/start_call':
+        START_CALL_RESULTS.inc(persona=g.get("persona", "unknown"), outcome=STATUS_OUTCOMES.get(response.status_code, "error"))
+    tracer.record(
+        f"http {request.path}", g.website_request_id, g.request_started, time.time(),
+        span_id=g.request_span_id, **{"http.method": request.method, "http.status_code": response.status_code}
+    )
+    return response
+
+@app.teardown_request
+def clear_log_context(exc):
+    token = g.pop("log_context", None)
+    if token is not None:
+        reset_log_context(token)
+
 def validate_phone_number(phone: str) -> str:
     """Validate and sanitize Portuguese phone number"""
     if not phone:
         raise ValueError("Phone number is required")
+    if not isinstance(phone, str):
+        raise ValueError("Phone number must be a string")
     
     # Remove all non-digit characters except +
     clean_phone = re.sub(r'[^\d+]', '', phone)
@@ -74,15 +120,29 @@ def validate_phone_number(phone: str) -> str:
     return clean_phone
 
 def validate_persona(persona: str) -> str:
-    """Validate persona against whitelist"""
+    """
+    Validate persona: whitelisted built-ins, personas added by the registry file
+    and stored '<tenant_id>:<persona>' tenant personas
+    """
     if not persona:
         raise ValueError("Persona is required")
-    
-    if persona not in ALLOWED_PERSONAS:
-        raise ValueError(f"Invalid persona. Allowed: {', '.join(ALLOWED_PERSONAS)}")
+    if not isinstance(persona, str):
+        raise ValueError("Persona must be a string")
+
+    PERSONA_REGISTRY.start_watching()  # no-op after the first call in each worker process
+    allowed = persona in ALLOWED_PERSONAS or not PERSONA_REGISTRY.is_builtin(persona)
+    if not allowed or not PERSONA_REGISTRY.exists(persona):
+        extra = [key for key in PERSONA_REGISTRY.keys() if not PERSONA_REGISTRY.is_builtin(key)]
+        raise ValueError(
+            f"Invalid persona. Allowed: {', '.join(ALLOWED_PERSONAS + extra)} or a '<tenant_id>:<persona>' key"
+        )
     
     return persona
 
+def room_slug(persona: str) -> str:
+    """Persona key as it appears in LiveKit room names (tenant keys contain ':', file keys may contain spaces)"""
+    return re.sub(r'[^A-Za-z0-9_-]+', '-', persona).strip('-')[:48] or "persona"
+
 def validate_customer_name(name: str) -> str:
     """Validate and sanitize customer name"""
     if not name:
@@ -97,87 +157,271 @@ def validate_customer_name(name: str) -> str:
     return clean_name or "Website User"
 
 def check_rate_limit(ip_address: str) -> bool:
-    """Simple rate limiting check"""
-    now = datetime.now()
-    cutoff = now - timedelta(seconds=RATE_LIMIT_WINDOW)
-    
-    # Debug logging
-    log.info(f"🔍 Rate limit check for IP: {ip_address}")
-    log.info(f"🔍 Current requests for this IP: {len(request_counts[ip_address])}")
-    log.info(f"🔍 Max allowed requests: {MAX_REQUESTS_PER_IP}")
-    log.info(f"🔍 Time window: {RATE_LIMIT_WINDOW} seconds")
-    
-    # Clean old requests
-    old_count = len(request_counts[ip_address])
-    request_counts[ip_address] = [
-        req_time for req_time in request_counts[ip_address] 
-        if req_time > cutoff
-    ]
-    new_count = len(request_counts[ip_address])
-    
-    if old_count != new_count:
-        log.info(f"🔍 Cleaned {old_count - new_count} old requests")
-    
-    # Check if limit exceeded
-    if len(request_counts[ip_address]) >= MAX_REQUESTS_PER_IP:
-        log.warning(f"🚫 Rate limit exceeded for IP: {ip_address} ({len(request_counts[ip_address])}/{MAX_REQUESTS_PER_IP})")
+    """Sliding-window rate limiting check (constant time per request)"""
+    if not rate_limiter.hit(ip_address):
+        RATE_LIMIT_REJECTIONS.inc()
+        log.warning(f"🚫 Rate limit exceeded for IP: {ip_address} (max {MAX_REQUESTS_PER_IP}/{RATE_LIMIT_WINDOW}s)")
         return False
-    
-    # Add current request
-    request_counts[ip_address].append(now)
-    log.info(f"✅ Rate limit OK for IP: {ip_address} ({len(request_counts[ip_address])}/{MAX_REQUESTS_PER_IP})")
+
+    log.debug("✅ Rate limit OK for IP: %s", ip_address)
     return True
 
-def get_client_ip():
-    """Get client IP address safely"""
+def client_ip_from_headers(headers, remote_addr):
+    """Resolve the client IP from proxy headers, falling back to the socket address"""
     # Check for forwarded headers (from proxy/load balancer)
-    if request.headers.get('X-Forwarded-For'):
-        return request.headers.get('X-Forwarded-For').split(',')[0].strip()
-    elif request.headers.get('X-Real-IP'):
-        return request.headers.get('X-Real-IP')
+    if headers.get('X-Forwarded-For'):
+        return headers.get('X-Forwarded-For').split(',')[0].strip()
+    elif headers.get('X-Real-IP'):
+        return headers.get('X-Real-IP')
     else:
-        return request.remote_addr
+        return remote_addr
+
+def get_client_ip():
+    """Get client IP address safely"""
+    return client_ip_from_headers(request.headers, request.remote_addr)
+
+# ─────────────────────── Background event loop & pooled LiveKit clients ───────────────────────
+# One long-lived loop per process runs every LiveKit API call, so the aiohttp
+# session (and its keep-alive connections) can be shared by all requests.
+LIVEKIT_POOL_SIZE = int(os.getenv("LIVEKIT_POOL_SIZE", "100"))
+LIVEKIT_KEEPALIVE_TIMEOUT = int(os.getenv("LIVEKIT_KEEPALIVE_TIMEOUT", "60"))
+
+_loop = None
+_loop_thread = None
+_loop_lock = threading.Lock()
+
+_http_session = None
+_room_service = None
+_dispatch_service = None
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """Return the process-wide event loop, starting its thread on first use"""
+    global _loop, _loop_thread
+    if _loop is not None:
+        return _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="livekit-loop", daemon=True)
+            thread.start()
+            _loop_thread = thread
+            _loop = loop
+    return _loop
 
 def run_async(coro):
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    return loop.run_until_complete(coro)
+    """Run a coroutine on the background loop and block until it finishes"""
+    future = asyncio.run_coroutine_threadsafe(coro, get_background_loop())
+    return future.result()
+
+def livekit_api():
+    """Import the LiveKit API modules (cached by sys.modules after the first call)"""
+    import aiohttp
+    from livekit.api import room_service, agent_dispatch_service as ad_svc
+    from livekit.protocol import room as proto_room
+    return aiohttp, room_service, ad_svc, proto_room
+
+def preload_livekit_api():
+    """Import the LiveKit API modules in a daemon thread so the first call does not pay for them"""
+    threading.Thread(target=livekit_api, name="livekit-preload", daemon=True).start()
+
+async def get_livekit_clients():
+    """Return the shared (RoomService, AgentDispatchService) pair, creating them on first use"""
+    global _http_session, _room_service, _dispatch_service
+    if _http_session is None or _http_session.closed:
+        aiohttp, room_service, ad_svc, _ = livekit_api()
+        connector = aiohttp.TCPConnector(
+            limit=LIVEKIT_POOL_SIZE,
+            keepalive_timeout=LIVEKIT_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=300,
+        )
+        _http_session = aiohttp.ClientSession(connector=connector)
+        _room_service = room_service.RoomService(_http_session, LIVEKIT_URL, LIVEKIT_API_KEY, LIVEKIT_API_SECRET)
+        _dispatch_service = ad_svc.AgentDispatchService(
+            _http_session, LIVEKIT_URL, LIVEKIT_API_KEY, LIVEKIT_API_SECRET
+        )
+        log.info(f"🔌 LiveKit HTTP pool ready (limit={LIVEKIT_POOL_SIZE}, keepalive={LIVEKIT_KEEPALIVE_TIMEOUT}s)")
+    return _room_service, _dispatch_service
+
+async def close_livekit_clients():
+    """Close the shared LiveKit HTTP session"""
+    global _http_session, _room_service, _dispatch_service
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+    _room_service = None
+    _dispatch_service = None
+
+def shutdown_background_loop(timeout: float = 5.0):
+    """Close pooled clients and stop the background loop (registered with atexit)"""
+    global _loop, _loop_thread
+    with _loop_lock:
+        loop, thread = _loop, _loop_thread
+        _loop = None
+        _loop_thread = None
+    if loop is None:
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(close_livekit_clients(), loop).result(timeout)
+    except Exception as e:
+        log.warning(f"Error closing LiveKit clients: {e}")
+    loop.call_soon_threadsafe(loop.stop)
+    if thread is not None:
+        thread.join(timeout)
+    loop.close()
+
+atexit.register(shutdown_background_loop)
+
+def check_api_key(auth_header, required: bool = None):
+    """
+    Check the Authorization header when API key authentication is required.
+
+    Args:
+        auth_header: Raw Authorization header value
+        required: Force authentication on/off (defaults to REQUIRE_API_KEY)
+
+    Returns:
+        None if the request is authenticated, otherwise the error message for a 401 response
+    """
+    if required is None:
+        required = REQUIRE_API_KEY
+    if not required:
+        log.debug("API key authentication is NOT required")
+        return None
+
+    log.debug("API key authentication is REQUIRED")
+
+    if not auth_header or not auth_header.startswith('Bearer '):
+        log.warning("Missing or invalid Authorization header")
+        return "Authentication required"
+
+    provided_key = auth_header.replace('Bearer ', '')
+
+    if not PRODUCTION_API_KEY or provided_key != PRODUCTION_API_KEY:
+        log.warning("Invalid API key provided")
+        return "Invalid authentication"
+
+    log.debug("API key authentication PASSED")
+    return None
+
+def parse_call_request(data: dict):
+    """
+    Validate and sanitize a start_call request body.
+
+    Returns:
+        (phone_number, persona, customer_name, custom_agent_data)
+
+    Raises:
+        ValueError: if any field is invalid
+    """
+    phone_number = validate_phone_number(data.get('phone_number'))
+    persona = validate_persona(data.get('persona'))
+    customer_name = validate_customer_name(data.get('customer_name', ''))
+
+    # Handle custom persona
+    custom_agent_data = None
+    if persona == "custom":
+        # Get structured custom agent fields
+        agent_identity = data.get('custom_agent_identity', '').strip()
+        call_target = data.get('custom_call_target', '').strip()
+        reason = data.get('custom_reason', '').strip()
+        accent = data.get('custom_accent', 'padrão').strip()
+
+        # Validate required fields
+        if not agent_identity:
+            raise ValueError("Agent identity is required for custom persona")
+        if not call_target:
+            raise ValueError("Call target is required for custom persona")
+        if not reason:
+            raise ValueError("Reason is required for custom persona")
+
+        # Validate field lengths
+        if len(agent_identity) > 200:
+            raise ValueError("Agent identity too long (max 200 characters)")
+        if len(call_target) > 200:
+            raise ValueError("Call target too long (max 200 characters)")
+        if len(reason) > 500:
+            raise ValueError("Reason too long (max 500 characters)")
+
+        custom_agent_data = {
+            'agent_identity': agent_identity,
+            'call_target': call_target,
+            'reason': reason,
+            'accent': accent
+        }
+
+    return phone_number, persona, customer_name, custom_agent_data
+
+# Item fields that must be strings when present (custom_agent_data fields carry the custom_ prefix)
+BATCH_STRING_FIELDS = (
+    'phone_number', 'persona', 'customer_name',
+    'custom_agent_identity', 'custom_call_target', 'custom_reason', 'custom_accent',
+)
+
+def parse_batch_request(data):
+    """
+    Validate a whole start_calls batch in one pass.
+
+    Each item is `{phone_number, persona, customer_name, custom_agent_data}`, where
+    custom_agent_data holds agent_identity, call_target, reason and accent.
+
+    Returns:
+        (calls, errors): calls is a list of (index, phone_number, persona, customer_name,
+        custom_agent_data) for valid items, errors a list of {"index", "ok", "error"} results
+
+    Raises:
+        ValueError: if the batch itself is malformed
+    """
+    items = data.get('calls') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        raise ValueError("Request body must contain a non-empty 'calls' list")
+    if len(items) > MAX_BATCH_SIZE:
+        raise ValueError(f"Too many calls in batch (max {MAX_BATCH_SIZE})")
+
+    calls = []
+    errors = []
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError("Each call must be an object")
+            fields = dict(item)
+            custom = fields.pop('custom_agent_data', None) or {}
+            if not isinstance(custom, dict):
+                raise ValueError("custom_agent_data must be an object")
+            for key in ('agent_identity', 'call_target', 'reason', 'accent'):
+                if key in custom:
+                    fields[f'custom_{key}'] = custom[key]
+            for key in BATCH_STRING_FIELDS:
+                if fields.get(key) is not None and not isinstance(fields[key], str):
+                    raise ValueError(f"{key} must be a string")
+            calls.append((index, *parse_call_request(fields)))
+        except (ValueError, TypeError, AttributeError) as e:
+            START_CALL_RESULTS.inc(persona="unknown", outcome="invalid")
+            errors.append({"index": index, "ok": False, "error": str(e)})
+
+    return calls, errors
+
+RATE_LIMIT_RESPONSE = {
+    "error": "Rate limit exceeded",
+    "message": "Too many requests. Please try again later."
+}
+INTERNAL_ERROR_RESPONSE = {
+    "error": "Internal server error",
+    "message": "Please try again later"
+}
 
 @app.route('/api/start_call', methods=['POST'])
 def start_call():
     try:
         # ✅ SECURITY FIX: API Key authentication for production
-        log.info(f"DEBUG - start_call() called, REQUIRE_API_KEY = {REQUIRE_API_KEY}")
-        
-        if REQUIRE_API_KEY:
-            log.info("DEBUG - API key authentication is REQUIRED")
-            auth_header = request.headers.get('Authorization')
-            log.info(f"DEBUG - Authorization header: {auth_header[:20] + '...' if auth_header else 'None'}")
-            
-            if not auth_header or not auth_header.startswith('Bearer '):
-                log.warning("Missing or invalid Authorization header")
-                return jsonify({"error": "Authentication required"}), 401
-            
-            provided_key = auth_header.replace('Bearer ', '')
-            log.info(f"DEBUG - Provided key length: {len(provided_key) if provided_key else 0}")
-            log.info(f"DEBUG - Expected key length: {len(PRODUCTION_API_KEY) if PRODUCTION_API_KEY else 0}")
-            
-            if not PRODUCTION_API_KEY or provided_key != PRODUCTION_API_KEY:
-                log.warning("Invalid API key provided")
-                return jsonify({"error": "Invalid authentication"}), 401
-            
-            log.info("DEBUG - API key authentication PASSED")
-        else:
-            log.info("DEBUG - API key authentication is NOT required")
+        auth_error = check_api_key(request.headers.get('Authorization'))
+        if auth_error:
+            return jsonify({"error": auth_error}), 401
 
         # ✅ SECURITY: Rate limiting
         client_ip = get_client_ip()
         if not check_rate_limit(client_ip):
             log.warning(f"Rate limit exceeded for IP: {client_ip}")
-            return jsonify({
-                "error": "Rate limit exceeded", 
-                "message": "Too many requests. Please try again later."
-            }), 429
+            return jsonify(RATE_LIMIT_RESPONSE), 429
 
         # ✅ SECURITY: Validate request data exists
         if not request.is_json:
@@ -189,113 +433,167 @@ def start_call():
 
         # ✅ SECURITY: Input validation and sanitization
         try:
-            phone_number = validate_phone_number(data.get('phone_number'))
-            persona = validate_persona(data.get('persona'))
-            customer_name = validate_customer_name(data.get('customer_name', ''))
-            
-            # Handle custom persona
-            custom_agent_data = None
-            if persona == "custom":
-                # Get structured custom agent fields
-                agent_identity = data.get('custom_agent_identity', '').strip()
-                call_target = data.get('custom_call_target', '').strip()
-                reason = data.get('custom_reason', '').strip()
-                accent = data.get('custom_accent', 'padrão').strip()
-                
-                # Validate required fields
-                if not agent_identity:
-                    raise ValueError("Agent identity is required for custom persona")
-                if not call_target:
-                    raise ValueError("Call target is required for custom persona")
-                if not reason:
-                    raise ValueError("Reason is required for custom persona")
-                
-                # Validate field lengths
-                if len(agent_identity) > 200:
-                    raise ValueError("Agent identity too long (max 200 characters)")
-                if len(call_target) > 200:
-                    raise ValueError("Call target too long (max 200 characters)")
-                if len(reason) > 500:
-                    raise ValueError("Reason too long (max 500 characters)")
-                
-                custom_agent_data = {
-                    'agent_identity': agent_identity,
-                    'call_target': call_target,
-                    'reason': reason,
-                    'accent': accent
-                }
-            
+            phone_number, persona, customer_name, custom_agent_data = parse_call_request(data)
         except ValueError as e:
             log.warning(f"Invalid input from IP {client_ip}: {str(e)}")
             return jsonify({"error": str(e)}), 400
+        g.persona = persona
 
         # ✅ SECURITY: Log without sensitive data
         log.info(f"Valid call request from IP: {client_ip}, Persona: {persona}")
 
         # Run async function to handle LiveKit API calls
-        result = run_async(handle_livekit_call(persona, phone_number, customer_name, custom_agent_data))
+        result = run_async(handle_livekit_call(
+            persona, phone_number, customer_name, custom_agent_data,
+            website_request_id=g.website_request_id, parent_span_id=g.request_span_id
+        ))
         return jsonify(result), 200
         
     except Exception as e:
         log.error(f"Unexpected error: {str(e)}", exc_info=True)
-        return jsonify({
-            "error": "Internal server error", 
-            "message": "Please try again later"
-        }), 500
+        return jsonify(INTERNAL_ERROR_RESPONSE), 500
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint (same API key as the other routes)"""
+    auth_error = check_api_key(request.headers.get('Authorization'))
+    if auth_error:
+        return jsonify({"error": auth_error}), 401
+    return exposition(), 200, {"Content-Type": METRICS_CONTENT_TYPE}
+
+@app.route('/api/start_calls', methods=['POST'])
+def start_calls_endpoint():
+    """Bulk dispatch for campaign launches; always requires the API key and skips the per-IP demo quota"""
+    try:
+        auth_error = check_api_key(request.headers.get('Authorization'), required=True)
+        if auth_error:
+            return jsonify({"error": auth_error}), 401
+
+        if not request.is_json:
+            return jsonify({"error": "Content-Type must be application/json"}), 400
 
-async def handle_livekit_call(persona, phone_number, customer_name, custom_agent_data=None):
+        try:
+            results = start_calls(request.get_json())
+        except ValueError as e:
+            log.warning(f"Invalid batch from IP {get_client_ip()}: {str(e)}")
+            return jsonify({"error": str(e)}), 400
+
+        log.info(f"Batch from IP {get_client_ip()}: {sum(1 for r in results if r['ok'])}/{len(results)} calls dispatched")
+        return jsonify(batch_response(results)), 200
+
+    except Exception as e:
+        log.error(f"Unexpected error: {str(e)}", exc_info=True)
+        return jsonify(INTERNAL_ERROR_RESPONSE), 500
+
+async def handle_livekit_calls(calls, concurrency: int = None):
     """
-    Handles the async LiveKit API calls using proper session management.
+    Dispatch many validated calls over the pooled LiveKit clients with bounded concurrency.
+
+    Args:
+        calls: (index, phone_number, persona, customer_name, custom_agent_data) tuples
+        concurrency: Max room-create/dispatch pairs in flight (defaults to BATCH_CONCURRENCY)
+
+    Returns:
+        One result per call, in input order: {"index", "ok", "room_name", "job_id"} or {"index", "ok", "error"}
     """
-    async with aiohttp.ClientSession() as session:
-        # Create a RoomService instance directly
-        rs = room_service.RoomService(session, LIVEKIT_URL, LIVEKIT_API_KEY, LIVEKIT_API_SECRET)
-        
-        # Create a unique room for the call
-        room_name = f"call_{persona}_{uuid4().hex[:8]}"
-        create_room_request = proto_room.CreateRoomRequest(name=room_name)
-        
-        log.info(f"Creating room: {room_name}")
+    semaphore = asyncio.Semaphore(concurrency or BATCH_CONCURRENCY)
+
+    async def dispatch(index, phone_number, persona, customer_name, custom_agent_data):
+        async with semaphore:
+            try:
+                result = await handle_livekit_call(persona, phone_number, customer_name, custom_agent_data)
+            except Exception as e:
+                log.error(f"Batch item {index} failed: {type(e).__name__}: {e}")
+                START_CALL_RESULTS.inc(persona=persona, outcome="error")
+                return {"index": index, "ok": False, "error": "Dispatch failed"}
+        START_CALL_RESULTS.inc(persona=persona, outcome="ok")
+        return {"index": index, "ok": True, "room_name": result["room_name"], "job_id": result["job_id"]}
+
+    return list(await asyncio.gather(*(dispatch(*call) for call in calls)))
+
+def start_calls(items, concurrency: int = None):
+    """
+    Python API for batch dispatch: validate `items` and launch every valid call.
+
+    Returns:
+        One result per item, in input order (validation errors included)
+    """
+    calls, errors = parse_batch_request(items)
+    dispatched = run_async(handle_livekit_calls(calls, concurrency)) if calls else []
+    return sorted(dispatched + errors, key=lambda r: r["index"])
+
+def batch_response(results):
+    """Response body for /api/start_calls"""
+    dispatched = sum(1 for r in results if r["ok"])
+    return {
+        "message": f"{dispatched} of {len(results)} calls initiated.",
+        "dispatched": dispatched,
+        "failed": len(results) - dispatched,
+        "results": results
+    }
+
+async def handle_livekit_call(persona, phone_number, customer_name, custom_agent_data=None,
+                              website_request_id=None, parent_span_id=None):
+    """
+    Handles the async LiveKit API calls using the shared, pooled LiveKit clients.
+
+    `website_request_id` identifies the call end to end (trace id) and
+    `parent_span_id` is the HTTP request span the agent's spans hang off.
+    """
+    website_request_id = website_request_id or str(uuid4())
+    started = time.perf_counter()
+    rs, agent_client = await get_livekit_clients()
+    _, _, ad_svc, proto_room = livekit_api()
+
+    # Create a unique room for the call
+    room_name = f"call_{room_slug(persona)}_{uuid4().hex[:8]}"
+    create_room_request = proto_room.CreateRoomRequest(name=room_name)
+
+    log.info(f"Creating room: {room_name}")
+    with tracer.span("livekit.create_room", website_request_id, parent_span_id, room=room_name):
         livekit_room = await rs.create_room(create_room_request)
-        log.info(f"✅ LiveKit room created: {livekit_room.name}")
-
-        # Prepare metadata for the agent (without logging sensitive data)
-        job_metadata = {
-            "phone_number": phone_number,
-            "persona": persona,
-            "customer_name": customer_name,
-            "website_request_id": str(uuid4()),
-            "custom_agent_data": custom_agent_data
-        }
-        
-        metadata_str = json.dumps(job_metadata)
-        log.info(f"Dispatching job for persona: {persona}")
+    log.info(f"✅ LiveKit room created: {livekit_room.name}")
 
-        # Use the AgentDispatchService - a higher-level client that handles protobuf encoding
-        agent_client = ad_svc.AgentDispatchService(
-            session, LIVEKIT_URL, LIVEKIT_API_KEY, LIVEKIT_API_SECRET
-        )
+    # Prepare metadata for the agent (without logging sensitive data)
+    dispatch_span_id = new_span_id()
+    job_metadata = {
+        "phone_number": phone_number,
+        "persona": persona,
+        "customer_name": customer_name,
+        "website_request_id": website_request_id,
+        "trace_parent_id": parent_span_id or dispatch_span_id,
+        "custom_agent_data": custom_agent_data
+    }
+
+    log.info(f"Dispatching job for persona: {persona}")
+    with tracer.span("livekit.create_dispatch", website_request_id, parent_span_id, dispatch_span_id, persona=persona):
+        # Stamped as late as possible so the agent can measure job pickup
+        job_metadata["dispatched_at"] = time.time()
+        metadata_str = json.dumps(job_metadata)
 
         # Create a proper protobuf request object
-        dispatch_req = CreateAgentDispatchRequest(
+        dispatch_req = ad_svc.CreateAgentDispatchRequest(
             room=livekit_room.name,
             agent_name=AGENT_NAME,
             metadata=metadata_str
         )
-        
+
         # Call the service with the proper request object
         dispatched_job = await agent_client.create_dispatch(dispatch_req)
-        log.info(f"✅ Job dispatched: {dispatched_job.id} to agent '{AGENT_NAME}'")
+    DISPATCH_LATENCY.observe(time.perf_counter() - started, persona=persona)
+    log.info(f"✅ Job dispatched: {dispatched_job.id} to agent '{AGENT_NAME}'")
 
-        return {
-            "message": "Call initiated successfully.",
-            "room_name": livekit_room.name,
-            "job_id": dispatched_job.id
-        }
+    return {
+        "message": "Call initiated successfully.",
+        "room_name": livekit_room.name,
+        "job_id": dispatched_job.id
+    }
 
 if __name__ == '__main__':
     log.info("Starting Flask backend server for LiveKit call initiation.")
     log.info(f"🔧 Rate limiting config: {MAX_REQUESTS_PER_IP} requests per {RATE_LIMIT_WINDOW} seconds")
+    log.info(f"🔧 Rate limit store: {type(rate_limiter).__name__}")
     log.info(f"🔧 Production mode: {REQUIRE_API_KEY}")
     log.info(f"🔧 Allowed origins: {ALLOWED_ORIGINS}")
+    preload_livekit_api()
     app.run(host='0.0.0.0', port=5001, debug=False) 
\ No newline at end of file
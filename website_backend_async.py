@@ -0,0 +1,224 @@
+"""
+Async variant of the call-dispatch backend.
+
+Serves the same /api/start_call and /api/start_calls endpoints as
+website_backend.py (same validation, rate limiting and response shape) on an
+aiohttp server, awaiting handle_livekit_call directly on the server's event
+loop instead of blocking a worker thread for the whole LiveKit round-trip.
+
+Run with:
+    python website_backend_async.py
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from uuid import uuid4
+
+from aiohttp import web
+
+from config import PERSONA_REGISTRY
+from website_backend import (
+    ALLOWED_ORIGINS,
+    INTERNAL_ERROR_RESPONSE,
+    MAX_REQUESTS_PER_IP,
+    RATE_LIMIT_RESPONSE,
+    RATE_LIMIT_WINDOW,
+    REQUIRE_API_KEY,
+    START_CALL_RESULTS,
+    STATUS_OUTCOMES,
+    batch_response,
+    check_api_key,
+    check_rate_limit,
+    client_ip_from_headers,
+    close_livekit_clients,
+    handle_livekit_call,
+    handle_livekit_calls,
+    parse_batch_request,
+    parse_call_request,
+    preload_livekit_api,
+    rate_limiter,
+    tracer,
+)
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, exposition
+from structured_logging import configure_logging, reset_log_context, set_log_context
+from tracing import new_span_id
+
+log = logging.getLogger("website_backend_async")
+
+ASYNC_BACKEND_PORT = int(os.getenv("ASYNC_BACKEND_PORT", "5002"))
+
+def _cors_headers(request: web.Request) -> dict:
+    """Mirror the flask_cors configuration: allowed origins, POST only, Content-Type header"""
+    origin = request.headers.get("Origin")
+    if not origin or origin not in ALLOWED_ORIGINS:
+        return {}
+    return {
+        "Access-Control-Allow-Origin": origin,
+        "Access-Control-Allow-Methods": "POST",
+        "Access-Control-Allow-Headers": "Content-Type",
+        "Vary": "Origin",
+    }
+
+def _is_json(request: web.Request) -> bool:
+    """Same test as Flask's request.is_json: the mimetype, ignoring parameters such as charset"""
+    mimetype = request.headers.get("Content-Type", "").split(";", 1)[0].strip().lower()
+    return mimetype == "application/json" or (mimetype.startswith("application/") and mimetype.endswith("+json"))
+
+@web.middleware
+async def cors_middleware(request: web.Request, handler):
+    if request.method == "OPTIONS":
+        return web.Response(status=200, headers=_cors_headers(request))
+    response = await handler(request)
+    response.headers.update(_cors_headers(request))
+    return response
+
+@web.middleware
+async def tracing_middleware(request: web.Request, handler):
+    """Same request span and start_call outcome metric as the Flask backend"""
+    if request.path == '/metrics':
+        return await handler(request)
+    request["website_request_id"] = str(uuid4())
+    request["request_span_id"] = new_span_id()
+    started = time.time()
+    status = 500
+    log_context = set_log_context(website_request_id=request["website_request_id"])
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        if request.path == '/api/start_call':
+            START_CALL_RESULTS.inc(persona=request.get("persona", "unknown"), outcome=STATUS_OUTCOMES.get(status, "error"))
+        tracer.record(
+            f"http {request.path}", request["website_request_id"], started, time.time(),
+            span_id=request["request_span_id"], **{"http.method": request.method, "http.status_code": status}
+        )
+        reset_log_context(log_context)
+
+async def check_rate_limit_async(client_ip: str) -> bool:
+    """check_rate_limit, off the event loop when the store does database I/O"""
+    if rate_limiter.blocking:
+        return await asyncio.to_thread(check_rate_limit, client_ip)
+    return check_rate_limit(client_ip)
+
+def _needs_persona_lookup(items) -> bool:
+    return any(
+        isinstance(item, dict) and isinstance(item.get('persona'), str)
+        and PERSONA_REGISTRY.needs_store_lookup(item['persona'])
+        for item in items
+    )
+
+async def parse_call_request_async(data: dict):
+    """parse_call_request, off the event loop when a tenant persona has to be fetched from the store"""
+    if _needs_persona_lookup([data]):
+        return await asyncio.to_thread(parse_call_request, data)
+    return parse_call_request(data)
+
+async def parse_batch_request_async(data):
+    """parse_batch_request, off the event loop when any tenant persona has to be fetched from the store"""
+    items = data.get('calls') if isinstance(data, dict) else data
+    if isinstance(items, list) and _needs_persona_lookup(items):
+        return await asyncio.to_thread(parse_batch_request, data)
+    return parse_batch_request(data)
+
+async def start_call(request: web.Request) -> web.Response:
+    try:
+        auth_error = check_api_key(request.headers.get('Authorization'))
+        if auth_error:
+            return web.json_response({"error": auth_error}, status=401)
+
+        # ✅ SECURITY: Rate limiting
+        client_ip = client_ip_from_headers(request.headers, request.remote)
+        if not await check_rate_limit_async(client_ip):
+            log.warning(f"Rate limit exceeded for IP: {client_ip}")
+            return web.json_response(RATE_LIMIT_RESPONSE, status=429)
+
+        # ✅ SECURITY: Validate request data exists
+        if not _is_json(request):
+            return web.json_response({"error": "Content-Type must be application/json"}, status=400)
+
+        try:
+            data = await request.json()
+        except json.JSONDecodeError:
+            data = None
+        if not data:
+            return web.json_response({"error": "Request body is required"}, status=400)
+
+        # ✅ SECURITY: Input validation and sanitization
+        try:
+            phone_number, persona, customer_name, custom_agent_data = await parse_call_request_async(data)
+        except ValueError as e:
+            log.warning(f"Invalid input from IP {client_ip}: {str(e)}")
+            return web.json_response({"error": str(e)}, status=400)
+        request["persona"] = persona
+
+        log.info(f"Valid call request from IP: {client_ip}, Persona: {persona}")
+
+        result = await handle_livekit_call(
+            persona, phone_number, customer_name, custom_agent_data,
+            website_request_id=request["website_request_id"], parent_span_id=request["request_span_id"]
+        )
+        return web.json_response(result, status=200)
+
+    except Exception as e:
+        log.error(f"Unexpected error: {str(e)}", exc_info=True)
+        return web.json_response(INTERNAL_ERROR_RESPONSE, status=500)
+
+async def start_calls(request: web.Request) -> web.Response:
+    """Bulk dispatch for campaign launches; always requires the API key and skips the per-IP demo quota"""
+    try:
+        auth_error = check_api_key(request.headers.get('Authorization'), required=True)
+        if auth_error:
+            return web.json_response({"error": auth_error}, status=401)
+
+        if not _is_json(request):
+            return web.json_response({"error": "Content-Type must be application/json"}, status=400)
+
+        client_ip = client_ip_from_headers(request.headers, request.remote)
+        try:
+            calls, errors = await parse_batch_request_async(await request.json())
+        except (ValueError, json.JSONDecodeError) as e:
+            log.warning(f"Invalid batch from IP {client_ip}: {str(e)}")
+            return web.json_response({"error": str(e)}, status=400)
+
+        dispatched = await handle_livekit_calls(calls) if calls else []
+        results = sorted(dispatched + errors, key=lambda r: r["index"])
+        log.info(f"Batch from IP {client_ip}: {sum(1 for r in results if r['ok'])}/{len(results)} calls dispatched")
+        return web.json_response(batch_response(results), status=200)
+
+    except Exception as e:
+        log.error(f"Unexpected error: {str(e)}", exc_info=True)
+        return web.json_response(INTERNAL_ERROR_RESPONSE, status=500)
+
+async def metrics_endpoint(request: web.Request) -> web.Response:
+    """Prometheus scrape endpoint (same API key as the other routes)"""
+    auth_error = check_api_key(request.headers.get('Authorization'))
+    if auth_error:
+        return web.json_response({"error": auth_error}, status=401)
+    return web.Response(body=exposition().encode(), headers={"Content-Type": METRICS_CONTENT_TYPE})
+
+async def _on_cleanup(app: web.Application):
+    await close_livekit_clients()
+
+def create_app() -> web.Application:
+    app = web.Application(middlewares=[tracing_middleware, cors_middleware])
+    app.router.add_post('/api/start_call', start_call)
+    app.router.add_post('/api/start_calls', start_calls)
+    app.router.add_get('/metrics', metrics_endpoint)
+    app.on_cleanup.append(_on_cleanup)
+    return app
+
+if __name__ == '__main__':
+    configure_logging("website-backend-async")
+    log.info("Starting async backend server for LiveKit call initiation.")
+    log.info(f"🔧 Rate limiting config: {MAX_REQUESTS_PER_IP} requests per {RATE_LIMIT_WINDOW} seconds")
+    log.info(f"🔧 Production mode: {REQUIRE_API_KEY}")
+    log.info(f"🔧 Allowed origins: {ALLOWED_ORIGINS}")
+    preload_livekit_api()
+    web.run_app(create_app(), host='0.0.0.0', port=ASYNC_BACKEND_PORT)
@@ -0,0 +1,129 @@
+"""
+Load reporting and admission control for the outbound agent worker.
+
+LiveKit routes each dispatch to an available worker and marks a worker as
+unavailable once the value its `load_fnc` reports reaches `load_threshold`.
+The default load is CPU only, so a worker with spare CPU keeps taking calls
+however many realtime sessions and SIP legs it already holds.
+
+WorkerLoad reports the highest of:
+
+- cpu:    system CPU, averaged over the last AGENT_LOAD_CPU_SAMPLES reports
+- memory: system memory in use
+- calls:  running plus just-accepted jobs against AGENT_MAX_CONCURRENT_CALLS,
+          scaled so a full worker reports exactly load_threshold
+
+and its `request` (WorkerOptions.request_fnc) rejects jobs that still arrive
+while the worker is full, since LiveKit only sees the load on the next status
+update.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, Optional
+
+from metrics import Counter, Gauge
+
+if TYPE_CHECKING:
+    from livekit.agents import JobRequest
+
+log = logging.getLogger("worker_load")
+
+AGENT_MAX_CONCURRENT_CALLS = int(os.getenv("AGENT_MAX_CONCURRENT_CALLS", "20"))  # 0 = no call cap
+AGENT_LOAD_THRESHOLD = float(os.getenv("AGENT_LOAD_THRESHOLD", "0.75"))  # LiveKit stops routing at this load
+AGENT_LOAD_CPU_SAMPLES = int(os.getenv("AGENT_LOAD_CPU_SAMPLES", "5"))
+ACCEPT_GRACE_SECONDS = 10.0  # an accepted job not yet running still holds its slot this long
+
+WORKER_LOAD = Gauge("agent_worker_load", "Load reported to LiveKit, by component", ["component"])
+WORKER_CALLS = Gauge("agent_worker_calls", "Running plus just-accepted jobs on this worker")
+JOBS_REJECTED = Counter("agent_jobs_rejected_total", "Jobs refused by admission control", ["reason"])
+
+def _cpu_percent() -> float:
+    import psutil  # livekit-agents dependency
+
+    return psutil.cpu_percent(interval=None)
+
+def _memory_percent() -> float:
+    import psutil
+
+    return psutil.virtual_memory().percent
+
+class WorkerLoad:
+    """Per-worker capacity as seen by LiveKit (load_fnc) and by the job admission check (request_fnc)"""
+
+    def __init__(
+        self,
+        max_calls: int = AGENT_MAX_CONCURRENT_CALLS,
+        threshold: float = AGENT_LOAD_THRESHOLD,
+        cpu_samples: int = AGENT_LOAD_CPU_SAMPLES,
+        cpu_percent: Callable[[], float] = _cpu_percent,
+        memory_percent: Callable[[], float] = _memory_percent,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_calls = max_calls
+        self.threshold = threshold
+        self._cpu_percent = cpu_percent
+        self._memory_percent = memory_percent
+        self._clock = clock
+        self._cpu: Deque[float] = deque(maxlen=max(1, cpu_samples))
+        self._accepted: Dict[str, float] = {}  # job id -> accept time, until the job shows up as running
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def calls(self) -> int:
+        """Running jobs plus jobs accepted within the grace period"""
+        with self._lock:
+            self._prune_accepted()
+            return self._running + len(self._accepted)
+
+    def _prune_accepted(self):
+        cutoff = self._clock() - ACCEPT_GRACE_SECONDS
+        for job_id in [job_id for job_id, at in self._accepted.items() if at < cutoff]:
+            del self._accepted[job_id]
+
+    def update_running(self, job_ids):
+        """Record the jobs the worker is running (each one is a call with its own realtime session)"""
+        job_ids = set(job_ids)
+        with self._lock:
+            self._running = len(job_ids)
+            for job_id in job_ids & self._accepted.keys():
+                del self._accepted[job_id]
+
+    def load(self, worker: Any = None) -> float:
+        """WorkerOptions.load_fnc: the highest of the CPU, memory and call-slot loads (0..1)"""
+        if worker is not None:
+            self.update_running(running.job.id for running in worker.active_jobs)
+        self._cpu.append(self._cpu_percent() / 100)
+        cpu = sum(self._cpu) / len(self._cpu)
+        memory = self._memory_percent() / 100
+        calls = self.calls()
+        slots = self.threshold * calls / self.max_calls if self.max_calls > 0 else 0.0
+        WORKER_LOAD.set(cpu, component="cpu")
+        WORKER_LOAD.set(memory, component="memory")
+        WORKER_LOAD.set(slots, component="calls")
+        WORKER_CALLS.set(calls)
+        return min(1.0, max(cpu, memory, slots))
+
+    def admit(self, job_id: str) -> Optional[str]:
+        """Reserve a call slot for `job_id`; returns the rejection reason when the worker is full"""
+        with self._lock:
+            self._prune_accepted()
+            if self.max_calls > 0 and self._running + len(self._accepted) >= self.max_calls:
+                return "max_calls"
+            self._accepted[job_id] = self._clock()
+        return None
+
+    async def request(self, req: "JobRequest"):
+        """WorkerOptions.request_fnc: accept the job unless this worker is already at its call cap"""
+        reason = self.admit(req.id)
+        if reason is None:
+            await req.accept()
+            return
+        JOBS_REJECTED.inc(reason=reason)
+        log.warning(f"🚦 Rejecting job {req.id}: worker at {self.max_calls} concurrent calls")
+        await req.reject()